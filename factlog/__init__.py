@@ -31,17 +31,64 @@ care about in which branch I opened the file."::
   factlog list --under BRANCH-A --under BRANCH-B --relative
 
 
+"I want to see files I use often, not only the ones I opened last"::
+
+  factlog list --sort frecency
+
+
+"What did I work on last week?"::
+
+  factlog list --since 2w --until 1w --limit 100
+
+``--since`` and ``--until`` take UTC time such as ``2013-01-23`` or
+time before now such as ``12h``.
+
+
 "I want to see last 50 notes I took with title"::
 
   factlog list --under MY-NOTE-DIRECTORY --relative --title --limit 50
 
 
+"I want to feed all files I have ever touched to another command"::
+
+  factlog list --limit 0 --null | xargs -0 du -ch
+
+
 "The files I touched are huge.  I want to search only the locations
 I touched."::
 
   factlog list -C 50 | grep 'def record'
 
 
+"I want to grep recently edited Python files, but only first 10
+matches"::
+
+  factlog grep --include-glob '*.py' --max-count 10 'def record'
+
+``factlog grep`` searches files in the order of ``factlog list``
+using multiple processes.  Use ``--around NUM`` to search only around
+the locations you touched.
+
+
+"Which of my recent notes mentioned sqlite?"::
+
+  factlog search --under MY-NOTE-DIRECTORY --title sqlite
+
+``factlog search`` keeps a full-text index of the files in the
+history.  The first run indexes all files; later runs (and
+``factlog serve``) index only the files changed since then.  Files
+matching better and accessed more recently come first.
+
+
+"My history is years long.  Keep only the daily counts of old
+activities"::
+
+  factlog gc --retention 180
+
+Old activities still count for ``factlog list`` and ``--sort
+frecency`` after ``factlog gc``.
+
+
 Editor plugin
 -------------
 
@@ -81,19 +128,54 @@ RPC interface
 
 Work in progress...
 
+Record server
+^^^^^^^^^^^^^
+
+Running ``factlog record`` for each activity starts a new Python
+process and commits to the database every time.  If you record many
+activities, start the record server::
+
+   factlog serve
+
+While the server is running, ``factlog record`` sends the activity
+to the server, which commits activities from all clients in groups.
+When the server is not running, ``factlog record`` writes to the
+database directly.
+
+Watching directories
+^^^^^^^^^^^^^^^^^^^^
+
+Programs without factlog integration can be covered on Linux by
+watching directories with inotify::
+
+   factlog watch ~/work ~/notes
+
+Files closed after writing are recorded as ``write`` activities.
+Repeated writes to a file within ``--debounce`` are recorded once,
+and VCS directories, caches and backup files are ignored (see
+``--exclude-glob`` and ``--no-default-exclude``).
+
 Python interface
 ^^^^^^^^^^^^^^^^
 
 Work in progress...
 
+For programs running an ``asyncio`` event loop (e.g., editor
+servers), ``factlog.asyncdb.AsyncDataBase`` runs database access in a
+separate thread so that it does not block the loop::
+
+   async with AsyncDataBase(ConfigStore().db_path) as db:
+       await db.record_file_log(path, 'write', program='myeditor')
+       async for info in db.search_file_log(limit=20):
+           print(info.path)
+
 
 More to come / ideas
 --------------------
 
-- Ranking based on many data points: how many times you
-  write to the file, how recent you visited the file, etc.
+- Ranking based on more data points (``--sort frecency`` combines
+  how many times and how recently you accessed the file).
 - Understand "project" (VCS repository).
-- Concurrent grep.
 - Extract URLs in the documents and use them as URL bookmark.
 
 
@@ -14,8 +14,9 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from .utils.strutils import remove_prefix, get_lines_at_point
-from .filetitle import write_path_and_title
+from .utils.strutils import remove_prefix
+from .utils.py3compat import integer_types
+from . import trace
 
 
 class AccessInfo(object):
@@ -24,14 +25,28 @@ class AccessInfo(object):
     Access information object.
     """
 
-    __slots__ = ['path', 'point', 'recorded', 'type', 'showpath']
+    __slots__ = ['path', 'point', '_recorded', 'type', 'showpath']
 
     def __init__(self, path, point, recorded, type):
         self.path = self.showpath = path
         self.point = point
-        self.recorded = recorded
+        self._recorded = recorded
         self.type = type
 
+    @property
+    def recorded(self):
+        """
+        Time of the access as :class:`datetime.datetime` in UTC.
+
+        The database gives microseconds since the epoch.  They are
+        converted when first used, since most rows are only listed.
+
+        """
+        if isinstance(self._recorded, integer_types):
+            from .utils.timeutils import from_microseconds
+            self._recorded = from_microseconds(self._recorded)
+        return self._recorded
+
     def _set_relative_path(self, absunder):
         """
         Set :attr:`showpath` and return the newly set value.
@@ -43,17 +58,30 @@ class AccessInfo(object):
         self.showpath = remove_prefix(absunder, self.path)
         return self.showpath
 
-    def _get_lines_at_point(self, pre_lines, post_lines):
-        with open(self.path) as f:
-            return get_lines_at_point(
-                f.read(), self.point, pre_lines, post_lines)
+    def _get_lines_at_point(self, pre_lines, post_lines, line_index=None):
+        from .utils.textfile import get_lines_at_point_in_file
+        with trace.span('lines', path=self.path) as span:
+            try:
+                lines = get_lines_at_point_in_file(
+                    self.path, self.point, pre_lines, post_lines,
+                    line_index=line_index)
+            except EnvironmentError:
+                lines = []
+            span.rows_out = len(lines)
+        return lines
 
     def write_paths_and_lines(self, file, pre_lines=0, post_lines=0,
-                              newline='\n', separator=':'):
+                              newline='\n', separator=':', line_index=None):
         """
         Write :attr:`showpath` and lines around :attr:`point` to `file`.
+
+        `line_index` is passed to
+        :func:`.utils.textfile.get_lines_at_point_in_file`.
+
         """
-        for (lineno, line) in self._get_lines_at_point(pre_lines, post_lines):
+        lines = self._get_lines_at_point(pre_lines, post_lines,
+                                         line_index=line_index)
+        for (lineno, line) in lines:
             file.write(self.showpath)
             file.write(separator)
             file.write(str(lineno))
@@ -66,5 +94,6 @@ class AccessInfo(object):
         """
         Call :func:`.filetitle.write_path_and_title`.
         """
+        from .filetitle import write_path_and_title
         write_path_and_title(file, self.path, self.showpath,
                              newline, separator, **kwds)
@@ -0,0 +1,227 @@
+"""
+:mod:`asyncio` interface to the factlog database.
+
+This module requires Python 3.5 or later.
+"""
+
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import weakref
+import asyncio
+import collections
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from .database import DataBase
+from .utils.timeutils import now
+
+# get_event_loop() in a coroutine may give a loop other than the one
+# running it (and is deprecated there); get_running_loop() is 3.7+.
+_get_running_loop = getattr(asyncio, 'get_running_loop',
+                            asyncio.get_event_loop)
+
+
+class AsyncDataBase(object):
+
+    """
+    Wrapper of :class:`factlog.database.DataBase` for :mod:`asyncio`.
+
+    All SQLite work runs in one dedicated thread, so that the event
+    loop is never blocked by the database.  Activities recorded while
+    the thread is busy are written together by one call of
+    :meth:`factlog.database.DataBase.record_file_logs`.  Searches
+    fetch rows from the thread in chunks; concurrent searches and
+    records are interleaved chunk by chunk.
+
+    Use it as an asynchronous context manager or call :meth:`close`::
+
+      async with AsyncDataBase(dbpath) as db:
+          await db.record_file_log('README.rst', 'write')
+          async for info in db.search_file_log(10):
+              print(info.path)
+
+    """
+
+    search_chunk_size = 64
+
+    def __init__(self, dbpath, dbclass=DataBase):
+        self.dbpath = dbpath
+        self._dbclass = dbclass
+        self._db = None
+        self._executor = ThreadPoolExecutor(1)
+        self._pending = []
+        self._flushing = None
+
+    def _call(self, func, *args):
+        """
+        Call ``func(db, *args)`` in the database thread.
+        """
+        def call():
+            if self._db is None:
+                self._db = self._dbclass(self.dbpath)
+            return func(self._db, *args)
+        return _get_running_loop().run_in_executor(self._executor, call)
+
+    async def record_file_log(self, file_path, access_type, file_point=None,
+                              file_exists=None, program=None, recorded=None):
+        """
+        Record file activity.
+
+        Arguments are the same as :meth:`DataBase.record_file_log
+        <factlog.database.DataBase.record_file_log>`.  It returns after
+        the activity is committed.
+
+        """
+        if access_type not in DataBase.access_type_to_int:
+            raise ValueError('unknown access type: {0}'.format(access_type))
+        if recorded is None:
+            # Not the time when the batch is written.
+            recorded = now()
+        log = dict(file_path=os.path.abspath(file_path),
+                   access_type=access_type, file_point=file_point,
+                   file_exists=file_exists, program=program,
+                   recorded=recorded)
+        future = _get_running_loop().create_future()
+        self._pending.append((log, future))
+        if self._flushing is None:
+            self._flushing = asyncio.ensure_future(self._flush())
+        await future
+
+    async def _flush(self):
+        batch = []
+        try:
+            while self._pending:
+                (batch, self._pending) = (self._pending, [])
+                logs = [log for (log, _) in batch]
+                try:
+                    await self._call(DataBase.record_file_logs, logs)
+                except Exception as err:
+                    for (_, future) in batch:
+                        if not future.done():
+                            future.set_exception(err)
+                else:
+                    for (_, future) in batch:
+                        if not future.done():
+                            future.set_result(None)
+        finally:
+            # If this task is cancelled, records waiting for it would
+            # never be resolved.
+            (pending, self._pending) = (batch + self._pending, [])
+            for (_, future) in pending:
+                if not future.done():
+                    future.cancel()
+            self._flushing = None
+
+    def search_file_log(self, limit, **kwds):
+        """
+        Return an asynchronous iterator of :class:`AccessInfo`.
+
+        Arguments are the same as :meth:`DataBase.search_file_log
+        <factlog.database.DataBase.search_file_log>`.
+
+        """
+        return AsyncSearch(self, dict(kwds, limit=limit),
+                           self.search_chunk_size)
+
+    async def rebuild_latest_access(self):
+        await self._call(DataBase.rebuild_latest_access)
+
+    async def close(self):
+        """
+        Wait for pending records and stop the database thread.
+        """
+        if self._flushing is not None:
+            await self._flushing
+        if self._db is not None:
+            await self._call(DataBase.close)
+        self._executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        await self.close()
+
+
+class AsyncSearch(object):
+
+    """
+    Asynchronous iterator returned by :meth:`AsyncDataBase.search_file_log`.
+
+    Rows are fetched from the generator of
+    :meth:`DataBase.search_file_log` in the database thread, at most
+    `chunk_size` rows at once.  The generator is released in the
+    database thread when the iteration ends, when :meth:`aclose` is
+    called, or when this iterator is garbage collected.
+
+    """
+
+    def __init__(self, adb, kwds, chunk_size):
+        self._adb = adb
+        self._kwds = kwds
+        self._chunk_size = chunk_size
+        # The generator is kept in a list shared with the finalizer,
+        # since it must not be finalized in the event loop thread.
+        self._iterator = []
+        self._finalizer = weakref.finalize(
+            self, _release, adb._executor, self._iterator)
+        self._buffer = collections.deque()
+        self._exhausted = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._buffer and not self._exhausted:
+            await self._fetch()
+        if not self._buffer:
+            raise StopAsyncIteration
+        return self._buffer.popleft()
+
+    async def _fetch(self):
+        def fetch(db):
+            if not self._iterator:
+                self._iterator.append(db.search_file_log(**self._kwds))
+            rows = list(islice(self._iterator[0], self._chunk_size))
+            if len(rows) < self._chunk_size:
+                self._exhausted = True
+                del self._iterator[:]
+            return rows
+        rows = await self._adb._call(fetch)
+        self._buffer.extend(rows)
+
+    async def aclose(self):
+        self._buffer.clear()
+        if not self._exhausted:
+            self._exhausted = True
+            await self._adb._call(lambda _: self._iterator.clear())
+
+
+def _release(executor, iterator):
+    """
+    Drop the generator in `iterator` in the thread of `executor`.
+
+    The generator closes its cursor on the connection of that thread;
+    an open cursor keeps a read snapshot which blocks checkpoints.
+
+    """
+    try:
+        executor.submit(iterator.clear)
+    except RuntimeError:
+        # Database is already closed.
+        iterator.clear()
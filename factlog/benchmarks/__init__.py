@@ -0,0 +1,6 @@
+"""
+Benchmarks for factlog.
+
+Each module is runnable by ``python -m factlog.benchmarks.MODULE`` and
+writes results as JSON lines.
+"""
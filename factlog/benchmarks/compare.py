@@ -0,0 +1,98 @@
+"""
+Compare results of benchmarks, e.g., written by two commits.
+
+Example::
+
+  python -m factlog.benchmarks.compare old.jsonl new.jsonl
+
+Results of the same case are matched by all fields except ``seconds``.
+Ratio is new time divided by old time, so smaller is better.
+
+"""
+
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import sys
+import json
+
+
+def case_key(result):
+    """
+    Return a hashable key identifying the case of `result`.
+
+    >>> case_key(dict(benchmark='list', filter='none', seconds=0.1))
+    (('benchmark', 'list'), ('filter', 'none'))
+
+    """
+    return tuple(sorted((k, v) for (k, v) in result.items()
+                        if k != 'seconds'))
+
+
+def load_results(file):
+    """
+    Return a dict from :func:`case_key` to seconds.
+    """
+    results = {}
+    for line in file:
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        if result.get('benchmark') == 'meta':
+            continue
+        results[case_key(result)] = result['seconds']
+    return results
+
+
+def compare(old, new):
+    """
+    Yield ``(key, old_seconds, new_seconds, ratio)`` of common cases.
+
+    >>> list(compare({('a',): 2.0, ('b',): 1.0}, {('a',): 1.0}))
+    [(('a',), 2.0, 1.0, 0.5)]
+
+    """
+    for key in sorted(set(old) & set(new)):
+        ratio = new[key] / old[key] if old[key] else float('inf')
+        yield (key, old[key], new[key], ratio)
+
+
+def format_key(key):
+    return ' '.join('{0}={1}'.format(k, v) for (k, v) in key)
+
+
+def main(args=None):
+    import argparse
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=__doc__)
+    parser.add_argument('old', type=argparse.FileType('r'))
+    parser.add_argument('new', type=argparse.FileType('r'))
+    parser.add_argument(
+        '--threshold', type=float, default=0,
+        help='show only cases whose ratio differs from 1 more than this.')
+    ns = parser.parse_args(args)
+    old = load_results(ns.old)
+    new = load_results(ns.new)
+    for (key, old_seconds, new_seconds, ratio) in compare(old, new):
+        if abs(ratio - 1) < ns.threshold:
+            continue
+        sys.stdout.write('{0:8.4f} {1:8.4f} {2:6.2f}  {3}\n'.format(
+            old_seconds, new_seconds, ratio, format_key(key)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Measure title extraction of each supported file format.
+
+Example::
+
+  python -m factlog.benchmarks.filetitle_scan --repeat 20
+
+"""
+
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import io
+import sys
+import json
+
+from .. import filetitle
+from .list_latency import measure
+
+PARAGRAPH = 'Lorem ipsum dolor sit amet, consectetur adipiscing elit.\n' * 5
+
+headings = dict(
+    rst='Title\n=====\n',
+    md='# Title\n',
+    org='* Title\n',
+    py='"""\nTitle\n"""\n',
+)
+
+bodies = dict(
+    rst=PARAGRAPH + '\n',
+    md=PARAGRAPH + '\n',
+    org=PARAGRAPH + '\n',
+    py='def f(x):\n    return x + 1\n\n',
+)
+
+
+def gene_documents(ext, num_paragraphs):
+    """
+    Yield ``(case, content)`` of documents in format `ext`.
+    """
+    body = bodies[ext] * num_paragraphs
+    yield ('heading-first', headings[ext] + body)
+    if ext != 'py':
+        yield ('heading-last', body + headings[ext])
+    yield ('no-heading', body)
+
+
+def run(num_paragraphs, repeat, output):
+    for ext in sorted(headings):
+        get_title = filetitle.dispatcher[ext]
+        for (case, content) in gene_documents(ext, num_paragraphs):
+            func = lambda: get_title(io.StringIO(content))
+            result = dict(benchmark='filetitle_scan', format=ext, case=case,
+                          chars=len(content), seconds=measure(func, repeat))
+            output.write(json.dumps(result, sort_keys=True) + '\n')
+
+
+def main(args=None):
+    import argparse
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=__doc__)
+    parser.add_argument('--num-paragraphs', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=10)
+    ns = parser.parse_args(args)
+    run(ns.num_paragraphs, ns.repeat, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""
+Deterministic synthetic access history and document corpus.
+
+Popularity of files follows Zipf's law: the file of rank ``k`` (1-origin)
+is accessed with probability proportional to ``1 / k ** s``.  Events
+are recorded one per `interval` seconds on average and the same
+`seed` always gives the same history, so that databases built by
+different commits can be compared.
+
+Example::
+
+  python -m factlog.benchmarks.history --events 1000000 \\
+      --corpus /tmp/corpus /tmp/db.sqlite
+
+"""
+
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import io
+import os
+import bisect
+import random
+import datetime
+
+from ..utils.timeutils import to_microseconds, from_microseconds
+
+PROGRAMS = ('emacs', 'vim', 'less')
+PROGRAM_WEIGHTS = (0.6, 0.3, 0.1)
+ACCESS_TYPE_WEIGHTS = (0.5, 0.3, 0.2)   # write, open, close
+EXTENSIONS = ('rst', 'md', 'org', 'py', 'txt')
+EPOCH = to_microseconds(datetime.datetime(2013, 1, 1))
+
+WORDS = (
+    'lorem ipsum dolor sit amet consectetur adipiscing elit sed do '
+    'eiusmod tempor incididunt ut labore et dolore magna aliqua'
+).split()
+
+
+def cumulative(weights):
+    """
+    Return normalized cumulative sums of `weights`.
+
+    >>> cumulative([1, 1, 2])
+    [0.25, 0.5, 1.0]
+
+    """
+    total = float(sum(weights))
+    acc = 0
+    sums = []
+    for w in weights:
+        acc += w
+        sums.append(acc / total)
+    sums[-1] = 1.0
+    return sums
+
+
+def choose(rand, cum):
+    """Return index drawn from normalized cumulative weights `cum`."""
+    return bisect.bisect_right(cum, rand.random())
+
+
+def below(rand, num):
+    """
+    Return random integer in ``[0, num)``.
+
+    Unlike :meth:`random.Random.randrange`, it gives the same numbers
+    on Python 2 and 3.
+    """
+    return int(rand.random() * num)
+
+
+class History(object):
+
+    """
+    Generator of synthetic activities.
+
+    >>> history = History(num_files=100, root='/root')
+    >>> history.path(0)
+    '/root/project0/doc/file0.rst'
+    >>> logs = list(history.gene_params(0, 1000))
+    >>> logs == list(History(num_files=100, root='/root').gene_params(0, 1000))
+    True
+    >>> print(from_microseconds(logs[0][-1]))
+    2013-01-01 00:00:45.477264
+    >>> ranks = [int(l[0].rsplit('file', 1)[1].split('.')[0]) for l in logs]
+    >>> ranks.count(0) > ranks.count(10) > ranks.count(90)
+    True
+
+    """
+
+    subdirs = ('doc', 'src', 'notes', 'test')
+
+    def __init__(self, num_files=10000, exponent=1.0, interval=60,
+                 root='/home/user', seed=0):
+        self.num_files = num_files
+        self.interval = interval
+        self.root = root
+        self.seed = seed
+        self.popularity = cumulative(
+            [1.0 / k ** exponent for k in range(1, num_files + 1)])
+        self.programs = cumulative(PROGRAM_WEIGHTS)
+        self.access_types = cumulative(ACCESS_TYPE_WEIGHTS)
+
+    def path(self, rank):
+        """Return the path of the file of 0-origin popularity `rank`."""
+        return os.path.join(
+            self.root,
+            'project{0}'.format(rank % 50),
+            self.subdirs[rank // 50 % len(self.subdirs)],
+            'file{0}.{1}'.format(rank, EXTENSIONS[rank % len(EXTENSIONS)]))
+
+    def gene_params(self, start, stop):
+        """
+        Yield SQL parameters of the events in ``[start, stop)``.
+
+        Each event depends only on its index, so that the history can
+        be generated in chunks.  Parameters are the ones taken by
+        :meth:`factlog.database.DataBase._record_file_log_params`.
+
+        """
+        rand = random.Random(self.seed * 1000003 + start)
+        for i in range(start, stop):
+            rank = choose(rand, self.popularity)
+            recorded = EPOCH + int(
+                (i + rand.random()) * self.interval * 10 ** 6)
+            yield [self.path(rank), below(rand, 10000), True,
+                   choose(rand, self.access_types),
+                   PROGRAMS[choose(rand, self.programs)], recorded]
+
+    def grow(self, db, start, stop, chunk_size=100000):
+        """Record events in ``[start, stop)`` to `db`."""
+        for begin in range(start, stop, chunk_size):
+            end = min(begin + chunk_size, stop)
+            db._record_file_log_params(list(self.gene_params(begin, end)))
+
+    def write_corpus(self, num_files, paragraphs=(1, 200),
+                     large_every=100, large_paragraphs=20000):
+        """
+        Write documents for the `num_files` most popular paths.
+
+        The number of paragraphs of each document is drawn uniformly
+        from `paragraphs`, except that one in `large_every` documents
+        has `large_paragraphs` paragraphs (a few MB), so that both
+        small files and files large enough for line indices exist.
+        Existing files are kept.
+
+        """
+        for rank in range(min(num_files, self.num_files)):
+            path = self.path(rank)
+            if os.path.exists(path):
+                continue
+            rand = random.Random(self.seed * 1000003 + rank)
+            dirpath = os.path.dirname(path)
+            if not os.path.isdir(dirpath):
+                os.makedirs(dirpath)
+            ext = path.rsplit('.', 1)[1]
+            with io.open(path, 'w', encoding='utf-8') as file:
+                (low, high) = paragraphs
+                if rank % large_every == large_every - 1:
+                    (low, high) = (large_paragraphs, large_paragraphs)
+                file.write(gene_document(
+                    rand, ext, low + below(rand, high - low + 1)))
+
+
+def gene_sentence(rand, num_words):
+    words = [WORDS[below(rand, len(WORDS))] for _ in range(num_words)]
+    return u' '.join(words).capitalize() + u'.'
+
+
+def gene_document(rand, ext, num_paragraphs):
+    """
+    Return a document in format `ext` with a title and paragraphs.
+
+    >>> print(gene_document(random.Random(0), 'md', 1).splitlines()[0])
+    # Dolore labore elit amet do elit.
+
+    """
+    title = gene_sentence(rand, 6)
+    heading = dict(
+        rst=u'{0}\n{1}\n\n'.format(title, u'=' * len(title)),
+        md=u'# {0}\n\n'.format(title),
+        org=u'* {0}\n\n'.format(title),
+        py=u'"""\n{0}\n"""\n\n'.format(title),
+    ).get(ext, u'')
+    lines = []
+    for _ in range(num_paragraphs):
+        if ext == 'py':
+            lines.append(u'def f{0}(x):\n    return x + {0}\n\n'.format(
+                below(rand, 1000)))
+        else:
+            lines.extend(gene_sentence(rand, 8) + u'\n'
+                         for _ in range(1 + below(rand, 6)))
+            lines.append(u'\n')
+    return heading + u''.join(lines)
+
+
+def main(args=None):
+    import argparse
+    from ..database import DataBase
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=__doc__)
+    parser.add_argument('dbpath')
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--num-files', type=int, default=10000)
+    parser.add_argument('--exponent', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--corpus', metavar='DIR',
+        help="""
+        Root directory of paths.  Documents of the --corpus-files
+        most popular paths are written under it.
+        """)
+    parser.add_argument('--corpus-files', type=int, default=1000)
+    ns = parser.parse_args(args)
+    history = History(ns.num_files, ns.exponent, seed=ns.seed,
+                      **(dict(root=ns.corpus) if ns.corpus else {}))
+    if ns.corpus:
+        history.write_corpus(ns.corpus_files)
+    history.grow(DataBase(ns.dbpath), 0, ns.events)
+
+
+if __name__ == '__main__':
+    main()
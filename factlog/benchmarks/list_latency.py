@@ -0,0 +1,103 @@
+"""
+Measure latency of listing files as the history grows.
+
+Example::
+
+  python -m factlog.benchmarks.list_latency --sizes 10000 100000 1000000
+
+The time to record the history is also reported as ``record`` lines,
+since ``latest_access`` (including frecency score) is updated for
+every chunk of recorded activities.  To check that ranking by frecency does not
+depend on the length of the history::
+
+  python -m factlog.benchmarks.list_latency --sizes 1000000 10000000
+
+"""
+
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import sys
+import json
+import time
+
+from ..database import DataBase
+from .history import History
+
+cases = [
+    ('unique', dict()),
+    ('no-unique', dict(unique=False)),
+    ('access-type', dict(access_types=['write'], unique=False)),
+    ('program', dict(program=['vim'], unique=False)),
+    ('frecency', dict(sort='frecency')),
+    ('frecency-program', dict(sort='frecency', program=['vim'])),
+]
+
+
+def measure(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return sorted(times)[len(times) // 2]
+
+
+def run(dbpath, sizes, num_files, limit, repeat, output):
+    db = DataBase(dbpath)
+    history = History(num_files)
+    current = 0
+    for size in sorted(sizes):
+        start = time.time()
+        history.grow(db, current, size)
+        result = dict(benchmark='record', rows=size, inserted=size - current,
+                      seconds=time.time() - start)
+        output.write(json.dumps(result, sort_keys=True) + '\n')
+        current = size
+        for (name, kwds) in cases:
+            func = lambda: list(db.search_file_log(
+                limit, only_existing=False, **kwds))
+            result = dict(benchmark='list_latency', case=name, rows=size,
+                          limit=limit, seconds=measure(func, repeat))
+            output.write(json.dumps(result, sort_keys=True) + '\n')
+            output.flush()
+
+
+def main(args=None):
+    import argparse
+    import tempfile
+    import shutil
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=__doc__)
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+        help='number of rows in access_log to measure at.')
+    parser.add_argument('--num-files', type=int, default=10000)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    ns = parser.parse_args(args)
+    tmpdir = tempfile.mkdtemp(prefix='factlog-bench-')
+    try:
+        run(os.path.join(tmpdir, 'db.sqlite'), ns.sizes, ns.num_files,
+            ns.limit, ns.repeat, sys.stdout)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
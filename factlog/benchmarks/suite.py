@@ -0,0 +1,294 @@
+"""
+Run all benchmarks on a synthetic history and corpus.
+
+Example::
+
+  python -m factlog.benchmarks.suite --events 1000000 > new.jsonl
+  python -m factlog.benchmarks.compare old.jsonl new.jsonl
+
+The database and the documents are generated by
+:mod:`factlog.benchmarks.history`.  Results are written as JSON lines:
+the first line (``"benchmark": "meta"``) describes the environment and
+the others have ``seconds`` and the fields identifying the case.
+
+Measured are
+
+record
+  ``record``: one activity per transaction (the usual `factlog record`),
+  ``record-batch``: :meth:`DataBase.record_file_logs` (`--stdin`) and
+  ``grow``: generating the history.
+
+list
+  each filter of `factlog list` alone and all of them together, with
+  and without --no-unique and --sort frecency.
+
+render
+  --title and -C of `factlog list`, with and without cache.
+
+startup
+  the command `factlog record` and `factlog list` as a new process.
+
+"""
+
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import platform
+import subprocess
+
+from ..database import DataBase
+from .history import History, below
+from .list_latency import measure
+
+
+def get_filters(root):
+    under = os.path.join(root, 'project1')
+    return [
+        ('none', dict()),
+        ('access-type', dict(access_types=['write'])),
+        ('program', dict(program=['vim'])),
+        ('include-glob', dict(include_glob=['*.rst'])),
+        ('exclude-glob', dict(exclude_glob=['*.py', '*.txt'])),
+        ('under', dict(under=[under])),
+        ('under-relative', dict(under=[under], relative=True)),
+        ('file-exists', dict(only_existing=True)),
+        ('all', dict(access_types=['write'], program=['vim'],
+                     include_glob=['*.rst'], under=[root],
+                     only_existing=True)),
+    ]
+
+
+def gene_list_cases(root):
+    """
+    Yield ``(case, kwds)`` for :meth:`DataBase.search_file_log`.
+    """
+    for (name, kwds) in get_filters(root):
+        kwds = dict(dict(only_existing=False), **kwds)
+        yield (dict(filter=name, unique=True, sort='recency'), kwds)
+        yield (dict(filter=name, unique=False, sort='recency'),
+               dict(kwds, unique=False))
+        yield (dict(filter=name, unique=True, sort='frecency'),
+               dict(kwds, sort='frecency'))
+
+
+class NullOutput(object):
+
+    def write(self, _):
+        pass
+
+    def writelines(self, lines):
+        for _ in lines:
+            pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def prepare(workdir, events, num_files, corpus_files, seed, output):
+    """
+    Generate database and corpus in `workdir` unless already done.
+
+    The database is placed where `factlog` finds it when
+    ``XDG_CONFIG_HOME`` is `workdir`.
+    """
+    params = dict(events=events, num_files=num_files,
+                  corpus_files=corpus_files, seed=seed)
+    dbpath = os.path.join(workdir, 'factlog', 'data', 'db.sqlite')
+    root = os.path.join(workdir, 'corpus')
+    history = History(num_files, root=root, seed=seed)
+    paramspath = os.path.join(workdir, 'params.json')
+    if os.path.exists(paramspath):
+        with open(paramspath) as file:
+            if json.load(file) == params:
+                return (history, DataBase(dbpath))
+        raise RuntimeError(
+            '{0} is generated with different parameters'.format(workdir))
+    if not os.path.isdir(os.path.dirname(dbpath)):
+        os.makedirs(os.path.dirname(dbpath))
+
+    start = time.time()
+    history.write_corpus(corpus_files)
+    write_result(output, benchmark='corpus', files=corpus_files,
+                 seconds=time.time() - start)
+    db = DataBase(dbpath)
+    start = time.time()
+    history.grow(db, 0, events)
+    write_result(output, benchmark='record', case='grow', events=events,
+                 seconds=time.time() - start)
+    with open(paramspath, 'w') as file:
+        json.dump(params, file)
+    return (history, db)
+
+
+def write_result(output, **result):
+    output.write(json.dumps(result, sort_keys=True) + '\n')
+    output.flush()
+
+
+def get_meta(**params):
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=open(os.devnull, 'w')).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return dict(params, benchmark='meta', commit=commit,
+                python=platform.python_version(),
+                sqlite=sqlite3.sqlite_version,
+                platform=platform.platform(), time=time.time())
+
+
+def bench_record(db, history, num_single, num_batch, output):
+    rand = random.Random(history.seed)
+    paths = [history.path(below(rand, history.num_files))
+             for _ in range(num_single + num_batch)]
+
+    start = time.time()
+    for path in paths[:num_single]:
+        db.record_file_log(path, 'write', program='bench')
+    write_result(output, benchmark='record', case='record',
+                 events=num_single, seconds=time.time() - start)
+
+    start = time.time()
+    db.record_file_logs(dict(file_path=path, access_type='open',
+                             program='bench')
+                        for path in paths[num_single:])
+    write_result(output, benchmark='record', case='record-batch',
+                 events=num_batch, seconds=time.time() - start)
+
+
+def bench_list(db, history, limit, repeat, output):
+    for (case, kwds) in gene_list_cases(history.root):
+        func = lambda: list(db.search_file_log(limit, **kwds))
+        write_result(output, benchmark='list', limit=limit,
+                     seconds=measure(func, repeat), **case)
+
+
+def bench_render(db, history, cachepath, limit, jobs, repeat, output):
+    from ..record import write_listed_rows
+    from ..filecache import TitleCache, LineIndexCache
+    rows = list(db.search_file_log(limit, under=[history.root]))
+    options = [
+        ('title', TitleCache, dict(title=True), 'get_title'),
+        ('context', LineIndexCache, dict(context=3), 'line_index'),
+    ]
+    for (name, cache_class, kwds, cache_arg) in options:
+        kwds = dict(dict(title=False, before_context=None,
+                         after_context=None, context=None), **kwds)
+        for cached in [False, True]:
+            if cached:
+                cache = cache_class(cachepath)
+                kwds[cache_arg] = cache
+                cache.get(rows[0].path)     # make sure table exists
+            func = lambda: write_listed_rows(
+                rows, '\n', NullOutput(), jobs=jobs, **kwds)
+            write_result(output, benchmark='render', case=name,
+                         cached=cached, jobs=jobs, rows=len(rows),
+                         seconds=measure(func, repeat))
+            if cached:
+                cache.close()
+
+
+def bench_startup(workdir, history, repeat, output):
+    env = dict(os.environ, XDG_CONFIG_HOME=workdir)
+    cli = [sys.executable, '-m', 'factlog.cli']
+    top = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    commands = [
+        ('python', [sys.executable, '-c', 'pass']),
+        ('record', cli + ['record', '--no-server', history.path(0)]),
+        ('list', cli + ['list']),
+        ('list-help', cli + ['list', '--help']),
+    ]
+    with open(os.devnull, 'w') as devnull:
+        for (name, command) in commands:
+            func = lambda: subprocess.check_call(
+                command, env=env, cwd=top, stdout=devnull)
+            write_result(output, benchmark='startup', case=name,
+                         seconds=measure(func, repeat))
+
+
+def run(workdir, events, num_files, corpus_files, seed, limit, jobs,
+        repeat, benchmarks, output):
+    write_result(output, **get_meta(
+        events=events, num_files=num_files, corpus_files=corpus_files,
+        seed=seed, limit=limit, jobs=jobs, repeat=repeat))
+    (history, db) = prepare(workdir, events, num_files, corpus_files, seed,
+                            output)
+    if 'list' in benchmarks:
+        bench_list(db, history, limit, repeat, output)
+    if 'render' in benchmarks:
+        bench_render(db, history, os.path.join(workdir, 'cache.sqlite'),
+                     limit, jobs, repeat, output)
+    if 'startup' in benchmarks:
+        bench_startup(workdir, history, repeat, output)
+    # Run last, since it changes the history.
+    if 'record' in benchmarks:
+        bench_record(db, history, 100, 10000, output)
+    db.close()
+
+
+BENCHMARKS = ('list', 'render', 'startup', 'record')
+
+
+def main(args=None):
+    import argparse
+    import tempfile
+    import shutil
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=__doc__)
+    parser.add_argument('--events', type=int, default=100000,
+                        help='number of activities in the history.')
+    parser.add_argument('--num-files', type=int, default=10000)
+    parser.add_argument('--corpus-files', type=int, default=1000,
+                        help='number of popular files which exist.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--jobs', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument(
+        '--benchmarks', nargs='+', choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument(
+        '--workdir',
+        help="""
+        Keep the generated database and corpus in this directory and
+        reuse them next time.  Note that `record` adds activities.
+        """)
+    ns = parser.parse_args(args)
+    workdir = ns.workdir or tempfile.mkdtemp(prefix='factlog-bench-')
+    if not os.path.isdir(workdir):
+        os.makedirs(workdir)
+    try:
+        run(workdir, ns.events, ns.num_files, ns.corpus_files, ns.seed,
+            ns.limit, ns.jobs, ns.repeat, ns.benchmarks, sys.stdout)
+    finally:
+        if not ns.workdir:
+            shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
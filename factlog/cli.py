@@ -18,13 +18,17 @@ Command line interface.
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-import argparse
-import textwrap
+import sys
 
 
-class Formatter(argparse.RawDescriptionHelpFormatter,
-                argparse.ArgumentDefaultsHelpFormatter):
-    pass
+def get_formatter_class():
+    import argparse
+
+    class Formatter(argparse.RawDescriptionHelpFormatter,
+                    argparse.ArgumentDefaultsHelpFormatter):
+        pass
+
+    return Formatter
 
 
 def get_parser(commands):
@@ -45,13 +49,16 @@ def get_parser(commands):
                        will be the description of the subcommand.
 
     """
+    import argparse
+    import textwrap
+    formatter_class = get_formatter_class()
     parser = argparse.ArgumentParser(description=__doc__)
     subparsers = parser.add_subparsers()
 
     for (name, adder, runner) in commands:
         subp = subparsers.add_parser(
             name,
-            formatter_class=Formatter,
+            formatter_class=formatter_class,
             description=runner.__doc__ and textwrap.dedent(runner.__doc__))
         adder(subp)
         subp.set_defaults(func=runner)
@@ -61,13 +68,34 @@ def get_parser(commands):
 
 def main(args=None):
     from . import record
-    parser = get_parser(
-        record.commands
-        # + search.commands
-    )
-    ns = parser.parse_args(args=args)
-    applyargs = lambda func, **kwds: func(**kwds)
-    applyargs(**vars(ns))
+    from . import trace
+    if args is None:
+        args = sys.argv[1:]
+    trace.enable_from_environ()
+    try:
+        # `factlog record` runs on every save in editors, so that
+        # common usage is handled without building parsers of all
+        # subcommands.
+        if args[:1] == ['record'] and record.record_fast(args[1:]):
+            return
+        from . import grep
+        from . import search
+        from . import watch
+        parser = get_parser(
+            record.commands
+            + grep.commands
+            + search.commands
+            + watch.commands
+        )
+        kwds = vars(parser.parse_args(args=args))
+        dest = kwds.pop('trace', None)
+        if dest:
+            trace.enable(dest)
+        with trace.span('command', command=args[0]):
+            applyargs = lambda func, **kwds: func(**kwds)
+            applyargs(**kwds)
+    finally:
+        trace.disable()
 
 
 if __name__ == '__main__':
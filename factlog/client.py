@@ -0,0 +1,104 @@
+"""
+Client for the record server started by ``factlog serve``.
+
+This module is imported by ``factlog record`` on every call, so it
+must stay cheap to import.  See :mod:`factlog.server` for the server
+side of the protocol.
+"""
+
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import json
+import errno
+import socket
+
+
+class ServerError(Exception):
+
+    """
+    Raised when the server rejects a record.
+    """
+
+
+def encode_record(file_path, access_type, file_point=None,
+                  file_exists=None, program=None):
+    """
+    Encode one record as a line of the server protocol.
+
+    The path is made absolute here since the server does not know
+    the working directory of the client.
+
+    """
+    file_path = os.path.abspath(file_path)
+    if file_exists is None:
+        file_exists = os.path.exists(file_path)
+    message = dict(file_path=file_path, access_type=access_type,
+                   file_point=file_point, file_exists=file_exists,
+                   program=program)
+    return (json.dumps(message) + '\n').encode('utf-8')
+
+
+def send_records(socket_path, records, timeout=5.0):
+    """
+    Send `records` to the server at `socket_path` and wait for commit.
+
+    :type  socket_path: str
+    :arg   socket_path: path to the Unix domain socket of the server
+    :type      records: list of dict
+    :arg       records: keyword arguments for :func:`encode_record`
+    :type      timeout: float
+    :arg       timeout: seconds to wait for the server
+
+    :rtype: bool
+    :return: False if the server is not running.  True if all
+             `records` are committed by the server.
+    :raises ServerError: when the server rejects a record.
+
+    """
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(socket_path):
+        return False
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(socket_path)
+        except socket.error as err:
+            if err.errno in (errno.ENOENT, errno.ECONNREFUSED):
+                return False
+            raise
+        sock.sendall(b''.join(encode_record(**r) for r in records))
+        sock.shutdown(socket.SHUT_WR)
+        replies = recv_lines(sock)
+    finally:
+        sock.close()
+    errors = [r for r in replies if r != 'ok']
+    if errors:
+        raise ServerError('; '.join(errors))
+    if len(replies) != len(records):
+        raise ServerError('server closed connection before commit')
+    return True
+
+
+def recv_lines(sock):
+    chunks = []
+    while True:
+        data = sock.recv(4096)
+        if not data:
+            break
+        chunks.append(data)
+    return b''.join(chunks).decode('utf-8').splitlines()
@@ -15,7 +15,7 @@
 
 
 import os
-import platform
+import sys
 
 
 def get_config_directory(appname):
@@ -26,9 +26,9 @@ def get_config_directory(appname):
     :arg  appname: capitalized name of the application
 
     """
-    if platform.system().lower() == 'windows':
+    if sys.platform.startswith('win'):
         path = os.path.join(os.getenv('APPDATA') or '~', appname, appname)
-    elif platform.system().lower() == 'darwin':
+    elif sys.platform == 'darwin':
         path = os.path.join('~', 'Library', 'Application Support', appname)
     else:
         path = os.path.join(os.getenv('XDG_CONFIG_HOME') or '~/.config',
@@ -41,6 +41,9 @@ class ConfigStore(object):
     base_path = get_config_directory('FactLog')
     data_path = os.path.join(base_path, 'data')
     db_path = os.path.join(data_path, 'db.sqlite')
+    socket_path = os.path.join(data_path, 'server.sock')
+    cache_path = os.path.join(data_path, 'cache.sqlite')
+    search_path = os.path.join(data_path, 'search.sqlite')
 
     def __init__(self):
         if not os.path.exists(self.data_path):
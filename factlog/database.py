@@ -17,12 +17,19 @@
 import os
 import sqlite3
 import functools
-from contextlib import closing
+import itertools
+import threading
 
-from .utils.iterutils import repeat, uniq
+from .utils.iterutils import repeat, uniq, chunked
+from .utils.strutils import prefix_ranges
+from .utils.fsutils import AbsPathCache, exists_many, iter_existing
+from .utils.timeutils import now, to_microseconds, MICROSECONDS_PER_DAY
 from .accessinfo import AccessInfo
+from . import migrations
+from . import frecency
+from . import trace
 
-schema_version = '0.1.dev1'
+schema_version = '0.1.dev8'
 
 
 def concat_expr(operator, conditions):
@@ -39,20 +46,87 @@ def concat_expr(operator, conditions):
 class DataBase(object):
 
     ACCESS_TYPES = ('write', 'open', 'close')
+    SORT_ORDERS = ('recency', 'frecency')
     access_type_to_int = dict((a, i) for (i, a) in enumerate(ACCESS_TYPES))
     int_to_access_type = dict(enumerate(ACCESS_TYPES))
 
+    history_tables = ('access_log', 'access_daily')
+    """
+    Tables of activities: raw ones and daily counts folded by :meth:`gc`.
+    """
+
     schemapath = os.path.join(
         os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
 
-    def __init__(self, dbpath):
+    timeout = 5.0
+    """
+    Seconds to wait for other processes writing to the database.
+    """
+
+    def __init__(self, dbpath, timeout=None):
         self.dbpath = dbpath
+        if timeout is not None:
+            self.timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
         if not os.path.exists(dbpath):
             self._init_db()
+        else:
+            self._migrate_db()
+
+    def _connect(self):
+        """
+        Returns a new connection with SQL functions for frecency.
+
+        The database is switched to WAL mode, so that readers and a
+        writer do not block each other.  New databases are created
+        with incremental auto-vacuum for :meth:`gc`.
+
+        """
+        with trace.span('connect'):
+            db = sqlite3.connect(self.dbpath, timeout=self.timeout,
+                                 check_same_thread=False)
+            # No-op unless the database is empty.
+            db.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            db.execute('PRAGMA journal_mode = WAL')
+            db.execute('PRAGMA synchronous = NORMAL')
+            return frecency.register(db)
 
     def _get_db(self):
-        """Returns a new connection to the database."""
-        return closing(sqlite3.connect(self.dbpath))
+        """
+        Returns the connection to the database for the current thread.
+
+        The connection is reused until :meth:`close` is called.  Use
+        it in a with statement to roll back on error.
+
+        """
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = self._connect()
+            with self._lock:
+                self._connections.append(db)
+        return db
+
+    def close(self):
+        """
+        Close connections opened by all threads.
+
+        The database can still be used after closing; a new
+        connection is opened when needed.
+
+        """
+        with self._lock:
+            (connections, self._connections) = (self._connections, [])
+            self._local = threading.local()
+        for db in connections:
+            db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
 
     def _init_db(self):
         """Creates the database tables."""
@@ -66,6 +140,14 @@ class DataBase(object):
                 [version, schema_version])
             db.commit()
 
+    def _migrate_db(self):
+        """Upgrades the database tables to :data:`schema_version`."""
+        from .__init__ import __version__ as version
+        with self._get_db() as db:
+            # Checked again by migrate() while holding the write lock.
+            if migrations.get_schema_version(db) != schema_version:
+                migrations.migrate(db, version)
+
     def record_file_log(self, file_path, access_type, file_point=None,
                         file_exists=None, program=None):
         """
@@ -87,62 +169,460 @@ class DataBase(object):
         """
         # FIXME: Add more activities (if possible):
         #        create/delete/move/copy
-        access_type = self.access_type_to_int[access_type]
-        file_path = os.path.abspath(file_path)
-        if file_exists is None:
-            file_exists = os.path.exists(file_path)
+        params = self._file_log_params(
+            file_path, access_type, file_point=file_point,
+            file_exists=file_exists, program=program)
+        self._record_file_log_params([params])
+
+    record_chunk_size = 10000
+
+    def record_file_logs(self, logs, chunk_size=None):
+        """
+        Record many file activities.
+
+        :type        logs: iterable of dict
+        :arg         logs: Keyword arguments for :meth:`record_file_log`.
+                           Each dict may also have ``recorded`` key to
+                           specify the time of the activity (e.g.,
+                           ``'2013-01-23 12:34:56'`` in UTC).  See
+                           :func:`.utils.timeutils.to_microseconds`.
+        :type  chunk_size: int or None
+        :arg   chunk_size: Number of activities inserted in one
+                           transaction.  Default is
+                           :attr:`record_chunk_size`.
+
+        :rtype: int
+        :return: number of recorded activities
+
+        Unlike calling :meth:`record_file_log` many times, activities
+        are inserted by one `executemany` per chunk and absolute paths
+        and existence of files are computed per directory.
+
+        """
+        abspath = AbsPathCache()
+        num = 0
+        for chunk in chunked(logs, chunk_size or self.record_chunk_size):
+            self._record_file_log_params([
+                self._file_log_params(_abspath=abspath, **kwds)
+                for kwds in chunk])
+            num += len(chunk)
+        return num
+
+    def rebuild_latest_access(self):
+        """
+        Recompute ``latest_access`` table from the whole history.
+
+        The table is updated once per chunk of activities recorded
+        by :meth:`record_file_logs`.  This method is required only
+        when the history is modified by other means.
+
+        """
         with self._get_db() as db:
-            db.execute(
-                """
-                INSERT INTO access_log
-                    (file_path, file_point, file_exists, access_type, program)
-                VALUES (?, ?, ?, ?, ?)
-                """,
-                [file_path, file_point, file_exists, access_type, program])
+            db.executescript(
+                'BEGIN;\n{0}\nCOMMIT;'.format(
+                    migrations.rebuild_latest_access))
+
+    gc_batch_size = 10000
+    """
+    Number of activities folded in one transaction by :meth:`gc`.
+    """
+
+    _sql_insert_daily = (
+        'INSERT OR IGNORE INTO access_daily '
+        '(file_id, day, access_type, program, file_exists, access_count, '
+        'recorded, file_point) VALUES (?, ?, ?, ?, ?, 0, ?, ?)')
+    _sql_update_daily = (
+        'UPDATE access_daily SET access_count = access_count + ?, '
+        'file_point = CASE WHEN recorded <= ? '
+        'THEN ? ELSE file_point END, '
+        'recorded = MAX(recorded, ?) '
+        'WHERE file_id = ? AND day = ? AND access_type = ? '
+        'AND program = ? AND file_exists = ?')
+
+    def fold_access_log(self, before, batch_size=None):
+        """
+        Fold activities recorded before `before` into daily counts.
+
+        :type      before: int or str
+        :arg       before: microseconds since the epoch or UTC time
+                           such as '2013-01-01 00:00:00'
+        :type  batch_size: int or None
+        :arg   batch_size: default is :attr:`gc_batch_size`
+
+        :rtype: int
+        :return: number of folded activities
+
+        Activities of the same file, day, access type, program and
+        existence are counted in one row of ``access_daily`` and
+        deleted from ``access_log``.  Each batch of `batch_size`
+        activities is committed separately, so that other processes
+        are not blocked for long and an interrupted run loses nothing.
+        ``latest_access`` is not changed since it summarizes the whole
+        history.
+
+        """
+        before = to_microseconds(before)
+        batch_size = batch_size or self.gc_batch_size
+        folded = 0
+        with self._get_db() as db:
+            while True:
+                with trace.span('gc.fold') as span:
+                    rows = db.execute(
+                        'SELECT id, file_id, recorded, access_type, '
+                        'program, file_exists, file_point FROM access_log '
+                        'WHERE recorded < ? ORDER BY recorded LIMIT ?',
+                        [before, batch_size]).fetchall()
+                    if not rows:
+                        return folded
+                    groups = {}
+                    for (_, file_id, recorded, atype, program, exists,
+                         point) in rows:
+                        key = (file_id, recorded // MICROSECONDS_PER_DAY,
+                               atype, program or '', exists)
+                        count = groups.get(key, (0,))[0]
+                        # Rows are in order, so the last one wins.
+                        groups[key] = (count + 1, recorded, point)
+                    db.executemany(self._sql_insert_daily, [
+                        key + (recorded, point)
+                        for (key, (_, recorded, point)) in groups.items()])
+                    db.executemany(self._sql_update_daily, [
+                        (count, recorded, point, recorded) + key
+                        for (key, (count, recorded, point))
+                        in groups.items()])
+                    db.executemany('DELETE FROM access_log WHERE id = ?',
+                                   [[r[0]] for r in rows])
+                    db.commit()
+                    span.rows_in = len(rows)
+                    span.rows_out = len(groups)
+                folded += len(rows)
+
+    def vacuum(self):
+        """
+        Return free pages of the database file to the file system.
+
+        Databases created before incremental vacuum was enabled are
+        converted by a full ``VACUUM`` once.
+
+        :rtype: int
+        :return: number of freed pages
+
+        """
+        db = self._get_db()
+        page_count = lambda: db.execute('PRAGMA page_count').fetchone()[0]
+        with trace.span('gc.vacuum') as span:
+            before = page_count()
+            if db.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                db.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                db.execute('VACUUM')
+            db.execute('PRAGMA incremental_vacuum').fetchall()
+            db.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+            span.rows_out = freed = before - page_count()
+        return freed
+
+    def gc(self, retention_days, batch_size=None):
+        """
+        Fold activities older than `retention_days` and vacuum.
+
+        See :meth:`fold_access_log` and :meth:`vacuum`.  Return a dict
+        with the number of ``folded`` activities and ``freed_pages``.
+
+        """
+        if not 0 <= retention_days < float('inf'):
+            raise ValueError('retention_days must be a non-negative number')
+        before = now() - int(retention_days * MICROSECONDS_PER_DAY)
+        folded = self.fold_access_log(before, batch_size)
+        return dict(folded=folded, freed_pages=self.vacuum())
+
+    def get_accessed_paths(self, after_id=None):
+        """
+        Return ``(last_id, paths)`` of files accessed after `after_id`.
+
+        `after_id` is an id of ``access_log`` returned as `last_id`
+        before.  If it is None, all known paths are returned.  Pass
+        `last_id` next time to get only the paths accessed since then.
+
+        """
+        with self._get_db() as db:
+            (last_id,) = db.execute(
+                'SELECT MAX(id) FROM access_log').fetchone()
+            if last_id is None:
+                last_id = after_id or 0
+            if after_id is None:
+                rows = db.execute('SELECT path FROM files')
+            else:
+                rows = db.execute(
+                    'SELECT DISTINCT path FROM access_log '
+                    'JOIN files ON files.id = access_log.file_id '
+                    'WHERE access_log.id > ? AND access_log.id <= ?',
+                    [after_id, last_id])
+            return (last_id, [r[0] for r in rows])
+
+    def get_frecency_params(self):
+        """
+        Return parameters of frecency score as a dict.
+
+        ``half_life`` is in days and ``weights`` is a dict from
+        access type to the weight of one access.
+
+        """
+        with self._get_db() as db:
+            row = db.execute(
+                'SELECT half_life, write_weight, open_weight, close_weight '
+                'FROM frecency_params').fetchone()
+        return dict(half_life=row[0],
+                    weights=dict(zip(self.ACCESS_TYPES, row[1:])))
+
+    def set_frecency_params(self, half_life=None, weights={}):
+        """
+        Change parameters of frecency score and recompute scores.
+
+        :type  half_life: float or None
+        :arg   half_life: half-life of the score in days
+        :type    weights: dict
+        :arg     weights: access type to weight.  Missing types are
+                          unchanged.
+
+        """
+        assignments = []
+        if half_life is not None:
+            if not 0 < half_life < float('inf'):
+                raise ValueError('half_life must be a positive number')
+            assignments.append(('half_life', half_life))
+        for (atype, weight) in sorted(weights.items()):
+            if atype not in self.access_type_to_int:
+                raise ValueError('unknown access type: {0}'.format(atype))
+            if not 0 <= weight < float('inf'):
+                raise ValueError('weight must be a non-negative number')
+            assignments.append(('{0}_weight'.format(atype), weight))
+        if not assignments:
+            return
+        # Values are inlined since executescript does not take
+        # parameters.  They are validated numbers above.
+        update = 'UPDATE frecency_params SET {0};'.format(', '.join(
+            '{0} = {1!r}'.format(c, float(v)) for (c, v) in assignments))
+        with self._get_db() as db:
+            db.executescript('BEGIN;\n{0}\n{1}\nCOMMIT;'.format(
+                update, migrations.rebuild_latest_access))
+
+    _sql_insert_file = "INSERT OR IGNORE INTO files (path) VALUES (?)"
+
+    _sql_insert_file_log = """
+    INSERT INTO access_log
+        (file_id, file_point, file_exists, access_type, program, recorded)
+    VALUES (?, ?, ?, ?, ?, ?)
+    """
+
+    _sql_insert_latest = (
+        'INSERT OR IGNORE INTO latest_access (file_id) VALUES (?)')
+    _sql_update_latest = (
+        'UPDATE latest_access SET '
+        'file_point = CASE WHEN IFNULL(recorded <= ?, 1) '
+        'THEN ? ELSE file_point END, '
+        'access_type = CASE WHEN IFNULL(recorded <= ?, 1) '
+        'THEN ? ELSE access_type END, '
+        'recorded = MAX(IFNULL(recorded, ?), ?), '
+        'access_count = access_count + ?, '
+        'frecency = logaddexp2(frecency, ?) '
+        'WHERE file_id = ?')
+
+    select_chunk_size = 500
+    """
+    Number of paths looked up by one query.  SQLite limits the number
+    of parameters to 999 by default.
+    """
+
+    def _file_log_params(self, file_path, access_type, file_point=None,
+                         file_exists=None, program=None, recorded=None,
+                         _abspath=os.path.abspath):
+        """
+        Convert arguments of :meth:`record_file_log` to SQL parameters.
+
+        `file_exists` is left None if not given.  It is filled by
+        :meth:`_record_file_log_params`.  `recorded` is converted to
+        microseconds and defaults to now.
+
+        :raises ValueError: when `access_type` is unknown.
+
+        """
+        try:
+            access_type = self.access_type_to_int[access_type]
+        except KeyError:
+            raise ValueError(
+                'access_type must be one of {0!r}, not {1!r}'
+                .format(self.ACCESS_TYPES, access_type))
+        recorded = now() if recorded is None else to_microseconds(recorded)
+        return [_abspath(file_path), file_point, file_exists, access_type,
+                program, recorded]
+
+    def _record_file_log_params(self, params_list):
+        """
+        Insert rows given by :meth:`_file_log_params` in one transaction.
+        """
+        unknown = [p for p in params_list if p[2] is None]
+        for (params, exists) in zip(
+                unknown, exists_many([p[0] for p in unknown])):
+            params[2] = exists
+        paths = list(uniq(p[0] for p in params_list))
+        with self._get_db() as db:
+            db.executemany(self._sql_insert_file, ([p] for p in paths))
+            file_ids = self._get_file_ids(db, paths)
+            rows = [[file_ids[p[0]]] + p[1:] for p in params_list]
+            db.executemany(self._sql_insert_file_log, rows)
+            self._update_latest_access(db, rows)
             db.commit()
 
+    def _get_file_ids(self, db, paths):
+        """
+        Return a dict from `paths` to their ids in ``files`` table.
+        """
+        file_ids = {}
+        for chunk in chunked(paths, self.select_chunk_size):
+            file_ids.update(db.execute(
+                'SELECT path, id FROM files WHERE path IN ({0})'.format(
+                    ', '.join(repeat('?', len(chunk)))),
+                chunk))
+        return file_ids
+
+    def _update_latest_access(self, db, rows):
+        """
+        Add ``access_log`` `rows` to ``latest_access`` table.
+
+        Rows are aggregated per file, so that ``latest_access`` is
+        updated once per file instead of once per row.  Frecency
+        scores are added in log space as in :mod:`factlog.frecency`.
+
+        """
+        (half_life, write, open_, close) = db.execute(
+            'SELECT half_life, write_weight, open_weight, close_weight '
+            'FROM frecency_params').fetchone()
+        weights = (write, open_, close)
+        latest = {}
+        for (file_id, point, _, atype, _, recorded) in rows:
+            (last, count, score) = latest.get(file_id, (None, 0, None))
+            # The last row wins on a tie, as if rows are added in order.
+            if last is None or last[1] <= recorded:
+                last = (point, recorded, atype)
+            score = frecency.frecency_add(
+                score, weights[atype], recorded / float(MICROSECONDS_PER_DAY),
+                half_life)
+            latest[file_id] = (last, count + 1, score)
+        db.executemany(self._sql_insert_latest, ([i] for i in latest))
+        db.executemany(self._sql_update_latest, (
+            (recorded, point, recorded, atype, recorded, recorded,
+             count, score, file_id)
+            for (file_id, ((point, recorded, atype), count, score))
+            in latest.items()))
+
     @classmethod
     def _script_search_file_log(
             cls, limit, access_types, unique, include_glob, exclude_glob,
-            file_exists, program):
-        # FIXME: support `unique` (currently ignored)
-        params = []
+            file_exists, program, path_ranges=[], offset=0, sort='recency',
+            since=None, until=None):
+        # Each condition is a tuple (expression, params, per_access).
         conditions = []
         if access_types is not None:
-            conditions.append('access_type in ({0})'.format(
-                ', '.join(repeat('?', len(access_types)))))
-            params.extend(map(cls.access_type_to_int.get, access_types))
+            conditions.append((
+                'access_type in ({0})'.format(
+                    ', '.join(repeat('?', len(access_types)))),
+                list(map(cls.access_type_to_int.get, access_types)),
+                True))
 
         if file_exists is not None:
-            conditions.append('file_exists = ?')
-            params.append(file_exists)
-
-        conditions.extend(concat_expr(
-            'OR', repeat('glob(?, file_path)', len(include_glob))))
-        conditions.extend(repeat('NOT glob(?, file_path)', len(exclude_glob)))
-        params.extend(include_glob)
-        params.extend(exclude_glob)
-
-        conditions.extend(concat_expr(
-            'OR', repeat('program = ?', len(program))))
-        params.extend(program)
+            conditions.append(('file_exists = ?', [file_exists], True))
+
+        conditions.extend(
+            (c, include_glob, False) for c in
+            concat_expr('OR', repeat('glob(?, path)', len(include_glob))))
+        conditions.extend(
+            ('NOT glob(?, path)', [g], False) for g in exclude_glob)
+
+        # Unlike glob, range predicates can use the index on path.
+        conditions.extend(
+            (c, [p for r in path_ranges for p in r], False) for c in
+            concat_expr('OR', repeat('(path >= ? AND path < ?)',
+                                     len(path_ranges))))
+
+        conditions.extend(
+            (c, program, True) for c in
+            concat_expr('OR', repeat('program = ?', len(program))))
+
+        # Range predicates on the indices on recorded.
+        if since is not None:
+            conditions.append(('recorded >= ?', [since], True))
+        if until is not None:
+            conditions.append(('recorded < ?', [until], True))
+
+        # The last access of a file is after `since` if and only if
+        # one of its accesses is, so `since` alone is tested against
+        # `latest_access`.
+        per_access = any(c[2] for c in conditions
+                         if c[0] != 'recorded >= ?')
+        if not per_access:
+            conditions = [(c[0], c[1], False) for c in conditions]
+        if sort == 'frecency':
+            if not unique:
+                raise ValueError("sort='frecency' requires unique=True")
+            # Score is per file, so that conditions on accesses are
+            # tested against the history of each file.
+            history = [c for c in conditions if c[2]]
+            conditions = [c for c in conditions if not c[2]]
+            if history:
+                conditions.append((
+                    '({0})'.format(' OR '.join(
+                        'EXISTS (SELECT 1 FROM {0} '
+                        'WHERE {0}.file_id = latest_access.file_id '
+                        'AND {1})'.format(
+                            t, ' AND '.join(c[0] for c in history))
+                        for t in cls.history_tables)),
+                    [p for c in history for p in c[1]] *
+                    len(cls.history_tables),
+                    False))
+            order_by = 'frecency'
+        elif sort != 'recency':
+            raise ValueError('unknown sort order: {0}'.format(sort))
+        else:
+            order_by = 'recorded'
 
         if conditions:
-            where = 'WHERE {0} '.format(" AND ".join(conditions))
+            where = 'WHERE {0} '.format(
+                " AND ".join(c[0] for c in conditions))
         else:
             where = ''
-        if unique:
-            columns = 'file_path, file_point, MAX(recorded), access_type'
-            group_by = 'GROUP BY file_path '
+        params = [p for c in conditions for p in c[1]]
+
+        if sort == 'frecency' or (unique and not per_access):
+            # `latest_access` keeps the last access of each file, so
+            # that the most common query does not aggregate history.
+            sql = (
+                'SELECT path, file_point, recorded, access_type '
+                'FROM latest_access JOIN files ON files.id = file_id '
+                '{0}ORDER BY {1} DESC LIMIT ?'
+            ).format(where, order_by)
+        elif unique:
+            sql = (
+                'SELECT path, file_point, MAX(recorded), access_type '
+                'FROM ({0}) GROUP BY file_id ORDER BY recorded DESC LIMIT ?'
+            ).format(' UNION ALL '.join(
+                'SELECT file_id, path, file_point, MAX(recorded) AS recorded, '
+                'access_type FROM {0} JOIN files ON files.id = file_id '
+                '{1}GROUP BY file_id'.format(t, where)
+                for t in cls.history_tables))
+            params *= len(cls.history_tables)
         else:
-            columns = 'file_path, file_point, recorded, access_type'
-            group_by = ''
-        sql = (
-            'SELECT {0} FROM access_log {1}{2}'
-            'ORDER BY recorded DESC '
-            'LIMIT ?'
-        ).format(columns, where, group_by)
+            # Each table is sorted and limited separately, so that
+            # SQLite merges them using the indices on recorded.
+            sql = (
+                '{0} ORDER BY recorded DESC LIMIT ?'
+            ).format(' UNION ALL '.join(
+                'SELECT * FROM (SELECT path, file_point, recorded, '
+                'access_type FROM {0} JOIN files ON files.id = file_id '
+                '{1}ORDER BY recorded DESC LIMIT ?)'.format(t, where)
+                for t in cls.history_tables))
+            params = (params + [limit + offset]) * len(cls.history_tables)
         params.append(limit)
+        if offset:
+            sql += ' OFFSET ?'
+            params.append(offset)
         return (sql, params)
 
     def __wrap_search_file_log_defaults(func):
@@ -154,7 +634,8 @@ class DataBase(object):
                     include_glob=[], exclude_glob=[],
                     file_exists=None, program=[],
                     under=[], relative=False,
-                    only_existing=True):
+                    only_existing=True, sort='recency',
+                    since=None, until=None):
             # These keyword arguments are modified by wrappers and
             # then finally passed to :meth:`_script_search_file_log`.
             return func(
@@ -162,7 +643,8 @@ class DataBase(object):
                 include_glob=include_glob, exclude_glob=exclude_glob,
                 file_exists=file_exists, program=program,
                 under=under, relative=relative,
-                only_existing=only_existing)
+                only_existing=only_existing, sort=sort,
+                since=since, until=until)
         return wrapper
 
     def __wrap_search_file_log_exclude_non_existing_path(func):
@@ -174,38 +656,61 @@ class DataBase(object):
             only_existing = kwds.pop('only_existing')
             iter_info = func(self, **kwds)
             if only_existing:
-                return (i for i in iter_info if os.path.exists(i.path))
+                stage = trace.stage('search.exists')
+                chunk_size = min(max(kwds['limit'] or 1024, 16), 1024)
+                return stage.output(iter_existing(
+                    stage.input(iter_info), lambda i: i.path,
+                    chunk_size=chunk_size))
             else:
                 return iter_info
         return wrapper
 
+    def __wrap_search_file_log_limit(func):
+        """
+        Stop after `limit` rows.
+
+        Rows are fetched from the database page by page, so filters
+        applied after the query still give `limit` rows if possible.
+
+        """
+        @functools.wraps(func)
+        def wrapper(self, **kwds):
+            stage = trace.stage('search.limit')
+            return stage.output(itertools.islice(
+                stage.input(func(self, **kwds)), kwds['limit']))
+        return wrapper
+
     def __wrap_search_file_log_for_under(func):
         """
         Implement `under` and `relative` part for :meth:`search_file_log`.
         """
         @functools.wraps(func)
-        def wrapper(self, under, relative, include_glob, **kwds):
+        def wrapper(self, under, relative, **kwds):
             absunder = [os.path.join(os.path.abspath(p), "") for p in under]
-            include_glob = include_glob + \
-                           [os.path.join(p, "*") for p in absunder]
-            iter_info = func(self, include_glob=include_glob, **kwds)
+            iter_info = func(self, path_ranges=prefix_ranges(absunder),
+                             **kwds)
             if relative:
-                return uniq(
-                    iter_info,
-                    lambda i: i._set_relative_path(absunder))
+                stage = trace.stage('search.relative')
+                return stage.output(uniq(
+                    stage.input(iter_info),
+                    lambda i: i._set_relative_path(absunder)))
             else:
                 return iter_info
         return wrapper
 
     @__wrap_search_file_log_defaults
+    @__wrap_search_file_log_limit
     @__wrap_search_file_log_exclude_non_existing_path
     @__wrap_search_file_log_for_under
     def search_file_log(self, **kwds):
         """
         Return an iterator which yields file access information.
 
-        :type          limit: int
-        :arg           limit: maximum number of files to list
+        :type          limit: int or None
+        :arg           limit: maximum number of files to list.
+                              None means all of them; rows are then
+                              fetched by one query in pages of
+                              :attr:`fetch_size` rows.
         :type   access_types: tuple
         :arg    access_types: subset of :attr:`ACCESS_TYPES`
         :type         unique: bool
@@ -225,12 +730,51 @@ class DataBase(object):
         :arg        relative:
         :type  only_existing: bool
         :arg   only_existing: if true (default), exclude non-existing paths
+        :type           sort: str
+        :arg            sort: 'recency' (default) or 'frecency'.
+                              See :mod:`factlog.frecency`.
+        :type          since: int or None
+        :arg           since: include only accesses at or after this
+                              time (microseconds since the epoch)
+        :type          until: int or None
+        :arg           until: include only accesses before this time
 
         :rtype: list of AccessInfo
 
         """
+        stage = trace.stage('search.sql')
+        return stage.output(self._iter_file_log(stage, **kwds))
+
+    fetch_size = 1000
+    """
+    Number of rows fetched at once when `limit` is None.
+    """
+
+    def _iter_file_log(self, stage, **kwds):
         i2at = self.int_to_access_type
+        limit = kwds.pop('limit')
+        offset = 0
         with self._get_db() as db:
-            cursor = db.execute(*self._script_search_file_log(**kwds))
-            for (path, point, recorded, atype) in cursor:
-                yield AccessInfo(path, point, recorded, i2at[atype])
+            if limit is None:
+                # Paging by OFFSET would rescan skipped rows, so keep
+                # one cursor.  Readers do not block writers in WAL.
+                stage.count('queries')
+                cursor = db.execute(*self._script_search_file_log(
+                    limit=-1, **kwds))
+                while True:
+                    rows = cursor.fetchmany(self.fetch_size)
+                    if not rows:
+                        return
+                    for (path, point, recorded, atype) in rows:
+                        yield AccessInfo(path, point, recorded, i2at[atype])
+            while True:
+                stage.count('queries')
+                rows = db.execute(*self._script_search_file_log(
+                    limit=limit, offset=offset, **kwds)).fetchall()
+                for (path, point, recorded, atype) in rows:
+                    yield AccessInfo(path, point, recorded, i2at[atype])
+                if len(rows) < limit:
+                    return
+                # Filters in wrappers dropped some rows.  Fetch more.
+                offset += limit
+                limit *= 2
@@ -0,0 +1,261 @@
+"""
+Persistent cache of values computed from file contents.
+"""
+
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import time
+import sqlite3
+import threading
+
+from . import filetitle
+from .utils import textfile
+
+
+def stat_key(path):
+    """
+    Return ``(mtime, size)`` of `path` or None if it cannot be stat'ed.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (getattr(st, 'st_mtime_ns', st.st_mtime), st.st_size)
+
+
+class FileCache(object):
+
+    """
+    Cache of values computed from files, stored in a SQLite database.
+
+    An entry is keyed on the path and it is used only while the
+    modification time and the size of the file are unchanged.  When
+    the cache is closed, entries not used recently are evicted so
+    that the number of entries does not exceed :attr:`max_rows`.
+
+    Subclass must define :attr:`table` and :meth:`compute`.  It can
+    also define :meth:`dumps` and :meth:`loads` to convert values to
+    and from the types SQLite can store.
+
+    :meth:`get` can be called from multiple threads.  Processes using
+    the same cache do not block each other for long: the database is
+    in WAL mode and each new entry is committed at once.  If the
+    cache cannot be written (e.g., it is locked for more than
+    :attr:`timeout` seconds), the value is computed but not cached.
+
+    """
+
+    table = None
+    max_rows = 10000
+    timeout = 1.0
+
+    def __init__(self, dbpath, max_rows=None, timeout=None):
+        if max_rows is not None:
+            self.max_rows = max_rows
+        if timeout is not None:
+            self.timeout = timeout
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.used = set()
+        # Autocommit mode; transactions are started explicitly.
+        self.db = sqlite3.connect(dbpath, timeout=self.timeout,
+                                  isolation_level=None,
+                                  check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.execute('PRAGMA synchronous = NORMAL')
+        self.db.executescript("""
+        create table if not exists {0} (
+          path text primary key,
+          mtime integer not null,
+          size integer not null,
+          value,
+          last_used real not null
+        );
+        create index if not exists {0}_last_used on {0} (last_used);
+        create table if not exists cache_stats (
+          name text primary key,
+          hits integer not null default 0,
+          misses integer not null default 0
+        );
+        """.format(self.table))
+
+    def compute(self, path):
+        raise NotImplementedError
+
+    def dumps(self, value):
+        return value
+
+    def loads(self, data):
+        return data
+
+    def get(self, path):
+        """
+        Return the value for `path`, computing it only if stale.
+        """
+        key = stat_key(path)
+        if key is None:
+            return self.compute(path)
+        with self.lock:
+            try:
+                row = self.db.execute(
+                    'SELECT mtime, size, value FROM {0} WHERE path = ?'
+                    .format(self.table), [path]).fetchone()
+            except sqlite3.OperationalError:
+                row = None
+            if row and tuple(row[:2]) == key:
+                self.hits += 1
+                self.used.add(path)
+                return self.loads(row[2])
+            self.misses += 1
+        value = self.compute(path)
+        with self.lock:
+            try:
+                self.db.execute(
+                    'INSERT OR REPLACE INTO {0} '
+                    '(path, mtime, size, value, last_used) '
+                    'VALUES (?, ?, ?, ?, ?)'.format(self.table),
+                    [path, key[0], key[1], self.dumps(value), time.time()])
+            except sqlite3.OperationalError:
+                pass
+        return value
+
+    def __call__(self, path):
+        return self.get(path)
+
+    def stats(self):
+        """
+        Return a dict of the number of entries and cumulative hits and
+        misses, including the ones not yet written by :meth:`close`.
+        """
+        with self.lock:
+            (rows,) = self.db.execute(
+                'SELECT COUNT(*) FROM {0}'.format(self.table)).fetchone()
+            row = self.db.execute(
+                'SELECT hits, misses FROM cache_stats WHERE name = ?',
+                [self.table]).fetchone() or (0, 0)
+        return dict(rows=rows, max_rows=self.max_rows,
+                    hits=row[0] + self.hits, misses=row[1] + self.misses)
+
+    def clear(self):
+        with self.lock:
+            self.db.execute('DELETE FROM {0}'.format(self.table))
+            self.db.execute('DELETE FROM cache_stats WHERE name = ?',
+                            [self.table])
+
+    def evict(self):
+        """
+        Remove least recently used entries exceeding :attr:`max_rows`.
+        """
+        with self.lock:
+            self._evict()
+
+    def _evict(self):
+        self.db.execute(
+            'DELETE FROM {0} WHERE path IN '
+            '(SELECT path FROM {0} ORDER BY last_used DESC '
+            'LIMIT -1 OFFSET ?)'.format(self.table), [self.max_rows])
+
+    def close(self):
+        """
+        Record usage and statistics, evict old entries and close.
+
+        They are skipped if the cache cannot be written.
+
+        """
+        now = time.time()
+        with self.lock:
+            try:
+                self.db.execute('BEGIN IMMEDIATE')
+                self.db.executemany(
+                    'UPDATE {0} SET last_used = ? WHERE path = ?'
+                    .format(self.table), ((now, p) for p in self.used))
+                self.db.execute(
+                    'INSERT OR IGNORE INTO cache_stats (name) VALUES (?)',
+                    [self.table])
+                self.db.execute(
+                    'UPDATE cache_stats SET hits = hits + ?, '
+                    'misses = misses + ? WHERE name = ?',
+                    [self.hits, self.misses, self.table])
+                self._evict()
+                self.db.execute('COMMIT')
+            except sqlite3.OperationalError:
+                try:
+                    self.db.execute('ROLLBACK')
+                except sqlite3.OperationalError:
+                    pass        # BEGIN failed
+            (self.hits, self.misses, self.used) = (0, 0, set())
+            self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class TitleCache(FileCache):
+
+    """
+    Cache of :func:`factlog.filetitle.get_title`.
+    """
+
+    table = 'title_cache'
+
+    def compute(self, path):
+        return filetitle.get_title(path)
+
+    def get(self, path):
+        if filetitle.get_title_func(path) is None:
+            return None
+        return super(TitleCache, self).get(path)
+
+
+class LineIndexCache(FileCache):
+
+    """
+    Cache of :class:`factlog.utils.textfile.LineIndex`.
+
+    Only files of at least :attr:`min_size` bytes are indexed, since
+    smaller files are scanned fast enough.  Files larger than
+    :attr:`max_size` are not indexed to keep the cache small.
+
+    """
+
+    table = 'line_index'
+    max_rows = 200
+    min_size = 1024 * 1024
+    max_size = 64 * 1024 * 1024
+
+    def compute(self, path):
+        with textfile.mapped_file(path, self.max_size) as data:
+            if data is None:
+                return None
+            return textfile.LineIndex.build(data)
+
+    def dumps(self, value):
+        return None if value is None else sqlite3.Binary(value.dumps())
+
+    def loads(self, data):
+        return None if data is None else textfile.LineIndex.loads(data)
+
+    def get(self, path):
+        key = stat_key(path)
+        if key is None or not self.min_size <= key[1] <= self.max_size:
+            return None
+        return super(LineIndexCache, self).get(path)
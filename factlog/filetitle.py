@@ -21,83 +21,123 @@ File title extractor.
 import os
 import re
 import ast
-from itertools import tee
+from itertools import islice
 
-from .utils.py3compat import map, zip, filter
+from .utils.py3compat import PY3, zip
+from .utils.parallel import get_executor, imap_ordered
+from . import trace
 
 
-def gene_iparse_underline_headings(symbols):
-    underline_re = re.compile(r'({0})\1* *$'.format(symbols))
+# Headings are searched only in this many lines or characters from
+# the beginning of the file, so that large files without heading do
+# not take long time.
+HEADING_MAX_LINES = 1000
+HEADING_MAX_CHARS = 64 * 1024
 
-    def iparse_underline_headings(lines):
-        lines = iter(lines)
-        previous = next(lines)
-        yield
-        for line in lines:
-            if underline_re.match(line.rstrip()):
-                yield previous
-            else:
-                yield
-            previous = line
 
-    return iparse_underline_headings
+def gene_heading_scanner(underline=None, prefix=None):
+    """
+    Generate a function to find the first heading in lines.
 
+    :type  underline: str or None
+    :arg   underline: regular expression matching one character.
+                      A line consisting of repetition of the matched
+                      character makes previous line a heading.
+    :type     prefix: str or None
+    :arg      prefix: A line starting with this string followed by
+                      a space is a heading.
 
-def gene_iparse_prefix_headings(prefixes):
-    prefix_re = re.compile(r'^{0} .+'.format(re.escape(prefixes)))
+    Both styles of headings are matched by one compiled regular
+    expression while reading lines only once.
 
-    def iparse_prefix_headings(lines):
-        for line in lines:
-            if prefix_re.match(line):
-                yield line.strip(prefixes).strip()
+    """
+    alternatives = []
+    if underline:
+        alternatives.append('(?P<underline>{0})(?P=underline)*'
+                            .format(underline))
+    if prefix:
+        alternatives.append('{0} .+'.format(re.escape(prefix)))
+    heading_re = re.compile('(?:{0})$'.format('|'.join(alternatives)))
+
+    def scan_heading(fp, max_lines=None, max_chars=None):
+        if max_lines is None:
+            max_lines = HEADING_MAX_LINES
+        if max_chars is None:
+            max_chars = HEADING_MAX_CHARS
+        previous = None
+        # Bound each read, so that a long line is not read in full.
+        lines = iter(lambda: fp.readline(max_chars), '')
+        for line in islice(lines, max_lines):
+            max_chars -= len(line)
+            line = line.rstrip()
+            match = heading_re.match(line)
+            if not match:
+                pass
+            elif underline and match.group('underline'):
+                if previous:
+                    return previous
             else:
-                yield
+                title = line.strip(prefix).strip()
+                if title:
+                    return title
+            previous = line
 
-    return iparse_prefix_headings
+    return scan_heading
 
 NONALPHANUM7BIT = '[!-/:-@[-`{-~]'
 # See also: docutils.parsers.rst.states.Body.pats['nonalphanum7bit']
-iparse_rst_underline_headings = gene_iparse_underline_headings(NONALPHANUM7BIT)
-iparse_md_underline_headings = gene_iparse_underline_headings(r'[=\-]')
-
-iparse_sharps_headings = gene_iparse_prefix_headings('#')
-iparse_asterisk_headings = gene_iparse_prefix_headings('*')
-
+get_title_rst = gene_heading_scanner(underline=NONALPHANUM7BIT)
+get_title_md = gene_heading_scanner(underline=r'[=\-]', prefix='#')
+get_title_org = gene_heading_scanner(prefix='*')
 
-def first(iterative):
-    for item in iterative:
-        return item
 
+def get_module_docstring(fp):
+    """
+    Get docstring of Python module in file object `fp` or None.
 
-def get_first_heading(lines, parsers):
-    lines = map(str.rstrip, lines)
-    iteratives = map(lambda p, ls: p(ls), parsers, tee(lines, len(parsers)))
-    candidates = first(filter(any, zip(*iteratives)))
-    if candidates:
-        return first(filter(None, candidates))  # get non-None candidate
-
-
-def get_title_rst(fp):
-    parsers = [iparse_rst_underline_headings]
-    return get_first_heading(fp, parsers)
-
-
-def get_title_md(fp):
-    parsers = [iparse_md_underline_headings, iparse_sharps_headings]
-    return get_first_heading(fp, parsers)
-
+    Unlike :func:`ast.get_docstring`, only the tokens up to the end of
+    the first statement are read.  Return None when the first
+    statement is not a string literal or cannot be tokenized.
 
-def get_title_org(fp):
-    parsers = [iparse_asterisk_headings]
-    return get_first_heading(fp, parsers)
+    """
+    import tokenize
+    strings = []
+    (opened, closed) = (0, 0)
+    skip = (tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE)
+    try:
+        for (toktype, token) in (t[:2] for t in
+                                 tokenize.generate_tokens(fp.readline)):
+            if toktype in skip and not strings:
+                continue
+            elif toktype in (tokenize.COMMENT, tokenize.NL):
+                continue
+            elif toktype == tokenize.STRING and not closed:
+                strings.append(token)
+            elif token == '(' and not strings:
+                opened += 1
+            elif token == ')' and strings and closed < opened:
+                closed += 1
+            elif ((toktype in (tokenize.NEWLINE, tokenize.ENDMARKER) or
+                   token == ';') and strings and closed == opened):
+                break
+            else:
+                return None
+        else:
+            return None
+    except (tokenize.TokenError, SyntaxError, UnicodeDecodeError):
+        return None
+    try:
+        doc = ast.literal_eval(' '.join(strings))
+    except (ValueError, SyntaxError):
+        return None  # such as f-string
+    if PY3 and isinstance(doc, bytes):
+        return None
+    import inspect
+    return inspect.cleandoc(doc)
 
 
 def get_title_py(fp):
-    # FIXME: Find more quick way to get file title of Python file.
-    # Parsing python file using ast module can be pretty slow because
-    # it parses entire file.
-    node = ast.parse(fp.read())
-    doc = ast.get_docstring(node)
+    doc = get_module_docstring(fp)
     if doc is None:
         return None
     for line in doc.splitlines():
@@ -115,17 +155,28 @@ exts_func = [
 dispatcher = dict((ext, func) for (exts, func) in exts_func for ext in exts)
 
 
+def get_title_func(path):
+    """
+    Get a function to extract title from the file at `path` or None.
+    """
+    ext = os.path.splitext(path)[1].lower()[1:]
+    return dispatcher.get(ext)
+
+
 def get_title(path):
     """
     Get title of the document at `path` or None if cannot be retrieved.
     """
     if not os.path.exists(path):
         return None
-    ext = os.path.splitext(path)[1].lower()[1:]
-    func = dispatcher.get(ext)
+    func = get_title_func(path)
     if func:
-        with open(path) as fp:
-            return func(fp)
+        with trace.span('title', path=path) as span:
+            with open(path) as fp:
+                title = func(fp)
+                if trace.enabled():
+                    span.bytes = getattr(fp, 'buffer', fp).tell()
+            return title
 
 
 def write_path_and_title(file, path, showpath, newline, separator,
@@ -142,8 +193,12 @@ def write_path_and_title(file, path, showpath, newline, separator,
     Title is searched in the file specified by `path`.
 
     """
+    write_showpath_and_title(file, showpath, _get_title(path),
+                             newline, separator)
+
+
+def write_showpath_and_title(file, showpath, title, newline, separator):
     file.write(showpath)
-    title = _get_title(path)
     if title:
         file.write(separator)
         file.write(title)
@@ -151,7 +206,7 @@ def write_path_and_title(file, path, showpath, newline, separator,
 
 
 def write_paths_and_titles(
-        file, paths, showpaths=None, newline='\n', separator=':'):
+        file, paths, showpaths=None, newline='\n', separator=':', jobs=1):
     """
     Write path in `paths` to `file` with its title if found.
 
@@ -163,11 +218,16 @@ def write_paths_and_titles(
 
         mynote/2013/01/note.rst:Title of my note
 
+    Files are read by `jobs` threads concurrently.
+
     """
     if showpaths is None:
         showpaths = paths
-    for (path, show) in zip(paths, showpaths):
-        write_path_and_title(file, path, show, newline, separator)
+    with get_executor(jobs) as executor:
+        titles = imap_ordered(executor, get_title, paths,
+                              window=jobs * 4, on_wait=file.flush)
+        for (show, title) in zip(showpaths, titles):
+            write_showpath_and_title(file, show, title, newline, separator)
 
 
 def main(args=None):
@@ -180,8 +240,11 @@ def main(args=None):
     parser.add_argument(
         '--output', default='-', type=argparse.FileType('w'),
         help='file to write output. "-" means stdout.')
+    parser.add_argument(
+        '--jobs', '-j', type=int, default=8,
+        help='number of threads to read files.')
     ns = parser.parse_args(args)
-    write_paths_and_titles(ns.output, ns.path)
+    write_paths_and_titles(ns.output, ns.path, jobs=ns.jobs)
 
 
 if __name__ == '__main__':
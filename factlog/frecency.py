@@ -0,0 +1,103 @@
+"""
+Frecency score: access counts weighted by exponential time decay.
+
+Score of a file is ``sum(weight * 2 ** (-age / half_life))`` over its
+accesses, where `weight` depends on the access type.  Since all
+scores decay at the same rate, files are ranked by the score at a
+fixed time (the Unix epoch) instead of now, which can be updated
+incrementally when an access is recorded::
+
+  log2(sum(weight * 2 ** (days / half_life)))
+
+`days` is the time of the access since the epoch.  The score is kept
+in log space so that it does not overflow.
+
+Parameters are stored in the ``frecency_params`` table.  Scores of
+recorded accesses are summed per file and added to ``latest_access``
+once per chunk by :class:`factlog.database.DataBase`, through the SQL
+functions registered by :func:`register`.
+"""
+
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import math
+
+
+def logaddexp2(x, y):
+    """
+    Return ``log2(2 ** x + 2 ** y)`` where None means ``log2(0)``.
+
+    >>> logaddexp2(3, 3)
+    4.0
+    >>> logaddexp2(None, 3)
+    3
+
+    """
+    if x is None:
+        return y
+    if y is None:
+        return x
+    (x, y) = (max(x, y), min(x, y))
+    return x + math.log(1 + 2 ** (y - x), 2)
+
+
+def log2_term(weight, days, half_life):
+    """
+    Return the log2 of the score of one access, or None if it is zero.
+    """
+    if not weight or weight <= 0 or days is None:
+        return None
+    return math.log(weight, 2) + days / half_life
+
+
+def frecency_add(score, weight, days, half_life):
+    """
+    Add an access at `days` after the epoch to the frecency `score`.
+
+    >>> frecency_add(None, 1.0, 14.0, 14.0)
+    1.0
+    >>> frecency_add(1.0, 1.0, 14.0, 14.0)
+    2.0
+
+    """
+    return logaddexp2(score, log2_term(weight, days, half_life))
+
+
+class FrecencySum(object):
+
+    """
+    SQL aggregate function to compute frecency score from scratch.
+    """
+
+    def __init__(self):
+        self.score = None
+
+    def step(self, weight, days, half_life):
+        self.score = frecency_add(self.score, weight, days, half_life)
+
+    def finalize(self):
+        return self.score
+
+
+def register(db):
+    """
+    Register SQL functions used to compute frecency to connection `db`.
+    """
+    db.create_function('frecency_add', 4, frecency_add)
+    db.create_function('logaddexp2', 2, logaddexp2)
+    db.create_aggregate('frecency_sum', 3, FrecencySum)
+    return db
@@ -0,0 +1,197 @@
+"""
+Search a pattern in recently accessed files.
+"""
+
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import re
+import sys
+import functools
+from contextlib import closing
+from itertools import islice
+
+from .config import ConfigStore
+from . import trace
+from .database import DataBase
+from .record import filter_add_arguments, filter_search
+from .utils import textfile
+from .utils.parallel import get_executor, imap_ordered
+
+
+def iter_matched_lines(data, regex, start=0, end=None, line_no=None):
+    """
+    Yield ``(lineno, line)`` for lines in ``data[start:end]`` matching
+    bytes `regex`.
+
+    `start` must be at the beginning of a line.  `line_no` is the
+    0-origin line number at `start` if known.  Like grep, ``$`` in
+    `regex` does not match before CR of CRLF.
+
+    >>> regex = re.compile(b'b', re.MULTILINE)
+    >>> list(iter_matched_lines(b'abc\\nxyz\\nbb\\r\\n', regex))
+    [(1, 'abc'), (3, 'bb')]
+
+    """
+    if end is None:
+        end = len(data)
+    if line_no is None:
+        line_no = textfile.count_newlines(data, 0, start)
+    pos = start
+    while pos < end:
+        match = regex.search(data, pos, end)
+        if not match:
+            return
+        bol = data.rfind(b'\n', pos, match.start()) + 1 or pos
+        line_no += textfile.count_newlines(data, pos, bol)
+        eol = data.find(b'\n', max(match.start(), bol), end)
+        if eol == -1:
+            eol = end
+        line = data[bol:eol].decode('utf-8', 'replace').rstrip(u'\r')
+        yield (line_no + 1, textfile.str_line(line))
+        line_no += 1
+        pos = eol + 1
+
+
+def grep_file(path, regex, max_count=None, point=None, around=None):
+    """
+    Search compiled bytes `regex` in the file at `path`.
+
+    If `around` is an integer, only that number of lines before and
+    after `point` are searched.  At most `max_count` lines are
+    returned.  Binary, too large and unreadable files have no
+    matches.
+
+    :rtype: list of tuple of int and str
+
+    """
+    try:
+        with textfile.mapped_file(path) as data:
+            if data is None:
+                return []
+            (start, end) = (0, len(data))
+            if around is not None:
+                offset = textfile.char_to_byte_offset(data, (point or 1) - 1)
+                (start, end, _) = textfile.line_region(
+                    data, offset, around, around)
+            return list(islice(iter_matched_lines(data, regex, start, end),
+                               max_count))
+    except EnvironmentError:
+        return []
+
+
+def _grep_row(row, **kwds):
+    (path, point, showpath) = row
+    return (showpath, grep_file(path, point=point, **kwds))
+
+
+def grep_add_arguments(parser):
+    import argparse
+    parser.add_argument(
+        'pattern',
+        help="Python regular expression to search.")
+    filter_add_arguments(parser)
+    parser.add_argument(
+        '--ignore-case', '-i', action='store_true',
+        help="Ignore case distinctions.")
+    parser.add_argument(
+        '--max-count', '-m', type=int, metavar='NUM',
+        help="""
+        Stop after NUM matching lines in total.
+        """)
+    parser.add_argument(
+        '--around', type=int, metavar='NUM',
+        help="""
+        Search only NUM lines before and after the cursor line
+        recorded for each file.
+        """)
+    parser.add_argument(
+        '--jobs', '-j', type=int, metavar='NUM',
+        help="""
+        Number of processes to search files.
+        Default is the number of CPUs.
+        """)
+    parser.add_argument(
+        '--output', default='-', type=argparse.FileType('w'),
+        help='file to write output. "-" means stdout.')
+    trace.add_arguments(parser)
+
+
+def grep_run(pattern, ignore_case, max_count, around, jobs, output,
+             **kwds):
+    """
+    Search PATTERN in recently accessed files.
+
+    Files are selected as in `factlog list` and searched by multiple
+    processes.  Matching lines are written as PATH:LINE:TEXT in the
+    order of the listing.
+    """
+    if not isinstance(pattern, bytes):
+        pattern = pattern.encode('utf-8')
+    flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+    regex = re.compile(pattern, flags)
+    if jobs is None:
+        import multiprocessing
+        jobs = multiprocessing.cpu_count()
+    db = DataBase(ConfigStore().db_path)
+    write_matched_lines(filter_search(db, **kwds), output, regex,
+                        max_count, around, jobs)
+    if output is not sys.stdout:
+        output.close()
+
+
+def write_matched_lines(rows, output, regex, max_count=None, around=None,
+                        jobs=1):
+    """
+    Write lines matching `regex` in files of `rows` to `output`.
+
+    :type      rows: iterative of :class:`factlog.accessinfo.AccessInfo`
+    :arg       rows:
+    :type     regex: compiled bytes regular expression
+    :arg      regex:
+    :type max_count: int or None
+    :arg  max_count: stop after this number of lines are written
+    :type    around: int or None
+    :arg     around: search only this number of lines around the point
+    :type      jobs: int
+    :arg       jobs: number of processes to search files
+
+    Files are searched concurrently, but at most ``jobs * 2`` files
+    ahead of the one written last, so that searching stops soon after
+    `max_count` lines are written.
+
+    """
+    rows = ((r.path, r.point, r.showpath) for r in rows)
+    func = functools.partial(
+        _grep_row, regex=regex, max_count=max_count, around=around)
+    remaining = max_count
+    with get_executor(jobs, processes=True) as executor:
+        results = imap_ordered(executor, func, rows, window=jobs * 2,
+                               on_wait=output.flush)
+        with closing(results):
+            for (showpath, lines) in results:
+                for (lineno, line) in lines[:remaining]:
+                    output.write('{0}:{1}:{2}\n'.format(
+                        showpath, lineno, line))
+                if remaining is not None:
+                    remaining -= len(lines)
+                    if remaining <= 0:
+                        break
+
+
+commands = [
+    ('grep', grep_add_arguments, grep_run),
+]
@@ -0,0 +1,387 @@
+"""
+Schema migrations.
+
+Each element of :data:`migrations` is a tuple ``(old, new, step)``
+which upgrades database of schema version `old` to `new`.  `step` is
+a SQL script or a function which takes a connection.  Fresh databases
+are created by ``schema.sql``, which must be equivalent to applying all
+migrations.
+"""
+
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import sqlite3
+
+
+class MigrationError(Exception):
+    pass
+
+
+def _microseconds(column):
+    """
+    Return SQL to convert text timestamps in `column` to microseconds.
+
+    SQLite gives fractions of second only in milliseconds.
+    """
+    return ("cast(strftime('%s', {0}) as integer) * 1000000 + "
+            "cast(round(strftime('%f', {0}) * 1000) as integer) "
+            "% 1000 * 1000".format(column))
+
+
+rebuild_latest_access = """
+delete from latest_access;
+insert into latest_access
+    (file_id, file_point, recorded, access_type, access_count, frecency)
+  select file_id, file_point, max(recorded), access_type,
+         sum(access_count),
+         frecency_sum(
+           access_count * case access_type when 0 then write_weight
+                                           when 1 then open_weight
+                                           else close_weight end,
+           recorded / 86400000000.0, half_life)
+  from (select file_id, file_point, recorded, access_type,
+               1 as access_count from access_log
+        union all
+        select file_id, file_point, recorded, access_type, access_count
+        from access_daily),
+       frecency_params
+  group by file_id;
+"""
+
+
+migrations = [
+    ('0.1.dev1', '0.1.dev2', """
+    create index if not exists access_log_recorded
+      on access_log (recorded);
+    create index if not exists access_log_file_path_recorded
+      on access_log (file_path, recorded);
+    create index if not exists access_log_program_recorded
+      on access_log (program, recorded);
+    create index if not exists access_log_access_type_recorded
+      on access_log (access_type, recorded);
+    """),
+    ('0.1.dev2', '0.1.dev3', """
+    create table files (
+      id integer primary key autoincrement,
+      path text not null unique
+    );
+    insert into files (path)
+      select file_path from access_log group by file_path order by min(id);
+
+    create table access_log_new (
+      id integer primary key autoincrement,
+      file_id integer not null references files (id),
+      file_point integer,
+      file_exists integer not null default 1,
+      program text,
+      recorded timestamp default current_timestamp,
+      access_type integer not null
+    );
+    insert into access_log_new
+        (id, file_id, file_point, file_exists, program, recorded,
+         access_type)
+      select access_log.id, files.id, file_point, file_exists, program,
+             recorded, access_type
+      from access_log join files on files.path = access_log.file_path;
+    drop table access_log;
+    alter table access_log_new rename to access_log;
+
+    create index access_log_recorded
+      on access_log (recorded);
+    create index access_log_file_id_recorded
+      on access_log (file_id, recorded);
+    create index access_log_program_recorded
+      on access_log (program, recorded);
+    create index access_log_access_type_recorded
+      on access_log (access_type, recorded);
+    """),
+    ('0.1.dev3', '0.1.dev4', """
+    create table latest_access (
+      file_id integer primary key references files (id),
+      file_point integer,
+      recorded timestamp,
+      access_type integer,
+      access_count integer not null default 0
+    );
+    create index latest_access_recorded on latest_access (recorded);
+    create trigger access_log_insert_latest after insert on access_log
+    begin
+      insert or ignore into latest_access (file_id) values (new.file_id);
+      update latest_access
+        set file_point = new.file_point, recorded = new.recorded,
+            access_type = new.access_type
+        where file_id = new.file_id and
+              (recorded is null or recorded <= new.recorded);
+      update latest_access set access_count = access_count + 1
+        where file_id = new.file_id;
+    end;
+
+    delete from latest_access;
+    insert into latest_access
+        (file_id, file_point, recorded, access_type, access_count)
+      select file_id, file_point, max(recorded), access_type, count(*)
+      from access_log group by file_id;
+    """),
+    ('0.1.dev4', '0.1.dev5', """
+    create table frecency_params (
+      half_life real not null,
+      write_weight real not null,
+      open_weight real not null,
+      close_weight real not null
+    );
+    insert into frecency_params values (14.0, 1.0, 0.5, 0.0);
+    alter table latest_access add column frecency real;
+    create index latest_access_frecency on latest_access (frecency);
+    drop trigger access_log_insert_latest;
+    create trigger access_log_insert_latest after insert on access_log
+    begin
+      insert or ignore into latest_access (file_id) values (new.file_id);
+      update latest_access
+        set file_point = new.file_point, recorded = new.recorded,
+            access_type = new.access_type
+        where file_id = new.file_id and
+              (recorded is null or recorded <= new.recorded);
+      update latest_access
+        set access_count = access_count + 1,
+            frecency = (
+              select frecency_add(
+                latest_access.frecency,
+                case new.access_type when 0 then write_weight
+                                     when 1 then open_weight
+                                     else close_weight end,
+                julianday(new.recorded) - 2440587.5, half_life)
+              from frecency_params)
+        where file_id = new.file_id;
+    end;
+
+    delete from latest_access;
+    insert into latest_access
+        (file_id, file_point, recorded, access_type, access_count, frecency)
+      select file_id, file_point, max(recorded), access_type, count(*),
+             frecency_sum(
+               case access_type when 0 then write_weight
+                                when 1 then open_weight
+                                else close_weight end,
+               julianday(recorded) - 2440587.5, half_life)
+      from access_log, frecency_params group by file_id;
+    """),
+    ('0.1.dev5', '0.1.dev6', """
+    create table access_daily (
+      file_id integer not null references files (id),
+      day text not null,
+      access_type integer not null,
+      program text not null,
+      file_exists integer not null,
+      access_count integer not null,
+      recorded timestamp not null,
+      file_point integer,
+      primary key (file_id, day, access_type, program, file_exists)
+    );
+    create index access_daily_recorded on access_daily (recorded);
+    create index access_daily_program on access_daily (program, recorded);
+    create index access_daily_access_type
+      on access_daily (access_type, recorded);
+    """),
+    ('0.1.dev6', '0.1.dev7', """
+    create table access_log_new (
+      id integer primary key autoincrement,
+      file_id integer not null references files (id),
+      file_point integer,
+      file_exists integer not null default 1,
+      program text,
+      recorded integer,
+      access_type integer not null
+    );
+    insert into access_log_new
+        (id, file_id, file_point, file_exists, program, recorded,
+         access_type)
+      select id, file_id, file_point, file_exists, program, {log},
+             access_type
+      from access_log;
+    drop table access_log;
+    alter table access_log_new rename to access_log;
+    create index access_log_recorded
+      on access_log (recorded);
+    create index access_log_file_id_recorded
+      on access_log (file_id, recorded);
+    create index access_log_program_recorded
+      on access_log (program, recorded);
+    create index access_log_access_type_recorded
+      on access_log (access_type, recorded);
+
+    create table access_daily_new (
+      file_id integer not null references files (id),
+      day integer not null,
+      access_type integer not null,
+      program text not null,
+      file_exists integer not null,
+      access_count integer not null,
+      recorded integer not null,
+      file_point integer,
+      primary key (file_id, day, access_type, program, file_exists)
+    );
+    insert into access_daily_new
+      select file_id, cast(julianday(day) - 2440587.5 as integer),
+             access_type, program, file_exists, access_count, {daily},
+             file_point
+      from access_daily;
+    drop table access_daily;
+    alter table access_daily_new rename to access_daily;
+    create index access_daily_recorded on access_daily (recorded);
+    create index access_daily_program on access_daily (program, recorded);
+    create index access_daily_access_type
+      on access_daily (access_type, recorded);
+
+    create table latest_access_new (
+      file_id integer primary key references files (id),
+      file_point integer,
+      recorded integer,
+      access_type integer,
+      access_count integer not null default 0,
+      frecency real
+    );
+    insert into latest_access_new
+      select file_id, file_point, {latest}, access_type, access_count,
+             frecency
+      from latest_access;
+    drop table latest_access;
+    alter table latest_access_new rename to latest_access;
+    create index latest_access_recorded on latest_access (recorded);
+    create index latest_access_frecency on latest_access (frecency);
+
+    create trigger access_log_insert_latest after insert on access_log
+    begin
+      insert or ignore into latest_access (file_id) values (new.file_id);
+      update latest_access
+        set file_point = new.file_point, recorded = new.recorded,
+            access_type = new.access_type
+        where file_id = new.file_id and
+              (recorded is null or recorded <= new.recorded);
+      update latest_access
+        set access_count = access_count + 1,
+            frecency = (
+              select frecency_add(
+                latest_access.frecency,
+                case new.access_type when 0 then write_weight
+                                     when 1 then open_weight
+                                     else close_weight end,
+                new.recorded / 86400000000.0, half_life)
+              from frecency_params)
+        where file_id = new.file_id;
+    end;
+    """.format(log=_microseconds('access_log.recorded'),
+               daily=_microseconds('access_daily.recorded'),
+               latest=_microseconds('latest_access.recorded'))),
+    ('0.1.dev7', '0.1.dev8', """
+    drop trigger access_log_insert_latest;
+    """),
+]
+
+
+def get_schema_version(db):
+    (version,) = db.execute(
+        'SELECT schema_version FROM factlog_info').fetchone()
+    return version
+
+
+def iter_statements(script):
+    """
+    Split SQL `script` into statements.
+
+    Each statement must end at the end of a line.
+
+    >>> script = '''create table a (x);
+    ... create trigger t after insert on a begin
+    ...   delete from a;
+    ... end;'''
+    >>> for statement in iter_statements(script):
+    ...     print(statement)
+    create table a (x);
+    create trigger t after insert on a begin
+      delete from a;
+    end;
+    >>> len(list(iter_statements(script)))
+    2
+
+    """
+    statement = ''
+    for line in script.splitlines(True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement.strip()
+            statement = ''
+    if statement.strip():
+        yield statement.strip()
+
+
+def migrate(db, factlog_version):
+    """
+    Upgrade database to the newest schema in place.
+
+    :type               db: :class:`sqlite3.Connection`
+    :arg                db: connection to the database
+    :type  factlog_version: str
+    :arg   factlog_version: version of factlog doing the migration
+
+    :rtype: str
+    :return: new schema version
+
+    Each step is committed separately, so that an interrupted
+    migration can be resumed next time.  The schema version is read
+    after taking the write lock by ``BEGIN IMMEDIATE``, so that a
+    step is not applied twice when other processes are migrating the
+    same database.
+
+    """
+    steps = dict((old, (new, step)) for (old, new, step) in migrations)
+    newest = migrations[-1][1]
+    isolation_level = db.isolation_level
+    # Control transactions explicitly; the sqlite3 module may commit
+    # implicitly before DDL statements and scripts.
+    db.isolation_level = None
+    try:
+        while True:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                version = get_schema_version(db)
+                if version == newest:
+                    db.execute('COMMIT')
+                    return version
+                try:
+                    (new, step) = steps[version]
+                except KeyError:
+                    raise MigrationError(
+                        'do not know how to migrate from schema version {0}'
+                        .format(version))
+                if callable(step):
+                    step(db)
+                else:
+                    for statement in iter_statements(step):
+                        db.execute(statement)
+                db.execute(
+                    'UPDATE factlog_info SET schema_version = ?, '
+                    'factlog_version = ?, updated = current_timestamp',
+                    [new, factlog_version])
+                db.execute('COMMIT')
+            except BaseException:
+                try:
+                    db.execute('ROLLBACK')
+                except sqlite3.OperationalError:
+                    pass        # already rolled back by SQLite
+                raise
+    finally:
+        db.isolation_level = isolation_level
@@ -14,26 +14,36 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import os
 import sys
-import itertools
 
 from .config import ConfigStore
-from .database import DataBase
-from .utils.iterutils import interleave
+from . import trace
+from .utils.iterutils import chunked
+
+# Modules used only by some commands are imported in functions, so
+# that `factlog record` starts fast.  See also `record_fast`.
+
+RECORD_ACCESS_TYPES = ('write', 'open', 'close')
+"""Same as `DataBase.ACCESS_TYPES`, without importing the database."""
+
+OUTPUT_CHUNK_SIZE = 1000
+"""Number of paths written at once by `factlog list`."""
 
 
 def get_db(*args, **kwds):
+    from .database import DataBase
     config = ConfigStore(*args, **kwds)
     return DataBase(config.db_path)
 
 
 def record_add_arguments(parser):
     parser.add_argument(
-        'file_path',
+        'file_path', nargs='?',
         help="record an activity on this file.")
     parser.add_argument(
         '--access-type', '-a', default='write',
-        choices=DataBase.ACCESS_TYPES,
+        choices=RECORD_ACCESS_TYPES,
         help="how the file is accessed.")
     parser.add_argument(
         '--file-point', type=int,
@@ -41,23 +51,323 @@ def record_add_arguments(parser):
     parser.add_argument(
         '--program',
         help="program used for accessing file.")
+    parser.add_argument(
+        '--no-server', dest='use_server', action='store_false',
+        help="""
+        Write to the database directly even if `factlog serve`
+        is running.
+        """)
+    parser.add_argument(
+        '--stdin', action='store_true',
+        help="""
+        Read activities from stdin instead of FILE_PATH and record
+        them in bulk.  See --stdin-format.
+        """)
+    parser.add_argument(
+        '--stdin-format', default='nul', choices=('nul', 'json'),
+        help="""
+        'nul': NUL-separated file paths.  Options --access-type,
+        --file-point and --program are applied to all of them.
+        'json': one JSON object per line.  Keys are 'file_path',
+        'access_type', 'file_point', 'file_exists', 'program' and
+        'recorded' (UTC time such as '2013-01-23 12:34:56' or
+        microseconds since the epoch).
+        Only 'file_path' is required; the default of the other keys
+        are given by the command line options.
+        """)
+    trace.add_arguments(parser)
 
 
-def record_run(file_path, file_point, access_type, program):
+def record_run(file_path, file_point, access_type, program, use_server,
+               stdin, stdin_format):
     """
     Record activities on file.
+
+    If `factlog serve` is running, the activity is sent to the
+    server.  Otherwise, or if the server fails, it is written to the
+    database directly.  Activities given by --stdin are always written
+    directly.
     """
-    db = get_db()
-    db.record_file_log(
-        file_path, file_point=file_point, access_type=access_type,
-        program=program)
+    record = dict(file_point=file_point, access_type=access_type,
+                  program=program)
+    if stdin:
+        if file_path is not None:
+            sys.exit('factlog record: FILE_PATH cannot be used with --stdin')
+        readers = dict(nul=_iter_nul_separated, json=_iter_json_lines)
+        logs = readers[stdin_format](sys.stdin, record)
+        db = get_db()
+        with trace.span('record.insert') as span:
+            db.record_file_logs(span.input(logs))
+        return
+    if file_path is None:
+        sys.exit('factlog record: FILE_PATH or --stdin is required')
 
+    config = ConfigStore()
+    record.update(file_path=file_path)
+    # Importing socket is not free; skip it if no server is listening.
+    if use_server and os.path.exists(config.socket_path):
+        from .client import send_records, ServerError
+        try:
+            with trace.span('record.send'):
+                sent = send_records(config.socket_path, [record])
+        except (ServerError, EnvironmentError) as err:
+            # socket.error (including timeout) is an EnvironmentError.
+            sys.stderr.write(
+                'factlog record: server failed ({0}); '
+                'writing to the database directly\n'.format(err))
+            sent = False
+        if sent:
+            return
+    from .database import DataBase
+    db = DataBase(config.db_path)
+    with trace.span('record.insert'):
+        db.record_file_log(**record)
 
-def list_add_arguments(parser):
+
+def record_fast(args):
+    """
+    Run `factlog record` with `args` if it is simple enough.
+
+    Options other than --access-type, --file-point, --program and
+    --no-server are left to the argument parser, as well as invalid
+    values.  Return True if the activity is recorded.
+
+    >>> record_fast(['--stdin'])
+    False
+    >>> record_fast(['--file-point', 'x', 'README.rst'])
+    False
+
+    """
+    kwds = dict(file_path=None, file_point=None, access_type='write',
+                program=None, use_server=True)
+    options = {'--access-type': 'access_type', '-a': 'access_type',
+               '--file-point': 'file_point', '--program': 'program'}
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg == '--no-server':
+            kwds['use_server'] = False
+            continue
+        (name, eq, value) = arg.partition('=')
+        if name in options and name.startswith('--') and eq:
+            pass
+        elif arg in options and args:
+            (name, value) = (arg, args.pop(0))
+        elif not arg.startswith('-') and kwds['file_path'] is None:
+            kwds['file_path'] = arg
+            continue
+        else:
+            return False
+        kwds[options[name]] = value
+    if kwds['file_path'] is None or \
+       kwds['access_type'] not in RECORD_ACCESS_TYPES:
+        return False
+    if kwds['file_point'] is not None:
+        try:
+            kwds['file_point'] = int(kwds['file_point'])
+        except ValueError:
+            return False
+    record_run(stdin=False, stdin_format='nul', **kwds)
+    return True
+
+
+def _iter_nul_separated(file, defaults, bufsize=65536):
+    rest = ''
+    while True:
+        data = file.read(bufsize)
+        paths = (rest + data).split('\0')
+        rest = paths.pop()
+        for path in paths:
+            if path:
+                yield dict(defaults, file_path=path)
+        if not data:
+            break
+    if rest.strip('\n'):
+        yield dict(defaults, file_path=rest.strip('\n'))
+
+
+def _iter_json_lines(file, defaults):
+    import json
+    for (lineno, line) in enumerate(file, 1):
+        if line.strip():
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError('not an object')
+            except ValueError as err:
+                sys.exit('factlog record: invalid JSON at line {0} of '
+                         'stdin ({1}); activities before it are recorded'
+                         .format(lineno, err))
+            log = dict(defaults)
+            log.update(record)
+            yield log
+
+
+def serve_add_arguments(parser):
+    parser.add_argument(
+        '--commit-interval', type=float, default=5.0, metavar='MSEC',
+        help="""
+        Maximum time in milliseconds to wait for other records
+        before committing them in one transaction.
+        """)
+    parser.add_argument(
+        '--socket', dest='socket_path',
+        help="""
+        Path to the Unix domain socket to listen on.
+        Default is server.sock in the data directory.
+        """)
+
+
+def serve_run(commit_interval, socket_path):
+    """
+    Run a server which records activities sent by `factlog record`.
+
+    Records arriving within --commit-interval are committed in one
+    transaction, which is much cheaper than running `factlog record`
+    without server.
+
+    If the index of `factlog search` exists, it is refreshed after
+    write activities are committed.
+    """
+    import signal
+    from .database import DataBase
+    from .server import RecordServer
+    config = ConfigStore()
+    db = DataBase(config.db_path)
+    updater = None
+    if os.path.exists(config.search_path):
+        from .search import IndexUpdater
+        updater = IndexUpdater(db, config.search_path)
+    server = RecordServer(
+        db, socket_path or config.socket_path,
+        commit_interval=commit_interval / 1000.0,
+        on_commit=updater and updater.on_commit)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if updater:
+            updater.close()
+
+
+def _parse_weight(string):
     import argparse
+    try:
+        (atype, weight) = string.split('=', 1)
+        return (atype, float(weight))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'expected TYPE=WEIGHT but got {0!r}'.format(string))
+
+
+def rebuild_add_arguments(parser):
+    parser.add_argument(
+        '--half-life', type=float, metavar='DAYS',
+        help="""
+        Set half-life of frecency score (see `factlog list --sort`).
+        """)
+    parser.add_argument(
+        '--weight', type=_parse_weight, default=[], action='append',
+        metavar='TYPE=WEIGHT',
+        help="""
+        Set weight of an access of TYPE (write, open or close) in
+        frecency score.  This option can be called multiple times.
+        """)
+
+
+def rebuild_run(half_life, weight):
+    """
+    Rebuild tables derived from the access history.
+
+    Factlog keeps the last access and the frecency score of each file
+    in a separate table to make listing fast.  It is updated on every
+    record, so you need this command only if you modified the
+    database by other means or if you change parameters of frecency
+    score.  The parameters are printed after rebuilding.
+    """
+    db = get_db()
+    if half_life is None and not weight:
+        db.rebuild_latest_access()
+    else:
+        try:
+            db.set_frecency_params(half_life, dict(weight))
+        except ValueError as err:
+            sys.exit('factlog rebuild: {0}'.format(err))
+    params = db.get_frecency_params()
+    print('half_life: {0}'.format(params['half_life']))
+    for atype in RECORD_ACCESS_TYPES:
+        print('weight.{0}: {1}'.format(atype, params['weights'][atype]))
+
+
+def gc_add_arguments(parser):
+    parser.add_argument(
+        '--retention', type=float, default=365, metavar='DAYS',
+        help="""
+        Keep individual activities of this number of days.
+        """)
+    parser.add_argument(
+        '--batch-size', type=int, metavar='NUM',
+        help="""
+        Number of activities folded in one transaction.
+        """)
+
+
+def gc_run(retention, batch_size):
+    """
+    Compact old history.
+
+    Activities older than --retention days are folded into daily
+    counts per file, access type and program, and the database file
+    is shrunk.  `factlog list` and frecency score still take them
+    into account, but --no-unique lists each daily count once instead
+    of each activity.
+    """
+    try:
+        stats = get_db().gc(retention, batch_size)
+    except ValueError as err:
+        sys.exit('factlog gc: {0}'.format(err))
+    for key in ['folded', 'freed_pages']:
+        print('{0}: {1}'.format(key, stats[key]))
+
+
+def cache_add_arguments(parser):
+    parser.add_argument(
+        '--clear', action='store_true',
+        help="remove all cached titles and line indices.")
+
+
+def cache_run(clear):
+    """
+    Show statistics of the caches used by `factlog list`.
+
+    Titles (--title) and line indices of large files (--context) are
+    cached.
+    """
+    from .filecache import TitleCache, LineIndexCache
+    for cls in [TitleCache, LineIndexCache]:
+        with cls(ConfigStore().cache_path) as cache:
+            if clear:
+                cache.clear()
+            stats = cache.stats()
+        print('{0}:'.format(cls.table))
+        for key in ['rows', 'max_rows', 'hits', 'misses']:
+            print('  {0}: {1}'.format(key, stats[key]))
+
+
+def filter_add_arguments(parser):
+    """
+    Add arguments to select files, shared by `list` and `grep`.
+    """
+    from .database import DataBase
+    from .utils.timeutils import parse_time
     parser.add_argument(
         '--limit', '-l', type=int, default=20,
-        help="Maximum number of files to list.")
+        help="""
+        Maximum number of files to list.  0 means no limit; files
+        are streamed while the history is read.
+        """)
     parser.add_argument(
         '--access-type', '-a', dest='access_types',
         action='append', choices=DataBase.ACCESS_TYPES,
@@ -108,6 +418,49 @@ def list_add_arguments(parser):
         help="""
         Output paths relative to the one given by --under.
         """)
+    parser.add_argument(
+        '--sort', default='recency', choices=DataBase.SORT_ORDERS,
+        help="""
+        Order of files.  "recency" lists recently accessed files
+        first.  "frecency" ranks files by the number of accesses
+        weighted by recency; see `factlog rebuild` to tune it.
+        It cannot be used with --no-unique.
+        """)
+    parser.add_argument(
+        '--since', metavar='TIME', type=parse_time,
+        help="""
+        Include only activities at or after TIME.  TIME is UTC time
+        such as '2013-01-23' or '2013-01-23 12:34', or time before
+        now such as '30m', '12h', '2d' or '1w'.
+        """)
+    parser.add_argument(
+        '--until', metavar='TIME', type=parse_time,
+        help="""
+        Include only activities before TIME.  See --since.
+        """)
+
+
+def filter_search(db, limit, access_types, unique, include_glob,
+                  exclude_glob, file_exists, program, under, relative,
+                  sort, since, until):
+    """
+    Call :meth:`DataBase.search_file_log` with :func:`filter_add_arguments`.
+    """
+    if sort == 'frecency' and not unique:
+        sys.exit('factlog: --sort frecency cannot be used with --no-unique')
+    if limit < 0:
+        sys.exit('factlog: --limit must not be negative')
+    return db.search_file_log(
+        limit=limit or None, access_types=access_types, unique=unique,
+        include_glob=include_glob, exclude_glob=exclude_glob,
+        file_exists=file_exists, program=program,
+        under=under, relative=relative, sort=sort,
+        since=since, until=until)
+
+
+def list_add_arguments(parser):
+    import argparse
+    filter_add_arguments(parser)
     parser.add_argument(
         '--format',
         help="""
@@ -123,6 +476,13 @@ def list_add_arguments(parser):
         Python, reStructuredText, Markdown, Org-mode.
         It does not work with --line-number.
         """)
+    parser.add_argument(
+        '--no-cache', '--no-title-cache', dest='use_cache',
+        action='store_false',
+        help="""
+        Do not use the cache of titles and line indices.  They are
+        cached by path, modification time and size of the file.
+        """)
     parser.add_argument(
         '--line-number', action='store_true',
         help="""
@@ -150,6 +510,11 @@ def list_add_arguments(parser):
         Print NUM lines before and after the cursor line.
         It requires --line-number.
         """)
+    parser.add_argument(
+        '--jobs', '-j', type=int, default=8, metavar='NUM',
+        help="""
+        Number of threads to read files for --title and --context.
+        """)
     parser.add_argument(
         '--null', action='store_true',
         help="""
@@ -159,28 +524,44 @@ def list_add_arguments(parser):
     parser.add_argument(
         '--output', default='-', type=argparse.FileType('w'),
         help='file to write output. "-" means stdout.')
+    trace.add_arguments(parser)
 
 
 def list_run(
         limit, access_types, unique, include_glob, exclude_glob,
         file_exists, program,
-        under, relative, null, **kwds):
+        under, relative, sort, since, until, null, title, use_cache,
+        **kwds):
     """
     List recently accessed files.
     """
+    from .database import DataBase
     newline = '\0' if null else '\n'
-    db = get_db()
-    rows = db.search_file_log(
-        limit=limit, access_types=access_types, unique=unique,
-        include_glob=include_glob, exclude_glob=exclude_glob,
-        file_exists=file_exists, program=program,
-        under=under, relative=relative)
-    write_listed_rows(rows, newline, **kwds)
+    config = ConfigStore()
+    db = DataBase(config.db_path)
+    rows = filter_search(
+        db, limit, access_types, unique, include_glob, exclude_glob,
+        file_exists, program, under, relative, sort, since, until)
+    context = [kwds.get(k) for k in
+               ['before_context', 'after_context', 'context']]
+    if use_cache and title:
+        from .filecache import TitleCache
+        with TitleCache(config.cache_path) as cache:
+            write_listed_rows(rows, newline, title=title, get_title=cache,
+                              **kwds)
+    elif use_cache and any(n is not None for n in context):
+        from .filecache import LineIndexCache
+        with LineIndexCache(config.cache_path) as cache:
+            write_listed_rows(rows, newline, title=title, line_index=cache,
+                              **kwds)
+    else:
+        write_listed_rows(rows, newline, title=title, **kwds)
 
 
 def write_listed_rows(
         rows, newline, output, title,
-        before_context, after_context, context, **_):
+        before_context, after_context, context, get_title=None,
+        line_index=None, jobs=1, **_):
     r"""
     Write `rows` into `output`.
 
@@ -196,26 +577,81 @@ def write_listed_rows(
     :arg    after_context: print this number of line after the point
     :type         context: int or None
     :arg          context: print this number of line before and after the point
+    :type       get_title: function or None
+    :arg        get_title: function to get title from path, such as
+                           :class:`factlog.filecache.TitleCache`
+    :type      line_index: function or None
+    :arg       line_index: function to get line index from path, such as
+                           :class:`factlog.filecache.LineIndexCache`
+    :type            jobs: int
+    :arg             jobs: number of threads to read files
+
+    When files are read for titles or lines, they are read by `jobs`
+    threads concurrently but written in the order of `rows`.
 
     """
+    with trace.span('list.output') as span:
+        _write_listed_rows(
+            span.input(rows), newline, output, title,
+            before_context, after_context, context, get_title,
+            line_index, jobs)
+
+
+def _write_listed_rows(
+        rows, newline, output, title,
+        before_context, after_context, context, get_title,
+        line_index, jobs):
     nonnone = lambda x: x is not None
+    render = None
     if title:
-        for info in rows:
-            info.write_path_and_title(output, newline)
+        kwds = {} if get_title is None else dict(_get_title=get_title)
+        render = lambda info, file: info.write_path_and_title(
+            file, newline, **kwds)
     elif list(filter(nonnone, [before_context, after_context, context])):
         pre_lines = next(iter(filter(nonnone, [before_context, context, 0])))
         post_lines = next(iter(filter(nonnone, [after_context, context, 0])))
-        for info in rows:
-            info.write_paths_and_lines(output, pre_lines, post_lines,
-                                       newline)
+        render = lambda info, file: info.write_paths_and_lines(
+            file, pre_lines, post_lines, newline, line_index=line_index)
+    if render:
+        write_rendered(output, render, rows, jobs)
     else:
+        # One write per chunk; a write per path is slow for long lists.
         showpaths = (r.showpath for r in rows)
-        output.writelines(interleave(showpaths, itertools.repeat(newline)))
+        for chunk in chunked(showpaths, OUTPUT_CHUNK_SIZE):
+            chunk.append('')
+            output.write(newline.join(chunk))
     if output is not sys.stdout:
         output.close()
 
 
+def write_rendered(output, render, rows, jobs):
+    """
+    Write ``render(row, file)`` for each row to `output` in order.
+
+    Rows are rendered to in-memory files by `jobs` threads.  Output
+    is flushed whenever the next row is not rendered yet, so that the
+    first rows show up immediately.
+
+    """
+    from .utils.parallel import get_executor, imap_ordered
+    from .utils.py3compat import StringIO
+
+    def render_to_string(row):
+        file = StringIO()
+        render(row, file)
+        return file.getvalue()
+
+    with get_executor(jobs) as executor:
+        for chunk in imap_ordered(executor, render_to_string, rows,
+                                  window=jobs * 4, on_wait=output.flush):
+            output.write(chunk)
+
+
 commands = [
     ('record', record_add_arguments, record_run),
     ('list', list_add_arguments, list_run),
+    ('serve', serve_add_arguments, serve_run),
+    ('rebuild', rebuild_add_arguments, rebuild_run),
+    ('gc', gc_add_arguments, gc_run),
+    ('cache', cache_add_arguments, cache_run),
 ]
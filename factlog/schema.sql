@@ -14,16 +14,71 @@
 -- along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+drop table if exists files;
+create table files (
+  id integer primary key autoincrement,
+  path text not null unique
+);
+
+-- recorded is in microseconds since the Unix epoch (UTC).
 drop table if exists access_log;
 create table access_log (
   id integer primary key autoincrement,
-  file_path text not null,
+  file_id integer not null references files (id),
   file_point integer,
   file_exists integer not null default 1,
   program text,
-  recorded timestamp default current_timestamp,
+  recorded integer,
   access_type integer not null
 );
+create index access_log_recorded on access_log (recorded);
+create index access_log_file_id_recorded on access_log (file_id, recorded);
+create index access_log_program_recorded on access_log (program, recorded);
+create index access_log_access_type_recorded on access_log (access_type, recorded);
+
+-- Daily counts of old activities folded by `factlog gc`.  Program
+-- is '' if unknown, so that the primary key is unique.  day is days
+-- since the epoch.  recorded and file_point are of the last activity
+-- of the day.
+drop table if exists access_daily;
+create table access_daily (
+  file_id integer not null references files (id),
+  day integer not null,
+  access_type integer not null,
+  program text not null,
+  file_exists integer not null,
+  access_count integer not null,
+  recorded integer not null,
+  file_point integer,
+  primary key (file_id, day, access_type, program, file_exists)
+);
+create index access_daily_recorded on access_daily (recorded);
+create index access_daily_program on access_daily (program, recorded);
+create index access_daily_access_type
+  on access_daily (access_type, recorded);
+
+-- Last access of each file, updated per chunk of recorded activities.
+drop table if exists latest_access;
+create table latest_access (
+  file_id integer primary key references files (id),
+  file_point integer,
+  recorded integer,
+  access_type integer,
+  access_count integer not null default 0,
+  frecency real
+);
+create index latest_access_recorded on latest_access (recorded);
+create index latest_access_frecency on latest_access (frecency);
+
+-- Parameters of frecency score.  See factlog/frecency.py.
+drop table if exists frecency_params;
+create table frecency_params (
+  half_life real not null,
+  write_weight real not null,
+  open_weight real not null,
+  close_weight real not null
+);
+insert into frecency_params values (14.0, 1.0, 0.5, 0.0);
 
 drop table if exists factlog_info;
 create table factlog_info (
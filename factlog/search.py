@@ -0,0 +1,420 @@
+"""
+Full-text search in recently accessed files.
+
+`factlog search` keeps an SQLite FTS5 index of the names, titles and
+contents of the files in the history.  The index is built by the
+first `factlog search` and refreshed incrementally afterwards: only
+the files accessed since the last refresh are looked at, and they
+are read again only if their modification time or size changed.
+While `factlog serve` is running, it also refreshes the index after
+committing write activities, once the index exists.
+
+Matched files are ordered by full-text relevance (BM25) discounted by
+their position in `factlog list` with the same options, so that
+recently (or frecently) accessed files come first among similarly
+relevant ones.
+"""
+
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import sys
+import math
+import heapq
+import sqlite3
+import threading
+
+from .config import ConfigStore
+from . import trace
+from . import filetitle
+from .database import DataBase
+from .filecache import stat_key
+from .record import filter_add_arguments, filter_search, write_listed_rows
+from .utils import textfile
+
+
+class SearchUnavailable(Exception):
+    pass
+
+
+class SearchIndex(object):
+
+    """
+    Full-text index of files, stored in a SQLite database.
+
+    Each file is indexed with its modification time and size, and
+    :meth:`refresh` reads it again only when they are changed.
+    :meth:`update` refreshes the files accessed since the last update
+    according to a :class:`factlog.database.DataBase`.
+
+    The FTS5 table is contentless, so that the index does not keep a
+    copy of the files.  Since tokens of a contentless row cannot be
+    deleted without the original text, a changed file is indexed
+    under a new id and the old row is left unreachable.  The index is
+    rebuilt by :meth:`compact` when most rows are unreachable.
+
+    :raises SearchUnavailable: when SQLite is built without FTS5.
+
+    """
+
+    format_version = 1
+    """
+    Version of the tables.  An index of another version is discarded
+    and built again, since it is only a cache.
+    """
+
+    max_size = 4 * 1024 * 1024
+    """
+    Contents of files larger than this (in bytes) are not indexed.
+    """
+
+    commit_size = 1000
+    """
+    Number of files refreshed in one transaction by :meth:`update`.
+    """
+
+    weights = (10.0, 10.0, 1.0)
+    """
+    Weights of name, title and content for BM25.
+    """
+
+    def __init__(self, dbpath, timeout=5.0):
+        self.db = sqlite3.connect(dbpath, timeout=timeout)
+        self.db.execute('PRAGMA journal_mode = WAL')
+        (version,) = self.db.execute('PRAGMA user_version').fetchone()
+        try:
+            if version != self.format_version:
+                self.db.executescript("""
+                drop table if exists documents;
+                drop table if exists documents_fts;
+                drop table if exists index_state;
+                """)
+            # AUTOINCREMENT, so that ids of unreachable rows in
+            # documents_fts are never reused.
+            self.db.executescript("""
+            create table if not exists documents (
+              id integer primary key autoincrement,
+              path text not null unique,
+              mtime integer,
+              size integer
+            );
+            create virtual table if not exists documents_fts
+              using fts5 (name, title, content, content='');
+            create table if not exists index_state (
+              last_access_id integer,
+              unreachable integer not null
+            );
+            insert into index_state select null, 0
+              where not exists (select 1 from index_state);
+            PRAGMA user_version = {0};
+            """.format(self.format_version))
+        except sqlite3.OperationalError as err:
+            self.db.close()
+            raise SearchUnavailable(
+                'full-text search is not supported by this SQLite: {0}'
+                .format(err))
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def read_document(self, path):
+        """
+        Return ``(name, title, content)`` of the file at `path`.
+
+        Title is empty if the file type is not supported by
+        :mod:`factlog.filetitle`.  Content is empty for binary, too
+        large and unreadable files.
+
+        """
+        try:
+            title = filetitle.get_title(path) or ''
+        except (EnvironmentError, ValueError):
+            title = ''
+        content = ''
+        try:
+            with textfile.mapped_file(path, self.max_size) as data:
+                if data is not None:
+                    trace.add_bytes(len(data))
+                    content = data[:].decode('utf-8', 'replace')
+        except EnvironmentError:
+            pass
+        return (os.path.basename(path), title, content)
+
+    def refresh(self, path):
+        """
+        Index the file at `path` again if it is changed.
+
+        Files which do not exist anymore are removed from the index.
+        Return True if the index is changed.
+
+        """
+        key = stat_key(path)
+        row = self.db.execute(
+            'SELECT mtime, size FROM documents WHERE path = ?',
+            [path]).fetchone()
+        if row and key and tuple(row) == key:
+            return False
+        if row:
+            self.db.execute('DELETE FROM documents WHERE path = ?', [path])
+            self.db.execute(
+                'UPDATE index_state SET unreachable = unreachable + 1')
+        if key is None:
+            return bool(row)
+        document = self.read_document(path)
+        docid = self.db.execute(
+            'INSERT INTO documents (path, mtime, size) VALUES (?, ?, ?)',
+            [path, key[0], key[1]]).lastrowid
+        self.db.execute('INSERT INTO documents_fts '
+                        '(rowid, name, title, content) VALUES (?, ?, ?, ?)',
+                        [docid] + list(document))
+        return True
+
+    def compact(self):
+        """
+        Build the index again from the files, dropping unreachable rows.
+
+        It is done in one transaction, so that an interrupted
+        compaction does not lose indexed files.
+
+        """
+        paths = [r[0] for r in self.db.execute('SELECT path FROM documents')]
+        self.db.execute(
+            "INSERT INTO documents_fts (documents_fts) VALUES ('delete-all')")
+        self.db.execute('DELETE FROM documents')
+        self.db.execute('UPDATE index_state SET unreachable = 0')
+        for path in paths:
+            self.refresh(path)
+        self.db.commit()
+
+    def update(self, db):
+        """
+        Refresh files accessed since the last update and return the
+        number of changed files.
+
+        The first update indexes all files known to `db`.
+
+        :type db: :class:`factlog.database.DataBase`
+        :arg  db:
+
+        """
+        with trace.span('search.index') as span:
+            row = self.db.execute(
+                'SELECT last_access_id FROM index_state').fetchone()
+            (last_id, paths) = db.get_accessed_paths(row and row[0])
+            span.rows_in = len(paths)
+            changed = 0
+            for (i, path) in enumerate(paths, 1):
+                changed += self.refresh(path)
+                if i % self.commit_size == 0:
+                    self.db.commit()
+            self.db.execute('UPDATE index_state SET last_access_id = ?',
+                            [last_id])
+            self.db.commit()
+            span.rows_out = changed
+        (unreachable,) = self.db.execute(
+            'SELECT unreachable FROM index_state').fetchone()
+        if unreachable > self.commit_size:
+            (live,) = self.db.execute(
+                'SELECT COUNT(*) FROM documents').fetchone()
+            if unreachable > live:
+                with trace.span('search.compact') as span:
+                    span.rows_in = live
+                    self.compact()
+        return changed
+
+    def search(self, query):
+        """
+        Return a dict from path to relevance of files matching `query`.
+
+        `query` is in the FTS5 query syntax.  Larger relevance is
+        better.
+
+        :raises ValueError: when `query` is invalid.
+
+        """
+        with trace.span('search.fts') as span:
+            try:
+                rows = self.db.execute(
+                    'SELECT path, bm25(documents_fts, ?, ?, ?) '
+                    'FROM documents_fts '
+                    'JOIN documents ON documents.id = documents_fts.rowid '
+                    'WHERE documents_fts MATCH ?',
+                    list(self.weights) + [query]).fetchall()
+            except sqlite3.OperationalError as err:
+                raise ValueError('invalid query {0!r}: {1}'.format(query, err))
+            span.rows_out = len(rows)
+        return dict((path, -score) for (path, score) in rows)
+
+
+def rank_rows(rows, scores, limit=None):
+    """
+    Order `rows` by relevance in `scores` discounted by the position.
+
+    Rows of paths not in `scores` are dropped.  The relevance of the
+    row at (0-origin) position ``i`` is divided by ``log2(i + 2)``.
+    Only the first row of each path is used.  `rows` are read only
+    until the rest cannot be in the first `limit` rows.
+
+    >>> from collections import namedtuple
+    >>> Row = namedtuple('Row', ['path'])
+    >>> rows = map(Row, ['a', 'b', 'c', 'd', 'e'])
+    >>> ranked = rank_rows(rows, {'b': 1.0, 'c': 2.0, 'e': 1.0}, limit=2)
+    >>> [r.path for r in ranked]
+    ['c', 'b']
+
+    """
+    if not scores:
+        return []
+    best = max(scores.values())
+    seen = set()
+    heap = []
+    for (position, row) in enumerate(rows):
+        discount = math.log(position + 2, 2)
+        if limit and len(heap) == limit and heap[0][0] >= best / discount:
+            break
+        relevance = scores.get(row.path)
+        if relevance is None or row.path in seen:
+            continue
+        seen.add(row.path)
+        item = (relevance / discount, -position, row)
+        if limit and len(heap) == limit:
+            heapq.heappushpop(heap, item)
+        else:
+            heapq.heappush(heap, item)
+        if len(seen) == len(scores):
+            break
+    return [row for (_, _, row) in sorted(heap, reverse=True)]
+
+
+class IndexUpdater(object):
+
+    """
+    Update a :class:`SearchIndex` in a background thread.
+
+    Pass :meth:`on_commit` to :class:`factlog.server.RecordServer`.
+    Write activities committed while updating are handled by one
+    more update.
+
+    """
+
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+        self.closed = False
+        self.wakeup = threading.Event()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def on_commit(self, params_list):
+        write = DataBase.access_type_to_int['write']
+        if any(params[3] == write for params in params_list):
+            self.wakeup.set()
+
+    def _run(self):
+        with SearchIndex(self.path) as index:
+            while True:
+                self.wakeup.wait()
+                self.wakeup.clear()
+                if self.closed:
+                    return
+                try:
+                    index.update(self.db)
+                except Exception as err:
+                    sys.stderr.write(
+                        'factlog: failed to update search index: {0}\n'
+                        .format(err))
+
+    def close(self):
+        self.closed = True
+        self.wakeup.set()
+        self.thread.join()
+
+
+def search_add_arguments(parser):
+    import argparse
+    parser.add_argument(
+        'query', nargs='+',
+        help="""
+        Words to search.  Files containing all words match.  FTS5
+        query syntax such as "a phrase", OR, NOT and prefix* can be
+        used.
+        """)
+    filter_add_arguments(parser)
+    parser.add_argument(
+        '--title', action='store_true',
+        help="""
+        Output title of the file.  See `factlog list --title`.
+        """)
+    parser.add_argument(
+        '--no-update', dest='update', action='store_false',
+        help="""
+        Search without refreshing the index.
+        """)
+    parser.add_argument(
+        '--null', action='store_true',
+        help="""
+        Use the NULL character instead of newline for separating
+        files.
+        """)
+    parser.add_argument(
+        '--output', default='-', type=argparse.FileType('w'),
+        help='file to write output. "-" means stdout.')
+    trace.add_arguments(parser)
+
+
+def search_run(query, limit, update, title, null, output, **kwds):
+    """
+    Search QUERY in the name, title and content of accessed files.
+
+    The first run indexes all files in the history, which takes a
+    while.  Later runs index only files changed since then.  Files
+    are selected as in `factlog list` and ordered by relevance,
+    preferring files listed first.
+    """
+    if limit < 0:
+        sys.exit('factlog: --limit must not be negative')
+    config = ConfigStore()
+    db = DataBase(config.db_path)
+    try:
+        with SearchIndex(config.search_path) as index:
+            if update:
+                index.update(db)
+            scores = index.search(' '.join(query))
+    except (SearchUnavailable, ValueError) as err:
+        sys.exit('factlog: {0}'.format(err))
+    rows = rank_rows(filter_search(db, 0, **kwds), scores, limit or None)
+    newline = '\0' if null else '\n'
+    if title:
+        from .filecache import TitleCache
+        with TitleCache(config.cache_path) as cache:
+            write_listed_rows(rows, newline, output, title, None, None, None,
+                              get_title=cache)
+    else:
+        write_listed_rows(rows, newline, output, title, None, None, None)
+
+
+commands = [
+    ('search', search_add_arguments, search_run),
+]
@@ -0,0 +1,290 @@
+"""
+Record server which commits records from many clients in groups.
+
+Protocol: a client connects to the Unix domain socket, sends one JSON
+object per line (see :func:`factlog.client.encode_record`) and closes
+its writing end.  The server replies one line per record, ``ok`` or
+``error: MESSAGE``, after the record is committed to the database.
+Records arrived within `commit_interval` seconds are inserted in one
+transaction.
+"""
+
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import sys
+import json
+import time
+import errno
+import select
+import socket
+
+
+class ServerAlreadyRunning(Exception):
+    pass
+
+
+class Connection(object):
+
+    """
+    State of a connection from a client.
+    """
+
+    # Longest line (in bytes) a client can send.
+    max_line_length = 65536
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = b''
+        self.eof = False
+        # Reply for each received line.  None means "waiting for commit".
+        self.replies = []
+        # Replies not yet accepted by the (non-blocking) socket.
+        self.outbuf = b''
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def read_lines(self):
+        """
+        Read available data and return a list of complete lines.
+        """
+        try:
+            data = self.sock.recv(self.max_line_length)
+        except socket.error as err:
+            if err.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return []
+            raise
+        if not data:
+            self.eof = True
+            data = b'\n' if self.buffer else b''
+        self.buffer += data
+        lines = self.buffer.split(b'\n')
+        self.buffer = lines.pop()
+        if len(self.buffer) > self.max_line_length:
+            raise ValueError('line too long')
+        return lines
+
+    def waiting(self):
+        return None in self.replies
+
+    def send_replies(self, status=None):
+        """
+        Send replies, filling records waiting for commit with `status`.
+
+        Replies the socket cannot accept now are kept in
+        :attr:`outbuf` and sent by :meth:`send_pending` later.
+
+        """
+        replies = [status if r is None else r for r in self.replies]
+        self.replies = []
+        self.outbuf += ''.join(r + '\n' for r in replies).encode('utf-8')
+        self.send_pending()
+
+    def send_pending(self):
+        """
+        Send as much of :attr:`outbuf` as possible without blocking.
+        """
+        if not self.outbuf:
+            return
+        try:
+            sent = self.sock.send(self.outbuf)
+        except socket.error as err:
+            if err.errno not in (errno.EAGAIN, errno.EWOULDBLOCK,
+                                 errno.EINTR):
+                raise
+            sent = 0
+        self.outbuf = self.outbuf[sent:]
+
+    def finished(self):
+        """True if the client sent everything and got all replies."""
+        return self.eof and not self.replies and not self.outbuf
+
+    def close(self):
+        self.sock.close()
+
+
+class RecordServer(object):
+
+    """
+    Accept records from clients and commit them in groups.
+
+    :type               db: :class:`factlog.database.DataBase`
+    :arg                db: database to record
+    :type      socket_path: str
+    :arg       socket_path: path to the Unix domain socket
+    :type  commit_interval: float
+    :arg   commit_interval: maximum seconds to wait before commit
+    :type        on_commit: function or None
+    :arg         on_commit: called with the list of committed records
+                            (see :meth:`DataBase._file_log_params`)
+
+    Client sockets are non-blocking, so that a client not reading
+    its replies does not stall the others.
+
+    """
+
+    def __init__(self, db, socket_path, commit_interval=0.005,
+                 on_commit=None):
+        self.db = db
+        self.socket_path = socket_path
+        self.commit_interval = commit_interval
+        self.on_commit = on_commit
+        self.listener = None
+        self.connections = []
+        self.pending = []
+        self.deadline = None
+
+    def bind(self):
+        if os.path.exists(self.socket_path):
+            self._remove_stale_socket()
+        self.listener = sock = socket.socket(
+            socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.socket_path)
+        sock.listen(128)
+
+    def _remove_stale_socket(self):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except socket.error as err:
+            if err.errno not in (errno.ECONNREFUSED, errno.ENOENT):
+                raise
+            os.remove(self.socket_path)
+        else:
+            raise ServerAlreadyRunning(
+                'server is already listening at {0}'.format(self.socket_path))
+        finally:
+            probe.close()
+
+    def close(self):
+        for conn in self.connections:
+            conn.close()
+        self.connections = []
+        if self.listener:
+            self.listener.close()
+            self.listener = None
+            os.remove(self.socket_path)
+
+    def serve_forever(self):
+        """
+        Bind the socket and handle requests until interrupted.
+        """
+        self.bind()
+        try:
+            while True:
+                self.handle_events()
+        finally:
+            self.flush()
+            self.close()
+
+    def handle_events(self):
+        """
+        Wait for clients, read records and commit if it is time to.
+        """
+        if self.deadline is None:
+            timeout = None
+        else:
+            timeout = max(0, self.deadline - time.time())
+        # Connections at EOF would be always readable.
+        reading = [c for c in self.connections if not c.eof]
+        sending = [c for c in self.connections if c.outbuf]
+        (readable, writable, _) = select.select(
+            [self.listener] + reading, sending, [], timeout)
+        for obj in readable:
+            if obj is self.listener:
+                self._accept()
+            elif obj in self.connections:
+                self._read(obj)
+        for conn in writable:
+            if conn in self.connections:
+                self._send(conn)
+        if self.deadline is not None and time.time() >= self.deadline:
+            self.flush()
+
+    def _accept(self):
+        (sock, _) = self.listener.accept()
+        sock.setblocking(False)
+        self.connections.append(Connection(sock))
+
+    def _read(self, conn):
+        try:
+            lines = conn.read_lines()
+        except (socket.error, ValueError):
+            self._drop(conn)
+            return
+        for line in lines:
+            conn.replies.append(self._parse(conn, line))
+        if conn.eof and not conn.waiting():
+            self._send(conn, replies=True)
+
+    def _parse(self, conn, line):
+        try:
+            message = json.loads(line.decode('utf-8'))
+            params = self.db._file_log_params(**message)
+        except (ValueError, TypeError) as err:
+            return 'error: {0}'.format(err)
+        if self.deadline is None:
+            self.deadline = time.time() + self.commit_interval
+        self.pending.append(params)
+        return None
+
+    def _send(self, conn, replies=False, status=None):
+        """
+        Send pending output (and `replies` if true) of `conn`.
+
+        The connection is closed when it is finished or broken.
+
+        """
+        try:
+            if replies:
+                conn.send_replies(status)
+            else:
+                conn.send_pending()
+        except socket.error:
+            self._drop(conn)
+            return
+        if conn.finished():
+            self._drop(conn)
+
+    def _drop(self, conn):
+        self.connections.remove(conn)
+        conn.close()
+
+    def flush(self):
+        """
+        Commit pending records and send replies to waiting clients.
+        """
+        self.deadline = None
+        if not self.pending:
+            return
+        (pending, self.pending) = (self.pending, [])
+        try:
+            self.db._record_file_log_params(pending)
+            status = 'ok'
+        except Exception as err:
+            status = 'error: {0}'.format(err)
+        else:
+            if self.on_commit:
+                try:
+                    self.on_commit(pending)
+                except Exception as err:
+                    sys.stderr.write(
+                        'factlog serve: on_commit failed: {0}\n'.format(err))
+        for conn in list(self.connections):
+            if conn.waiting():
+                self._send(conn, replies=True, status=status)
@@ -16,6 +16,7 @@
 
 import unittest
 import textwrap
+import datetime
 import io
 
 from ..utils.py3compat import PY3
@@ -33,7 +34,7 @@ class MockedAccessInfo(AccessInfo):
         self._title = title
         self._lines_at_point = lines_at_point
 
-    def _get_lines_at_point(self, *args):
+    def _get_lines_at_point(self, *args, **kwds):
         self._get_lines_at_point_args = args
         return self._lines_at_point
 
@@ -54,6 +55,12 @@ class TestAccessInfo(unittest.TestCase):
         self.info = MockedAccessInfo('PATH')
         self.output = self.OutputIO()
 
+    def test_recorded(self):
+        info = AccessInfo('PATH', 0, 86400 * 10 ** 6 + 1, 'write')
+        self.assertEqual(info.recorded,
+                         datetime.datetime(1970, 1, 2, 0, 0, 0, 1))
+        self.assertIs(info.recorded, info.recorded)
+
     def test_write_paths_and_lines(self):
         pre_lines = 2
         post_lines = 3
@@ -0,0 +1,170 @@
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import asyncio
+    from ..asyncdb import AsyncDataBase
+except (ImportError, SyntaxError):
+    AsyncDataBase = None
+
+from ..database import DataBase
+
+
+@unittest.skipIf(AsyncDataBase is None, 'requires Python 3.5 or later')
+class TestAsyncDataBase(unittest.TestCase):
+
+    def setUp(self):
+        self.rootdir = tempfile.mkdtemp(prefix='factlog-test-')
+        self.dbpath = os.path.join(self.rootdir, 'db.sqlite')
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.adb = AsyncDataBase(self.dbpath)
+        self.paths = [os.path.join(self.rootdir, str(i)) for i in range(10)]
+
+    def tearDown(self):
+        self.run_async(self.adb.close())
+        self.loop.close()
+        asyncio.set_event_loop(None)
+        shutil.rmtree(self.rootdir)
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def collect(self, aiter):
+        rows = []
+        while True:
+            try:
+                rows.append(self.run_async(aiter.__anext__()))
+            except StopAsyncIteration:
+                return rows
+
+    def record_many(self, paths):
+        return self.run_async(asyncio.gather(*[
+            self.adb.record_file_log(p, 'write', program='test')
+            for p in paths]))
+
+    def test_record_in_batch(self):
+        calls = []
+        orig = DataBase.record_file_logs
+
+        def record_file_logs(db, logs):
+            calls.append(len(logs))
+            return orig(db, logs)
+
+        DataBase.record_file_logs = record_file_logs
+        try:
+            self.record_many(self.paths)
+        finally:
+            DataBase.record_file_logs = orig
+        self.assertEqual(sum(calls), len(self.paths))
+        self.assertLess(len(calls), len(self.paths))
+        rows = DataBase(self.dbpath).search_file_log(
+            100, only_existing=False)
+        self.assertEqual(sorted(i.path for i in rows), sorted(self.paths))
+
+    def test_search_same_as_sync(self):
+        self.record_many(self.paths)
+        self.adb.search_chunk_size = 3
+        kwds = dict(only_existing=False, program=['test'],
+                    include_glob=['*[0-5]'])
+        rows = self.collect(self.adb.search_file_log(4, **kwds))
+        expected = DataBase(self.dbpath).search_file_log(4, **kwds)
+        self.assertEqual([i.path for i in rows], [i.path for i in expected])
+        self.assertEqual(len(rows), 4)
+
+    def test_concurrent_searches(self):
+        self.record_many(self.paths)
+        self.adb.search_chunk_size = 2
+        searches = [
+            self.adb.search_file_log(10, only_existing=False),
+            self.adb.search_file_log(10, only_existing=False,
+                                     include_glob=['*[0-4]'])]
+        results = [[], []]
+        for _ in range(5):
+            rows = self.run_async(asyncio.gather(
+                *[s.__anext__() for s in searches]))
+            for (result, info) in zip(results, rows):
+                result.append(info.path)
+        results[0].extend(i.path for i in self.collect(searches[0]))
+        self.assertEqual(self.collect(searches[1]), [])
+        self.assertEqual(sorted(results[0]), sorted(self.paths))
+        self.assertEqual(sorted(results[1]), sorted(self.paths[:5]))
+
+    def test_aclose(self):
+        self.record_many(self.paths)
+        self.adb.search_chunk_size = 2
+        search = self.adb.search_file_log(10, only_existing=False)
+        self.run_async(search.__anext__())
+        self.run_async(search.aclose())
+        self.assertEqual(self.collect(search), [])
+
+    def test_break_early(self):
+        import sqlite3
+        import threading
+        self.record_many(self.paths)
+        self.adb.search_chunk_size = 2
+        released = []
+        orig = DataBase.search_file_log
+
+        def search_file_log(db, **kwds):
+            try:
+                for info in orig(db, **kwds):
+                    yield info
+            finally:
+                released.append(threading.current_thread())
+
+        DataBase.search_file_log = search_file_log
+        try:
+            search = self.adb.search_file_log(None, only_existing=False)
+            self.run_async(search.__anext__())
+        finally:
+            DataBase.search_file_log = orig
+        # Dropped without aclose() in the event loop thread.
+        del search
+        self.record_many(self.paths[:1])
+        # The search may be dropped by the database thread; wait for
+        # the release queued then.
+        self.run_async(self.adb.rebuild_latest_access())
+        self.assertEqual(len(released), 1)
+        self.assertIsNot(released[0], threading.current_thread())
+        db = sqlite3.connect(self.dbpath)
+        try:
+            (busy, _, _) = db.execute(
+                'PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+        finally:
+            db.close()
+        self.assertEqual(busy, 0)
+
+    def test_invalid_access_type(self):
+        self.assertRaises(ValueError, self.run_async,
+                          self.adb.record_file_log('a', 'unknown'))
+
+    def test_cancel_flush(self):
+        records = [asyncio.ensure_future(
+            self.adb.record_file_log(p, 'write'), loop=self.loop)
+            for p in self.paths[:2]]
+        self.run_async(asyncio.sleep(0))
+        self.adb._flushing.cancel()
+        for record in records:
+            self.assertRaises(asyncio.CancelledError, self.run_async,
+                              asyncio.wait_for(record, 5))
+        self.assertIsNone(self.adb._flushing)
+        self.assertEqual(self.adb._pending, [])
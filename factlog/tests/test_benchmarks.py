@@ -0,0 +1,72 @@
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import io
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from ..benchmarks import suite, compare
+from ..benchmarks.history import History
+from ..utils.py3compat import StringIO
+
+
+class TestBenchmarkSuite(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='factlog-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def run_suite(self, benchmarks):
+        # Results are written as native strings, like to sys.stdout.
+        output = StringIO()
+        suite.run(self.tmpdir, events=500, num_files=100, corpus_files=10,
+                  seed=0, limit=5, jobs=2, repeat=1, benchmarks=benchmarks,
+                  output=output)
+        return [json.loads(l) for l in output.getvalue().splitlines()]
+
+    def test_run(self):
+        results = self.run_suite(suite.BENCHMARKS)
+        self.assertEqual(results[0]['benchmark'], 'meta')
+        benchmarks = set(r['benchmark'] for r in results[1:])
+        self.assertEqual(benchmarks, set(suite.BENCHMARKS) | set(['corpus']))
+        self.assertTrue(all(r['seconds'] >= 0 for r in results[1:]))
+        rendered = [r for r in results if r['benchmark'] == 'render']
+        self.assertEqual(len(rendered), 4)
+        self.assertTrue(all(r['rows'] > 0 for r in rendered))
+
+    def test_reuse_workdir(self):
+        self.run_suite(['list'])
+        results = self.run_suite(['list'])
+        self.assertNotIn('corpus', [r['benchmark'] for r in results])
+
+        old = compare.load_results(io.StringIO(
+            u'\n'.join(json.dumps(r) for r in results)))
+        self.assertEqual(
+            set(r for (_, _, _, r) in compare.compare(old, old)),
+            set([1.0]))
+
+    def test_corpus(self):
+        history = History(num_files=10, root=self.tmpdir)
+        history.write_corpus(5, paragraphs=(1, 2), large_every=3,
+                             large_paragraphs=100)
+        sizes = [os.path.getsize(history.path(i)) for i in range(5)]
+        self.assertFalse(os.path.exists(history.path(5)))
+        self.assertGreater(sizes[2], max(sizes[:2]))
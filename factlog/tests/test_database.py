@@ -15,9 +15,11 @@
 
 
 import os
+import datetime
 import unittest
 
 from ..database import DataBase
+from ..utils.timeutils import to_microseconds
 
 
 def setdefaults(d, **kwds):
@@ -33,16 +35,15 @@ class TestDataBaseScript(unittest.TestCase):
     def script_search_file_log(cls, limit, **kwds):
         setdefaults(kwds, access_types=None, unique=True,
                     include_glob=[], exclude_glob=[],
-                    file_exists=None, program=[])
+                    file_exists=None, program=[], path_ranges=[])
         return cls.dbclass._script_search_file_log(limit, **kwds)
 
     def test_script_search_file_log_simple(self):
         (sql, params) = self.script_search_file_log(50)
         self.assertEqual(
             sql,
-            'SELECT file_path, file_point, MAX(recorded), access_type '
-            'FROM access_log '
-            'GROUP BY file_path '
+            'SELECT path, file_point, recorded, access_type '
+            'FROM latest_access JOIN files ON files.id = file_id '
             'ORDER BY recorded DESC LIMIT ?')
         self.assertEqual(
             params,
@@ -55,12 +56,17 @@ class TestDataBaseScript(unittest.TestCase):
             50, access_types=atypes)
         self.assertEqual(
             sql,
-            'SELECT file_path, file_point, MAX(recorded), access_type '
-            'FROM access_log '
+            'SELECT path, file_point, MAX(recorded), access_type FROM ('
+            'SELECT file_id, path, file_point, MAX(recorded) AS recorded, '
+            'access_type FROM access_log JOIN files ON files.id = file_id '
             'WHERE access_type in (?) '
-            'GROUP BY file_path '
-            'ORDER BY recorded DESC LIMIT ?')
-        self.assertEqual(params, aints + [50])
+            'GROUP BY file_id UNION ALL '
+            'SELECT file_id, path, file_point, MAX(recorded) AS recorded, '
+            'access_type FROM access_daily JOIN files ON files.id = file_id '
+            'WHERE access_type in (?) '
+            'GROUP BY file_id) '
+            'GROUP BY file_id ORDER BY recorded DESC LIMIT ?')
+        self.assertEqual(params, aints * 2 + [50])
 
     def test_script_search_file_log_write_or_open(self):
         atypes = ['write', 'open']
@@ -69,22 +75,26 @@ class TestDataBaseScript(unittest.TestCase):
             50, access_types=atypes)
         self.assertEqual(
             sql,
-            'SELECT file_path, file_point, MAX(recorded), access_type '
-            'FROM access_log '
+            'SELECT path, file_point, MAX(recorded), access_type FROM ('
+            'SELECT file_id, path, file_point, MAX(recorded) AS recorded, '
+            'access_type FROM access_log JOIN files ON files.id = file_id '
             'WHERE access_type in (?, ?) '
-            'GROUP BY file_path '
-            'ORDER BY recorded DESC LIMIT ?')
-        self.assertEqual(params, aints + [50])
+            'GROUP BY file_id UNION ALL '
+            'SELECT file_id, path, file_point, MAX(recorded) AS recorded, '
+            'access_type FROM access_daily JOIN files ON files.id = file_id '
+            'WHERE access_type in (?, ?) '
+            'GROUP BY file_id) '
+            'GROUP BY file_id ORDER BY recorded DESC LIMIT ?')
+        self.assertEqual(params, aints * 2 + [50])
 
     def test_script_search_file_log_include_glob(self):
         (sql, params) = self.script_search_file_log(
             50, include_glob=['*.py', '*.el'])
         self.assertEqual(
             sql,
-            'SELECT file_path, file_point, MAX(recorded), access_type '
-            'FROM access_log '
-            'WHERE (glob(?, file_path) OR glob(?, file_path)) '
-            'GROUP BY file_path '
+            'SELECT path, file_point, recorded, access_type '
+            'FROM latest_access JOIN files ON files.id = file_id '
+            'WHERE (glob(?, path) OR glob(?, path)) '
             'ORDER BY recorded DESC LIMIT ?')
         self.assertEqual(params, ['*.py', '*.el', 50])
 
@@ -93,10 +103,9 @@ class TestDataBaseScript(unittest.TestCase):
             50, exclude_glob=['*.py', '*.el'])
         self.assertEqual(
             sql,
-            'SELECT file_path, file_point, MAX(recorded), access_type '
-            'FROM access_log '
-            'WHERE NOT glob(?, file_path) AND NOT glob(?, file_path) '
-            'GROUP BY file_path '
+            'SELECT path, file_point, recorded, access_type '
+            'FROM latest_access JOIN files ON files.id = file_id '
+            'WHERE NOT glob(?, path) AND NOT glob(?, path) '
             'ORDER BY recorded DESC LIMIT ?')
         self.assertEqual(params, ['*.py', '*.el', 50])
 
@@ -105,11 +114,10 @@ class TestDataBaseScript(unittest.TestCase):
             50, include_glob=['*.py', '*.el'], exclude_glob=['/home/*'])
         self.assertEqual(
             sql,
-            'SELECT file_path, file_point, MAX(recorded), access_type '
-            'FROM access_log '
-            'WHERE (glob(?, file_path) OR glob(?, file_path)) '
-            'AND NOT glob(?, file_path) '
-            'GROUP BY file_path '
+            'SELECT path, file_point, recorded, access_type '
+            'FROM latest_access JOIN files ON files.id = file_id '
+            'WHERE (glob(?, path) OR glob(?, path)) '
+            'AND NOT glob(?, path) '
             'ORDER BY recorded DESC LIMIT ?')
         self.assertEqual(params, ['*.py', '*.el', '/home/*', 50])
 
@@ -118,41 +126,146 @@ class TestDataBaseScript(unittest.TestCase):
             50, unique=False)
         self.assertEqual(
             sql,
-            'SELECT file_path, file_point, recorded, access_type '
-            'FROM access_log '
+            'SELECT * FROM (SELECT path, file_point, recorded, access_type '
+            'FROM access_log JOIN files ON files.id = file_id '
+            'ORDER BY recorded DESC LIMIT ?) UNION ALL '
+            'SELECT * FROM (SELECT path, file_point, recorded, access_type '
+            'FROM access_daily JOIN files ON files.id = file_id '
+            'ORDER BY recorded DESC LIMIT ?) '
             'ORDER BY recorded DESC LIMIT ?')
-        self.assertEqual(params, [50])
+        self.assertEqual(params, [50, 50, 50])
 
     def test_script_search_file_log_exists(self):
         (sql, params) = self.script_search_file_log(
             50, file_exists=True)
         self.assertEqual(
             sql,
-            'SELECT file_path, file_point, MAX(recorded), access_type '
-            'FROM access_log '
+            'SELECT path, file_point, MAX(recorded), access_type FROM ('
+            'SELECT file_id, path, file_point, MAX(recorded) AS recorded, '
+            'access_type FROM access_log JOIN files ON files.id = file_id '
             'WHERE file_exists = ? '
-            'GROUP BY file_path '
-            'ORDER BY recorded DESC LIMIT ?')
-        self.assertEqual(params, [True, 50])
+            'GROUP BY file_id UNION ALL '
+            'SELECT file_id, path, file_point, MAX(recorded) AS recorded, '
+            'access_type FROM access_daily JOIN files ON files.id = file_id '
+            'WHERE file_exists = ? '
+            'GROUP BY file_id) '
+            'GROUP BY file_id ORDER BY recorded DESC LIMIT ?')
+        self.assertEqual(params, [True, True, 50])
 
     def test_script_search_file_log_program(self):
         (sql, params) = self.script_search_file_log(
             50, program=['emacs', 'vim'])
         self.assertEqual(
             sql,
-            'SELECT file_path, file_point, MAX(recorded), access_type '
-            'FROM access_log '
+            'SELECT path, file_point, MAX(recorded), access_type FROM ('
+            'SELECT file_id, path, file_point, MAX(recorded) AS recorded, '
+            'access_type FROM access_log JOIN files ON files.id = file_id '
+            'WHERE (program = ? OR program = ?) '
+            'GROUP BY file_id UNION ALL '
+            'SELECT file_id, path, file_point, MAX(recorded) AS recorded, '
+            'access_type FROM access_daily JOIN files ON files.id = file_id '
             'WHERE (program = ? OR program = ?) '
-            'GROUP BY file_path '
+            'GROUP BY file_id) '
+            'GROUP BY file_id ORDER BY recorded DESC LIMIT ?')
+        self.assertEqual(params, ['emacs', 'vim'] * 2 + [50])
+
+    def test_script_search_file_log_path_ranges(self):
+        (sql, params) = self.script_search_file_log(
+            50, include_glob=['*.py'],
+            path_ranges=[('/a/', '/a0'), ('/b/', '/b0')])
+        self.assertEqual(
+            sql,
+            'SELECT path, file_point, recorded, access_type '
+            'FROM latest_access JOIN files ON files.id = file_id '
+            'WHERE (glob(?, path)) '
+            'AND ((path >= ? AND path < ?) OR (path >= ? AND path < ?)) '
+            'ORDER BY recorded DESC LIMIT ?')
+        self.assertEqual(params, ['*.py', '/a/', '/a0', '/b/', '/b0', 50])
+
+    def test_script_search_file_log_offset(self):
+        (sql, params) = self.script_search_file_log(
+            50, unique=False, offset=100)
+        self.assertEqual(
+            sql,
+            'SELECT * FROM (SELECT path, file_point, recorded, access_type '
+            'FROM access_log JOIN files ON files.id = file_id '
+            'ORDER BY recorded DESC LIMIT ?) UNION ALL '
+            'SELECT * FROM (SELECT path, file_point, recorded, access_type '
+            'FROM access_daily JOIN files ON files.id = file_id '
+            'ORDER BY recorded DESC LIMIT ?) '
+            'ORDER BY recorded DESC LIMIT ? OFFSET ?')
+        self.assertEqual(params, [150, 150, 50, 100])
+
+    def test_script_search_file_log_frecency(self):
+        (sql, params) = self.script_search_file_log(
+            50, include_glob=['*.py'], sort='frecency')
+        self.assertEqual(
+            sql,
+            'SELECT path, file_point, recorded, access_type '
+            'FROM latest_access JOIN files ON files.id = file_id '
+            'WHERE (glob(?, path)) '
+            'ORDER BY frecency DESC LIMIT ?')
+        self.assertEqual(params, ['*.py', 50])
+
+    def test_script_search_file_log_frecency_program(self):
+        (sql, params) = self.script_search_file_log(
+            50, program=['emacs'], access_types=['write'],
+            exclude_glob=['*.py'], sort='frecency')
+        self.assertEqual(
+            sql,
+            'SELECT path, file_point, recorded, access_type '
+            'FROM latest_access JOIN files ON files.id = file_id '
+            'WHERE NOT glob(?, path) '
+            'AND (EXISTS (SELECT 1 FROM access_log '
+            'WHERE access_log.file_id = latest_access.file_id '
+            'AND access_type in (?) AND (program = ?)) '
+            'OR EXISTS (SELECT 1 FROM access_daily '
+            'WHERE access_daily.file_id = latest_access.file_id '
+            'AND access_type in (?) AND (program = ?))) '
+            'ORDER BY frecency DESC LIMIT ?')
+        self.assertEqual(params, ['*.py', 0, 'emacs', 0, 'emacs', 50])
+
+    def test_script_search_file_log_since(self):
+        (sql, params) = self.script_search_file_log(50, since=1000)
+        self.assertEqual(
+            sql,
+            'SELECT path, file_point, recorded, access_type '
+            'FROM latest_access JOIN files ON files.id = file_id '
+            'WHERE recorded >= ? '
             'ORDER BY recorded DESC LIMIT ?')
-        self.assertEqual(params, ['emacs', 'vim', 50])
+        self.assertEqual(params, [1000, 50])
+
+    def test_script_search_file_log_since_until(self):
+        (sql, params) = self.script_search_file_log(
+            50, program=['emacs'], since=1000, until=2000)
+        where = 'WHERE (program = ?) AND recorded >= ? AND recorded < ? '
+        self.assertIn('FROM access_log JOIN files ON files.id = file_id '
+                      + where, sql)
+        self.assertIn('FROM access_daily JOIN files ON files.id = file_id '
+                      + where, sql)
+        self.assertEqual(params, ['emacs', 1000, 2000] * 2 + [50])
+
+    def test_script_search_file_log_frecency_since(self):
+        (sql, params) = self.script_search_file_log(
+            50, since=1000, sort='frecency')
+        self.assertEqual(
+            sql,
+            'SELECT path, file_point, recorded, access_type '
+            'FROM latest_access JOIN files ON files.id = file_id '
+            'WHERE recorded >= ? '
+            'ORDER BY frecency DESC LIMIT ?')
+        self.assertEqual(params, [1000, 50])
+
+    def test_script_search_file_log_frecency_no_unique(self):
+        self.assertRaises(ValueError, self.script_search_file_log,
+                          50, unique=False, sort='frecency')
 
 
 class InMemoryDataBase(DataBase):
 
     def __init__(self):
-        import sqlite3
-        db = sqlite3.connect(':memory:')
+        self.dbpath = ':memory:'
+        db = self._connect()
         self._get_db = lambda: db
         self._init_db()
 
@@ -185,10 +298,10 @@ class TestInMemoryDataBase(unittest.TestCase):
         rows = self.search_file_log()
         self.assertEqual(
             [i.path for i in rows],
-            self.paths[:3])
+            self.paths[2::-1])
         self.assertEqual(
             [i.type for i in rows],
-            ['write', 'open', 'close'])
+            ['close', 'open', 'write'])
 
     def test_record_file_point(self):
         atype = 'write'
@@ -242,30 +355,30 @@ class TestInMemoryDataBase(unittest.TestCase):
         under = [self.root_a]
         paths_a = self.paths_a
         rows = self.search_file_log(under=under)
-        self.assertEqual([i.showpath for i in rows], paths_a)
+        self.assertEqual([i.showpath for i in rows], paths_a[::-1])
 
     def test_search_relative(self):
         self.setup_search_under()
         under = [self.root_a]
         paths_a = [os.path.relpath(p, self.root_a) for p in self.paths_a]
         rows = self.search_file_log(under=under, relative=True)
-        self.assertEqual([i.showpath for i in rows], paths_a)
+        self.assertEqual([i.showpath for i in rows], paths_a[::-1])
 
     def test_search_include_glob(self):
         self.setup_search_under()
-        paths = self.paths_a
+        paths = self.paths_a[::-1]
         rows = self.search_file_log(include_glob=['*ROOT-A*'])
         self.assertEqual([i.showpath for i in rows], paths)
 
     def test_search_exclude_glob(self):
         self.setup_search_under()
-        paths = self.paths_a
+        paths = self.paths_a[::-1]
         rows = self.search_file_log(exclude_glob=['*ROOT-B*'])
         self.assertEqual([i.showpath for i in rows], paths)
 
     def test_search_complex_glob(self):
         self.setup_search_under()
-        paths = self.paths_a[1:]
+        paths = self.paths_a[:0:-1]
         rows = self.search_file_log(
             include_glob=['*DUMMY*', '*ROOT*'],
             exclude_glob=['*ROOT-B*', '*0'])
@@ -295,6 +408,400 @@ class TestInMemoryDataBase(unittest.TestCase):
         self.assertEqual(len(rows), 1)
         self.assertEqual(rows[0].path, self.paths[1])
         rows = self.search_file_log(program=['emacs', 'less'])
-        self.assertEqual([i.showpath for i in rows], self.paths[:2])
+        self.assertEqual([i.showpath for i in rows], self.paths[1::-1])
         rows = self.search_file_log(program=['vim'])
         self.assertEqual(rows, [])
+
+    def test_record_file_logs(self):
+        logs = [dict(file_path=p, access_type='write', program='test')
+                for p in self.paths[:5]]
+        num = self.db.record_file_logs(logs, chunk_size=2)
+        self.assertEqual(num, 5)
+        rows = self.search_file_log(unique=False)
+        self.assertEqual(sorted(i.path for i in rows), self.paths[:5])
+        rows = self.search_file_log(program=['test'], file_exists=False)
+        self.assertEqual(len(rows), 5)
+
+    def setup_search_since_until(self):
+        self.db.record_file_logs([
+            dict(file_path=self.paths[0], access_type='write',
+                 recorded='2013-01-01 00:00:00'),
+            dict(file_path=self.paths[1], access_type='write',
+                 recorded='2013-01-02 00:00:00'),
+            dict(file_path=self.paths[0], access_type='open',
+                 recorded='2013-01-03 00:00:00'),
+            dict(file_path=self.paths[2], access_type='write',
+                 recorded='2013-01-03 00:00:00.000001'),
+        ])
+
+    def test_search_since(self):
+        self.setup_search_since_until()
+        rows = self.search_file_log(since=to_microseconds('2013-01-02'))
+        self.assertEqual([i.path for i in rows],
+                         [self.paths[2], self.paths[0], self.paths[1]])
+        rows = self.search_file_log(since=to_microseconds('2013-01-03'))
+        self.assertEqual([i.path for i in rows],
+                         [self.paths[2], self.paths[0]])
+        rows = self.search_file_log(
+            since=to_microseconds('2013-01-02'), sort='frecency')
+        self.assertEqual(sorted(i.path for i in rows), self.paths[:3])
+
+    def test_search_until(self):
+        self.setup_search_since_until()
+        rows = self.search_file_log(until=to_microseconds('2013-01-03'))
+        self.assertEqual([(i.path, i.type) for i in rows],
+                         [(self.paths[1], 'write'), (self.paths[0], 'write')])
+        rows = self.search_file_log(since=to_microseconds('2013-01-02'),
+                                    until=to_microseconds('2013-01-03'))
+        self.assertEqual([i.path for i in rows], [self.paths[1]])
+        rows = self.search_file_log(
+            unique=False, until=to_microseconds('2013-01-03 00:00:00.000001'))
+        self.assertEqual([i.path for i in rows],
+                         [self.paths[0], self.paths[1], self.paths[0]])
+
+    def test_search_since_program(self):
+        self.setup_search_since_until()
+        self.db.record_file_logs([
+            dict(file_path=self.paths[1], access_type='write',
+                 program='vim', recorded='2012-12-31 00:00:00')])
+        rows = self.search_file_log(
+            program=['vim'], since=to_microseconds('2013-01-01'))
+        self.assertEqual(rows, [])
+        rows = self.search_file_log(
+            program=['vim'], since=to_microseconds('2013-01-01'),
+            sort='frecency')
+        self.assertEqual(rows, [])
+
+    def test_search_unlimited(self):
+        self.db.fetch_size = 3
+        logs = [dict(file_path=self.paths[i % 10], access_type='write',
+                     recorded=i)
+                for i in range(25)]
+        self.db.record_file_logs(logs)
+        rows = self.search_file_log(None)
+        self.assertEqual([i.path for i in rows],
+                         [self.paths[i % 10] for i in range(24, 14, -1)])
+        rows = self.search_file_log(None, unique=False)
+        self.assertEqual([i.path for i in rows],
+                         [self.paths[i % 10] for i in range(24, -1, -1)])
+        rows = self.search_file_log(None, program=['vim'])
+        self.assertEqual(rows, [])
+        rows = self.search_file_log(None, sort='frecency')
+        self.assertEqual(len(rows), 10)
+
+    def test_record_file_logs_recorded(self):
+        self.db.record_file_logs([
+            dict(file_path=self.paths[0], access_type='write',
+                 recorded='2013-01-01 00:00:00'),
+            dict(file_path=self.paths[1], access_type='write',
+                 recorded='2013-01-02 00:00:00'),
+            dict(file_path=self.paths[2], access_type='write',
+                 recorded='2012-12-31 00:00:00'),
+        ])
+        rows = self.search_file_log()
+        self.assertEqual([i.path for i in rows],
+                         [self.paths[1], self.paths[0], self.paths[2]])
+        self.assertEqual(rows[0].recorded, datetime.datetime(2013, 1, 2))
+
+    def test_record_file_logs_relative_path(self):
+        self.db.record_file_logs([dict(file_path='a', access_type='open')])
+        rows = self.search_file_log()
+        self.assertEqual([i.path for i in rows], [os.path.abspath('a')])
+
+    def test_search_uniquify_latest(self):
+        self.db.record_file_logs([
+            dict(file_path=self.paths[0], access_type='open',
+                 file_point=1, recorded='2013-01-01 00:00:00'),
+            dict(file_path=self.paths[1], access_type='open',
+                 recorded='2013-01-02 00:00:00'),
+            dict(file_path=self.paths[0], access_type='close',
+                 file_point=3, recorded='2013-01-03 00:00:00'),
+            # Older activity recorded later must not be the latest:
+            dict(file_path=self.paths[0], access_type='write',
+                 file_point=2, recorded='2013-01-01 12:00:00'),
+        ])
+        rows = self.search_file_log()
+        self.assertEqual(
+            [(i.path, i.type, i.point, i.recorded) for i in rows],
+            [(self.paths[0], 'close', 3, datetime.datetime(2013, 1, 3)),
+             (self.paths[1], 'open', None, datetime.datetime(2013, 1, 2))])
+
+    def test_rebuild_latest_access(self):
+        self.setup_search_under()
+        with self.db._get_db() as db:
+            db.execute('DELETE FROM latest_access')
+        self.assertEqual(self.search_file_log(), [])
+        self.db.rebuild_latest_access()
+        rows = self.search_file_log(limit=100)
+        self.assertEqual(sorted(i.path for i in rows),
+                         sorted(self.paths_a + self.paths_b))
+
+    def test_search_under_many(self):
+        self.setup_search_under()
+        self.db.record_file_log(self.abspath('DUMMY', 'ROOT-AB'), 'write')
+        under = [self.root_b, self.root_a,
+                 os.path.join(self.root_a, 'SUB')]
+        rows = self.search_file_log(under=under, limit=100)
+        self.assertEqual(sorted(i.path for i in rows),
+                         sorted(self.paths_a + self.paths_b))
+
+    def test_search_under_and_include_glob(self):
+        self.setup_search_under()
+        rows = self.search_file_log(under=[self.root_a],
+                                    include_glob=['*/01'])
+        self.assertEqual([i.path for i in rows], [self.paths_a[1]])
+
+    def test_search_only_existing_fills_limit(self):
+        import tempfile
+        import shutil
+        rootdir = tempfile.mkdtemp(prefix='factlog-test-')
+        try:
+            paths = self.paths_under(rootdir, 40)
+            for p in paths[::2]:
+                open(p, 'w').close()
+            for p in paths:
+                self.db.record_file_log(p, 'write')
+            rows = self.search_file_log(limit=15, only_existing=True)
+            self.assertEqual(len(rows), 15)
+            self.assertTrue(all(os.path.exists(i.path) for i in rows))
+        finally:
+            shutil.rmtree(rootdir)
+
+    def setup_frecency(self, chunk_size=None):
+        # paths[0]: many old writes; paths[1]: one recent write;
+        # paths[2]: recent opens by vim
+        logs = [dict(file_path=self.paths[0], access_type='write',
+                     program='emacs',
+                     recorded='2013-01-{0:02d} 00:00:00'.format(d))
+                for d in range(1, 11)]
+        logs.append(dict(file_path=self.paths[1], access_type='write',
+                         recorded='2013-03-01 00:00:00'))
+        logs.extend(dict(file_path=self.paths[2], access_type='open',
+                         program='vim', recorded='2013-02-20 00:00:00')
+                    for _ in range(4))
+        self.db.record_file_logs(logs, chunk_size)
+
+    def get_frecency(self):
+        with self.db._get_db() as db:
+            return dict(db.execute(
+                'SELECT path, frecency FROM latest_access '
+                'JOIN files ON files.id = file_id'))
+
+    def test_search_frecency(self):
+        self.setup_frecency()
+        rows = self.search_file_log(sort='frecency')
+        self.assertEqual([i.path for i in rows],
+                         [self.paths[2], self.paths[1], self.paths[0]])
+        rows = self.search_file_log(sort='frecency', program=['emacs'])
+        self.assertEqual([i.path for i in rows], [self.paths[0]])
+
+    def check_frecency_incremental_equals_rebuild(self):
+        incremental = self.get_frecency()
+        self.db.rebuild_latest_access()
+        rebuilt = self.get_frecency()
+        self.assertEqual(sorted(incremental), sorted(rebuilt))
+        for path in incremental:
+            self.assertAlmostEqual(incremental[path], rebuilt[path])
+
+    def test_frecency_incremental_equals_rebuild(self):
+        self.setup_frecency()
+        self.check_frecency_incremental_equals_rebuild()
+
+    def test_frecency_chunked_equals_rebuild(self):
+        # Scores and counts of a file are summed over chunks.
+        self.setup_frecency(chunk_size=3)
+        with self.db._get_db() as db:
+            counts = dict(db.execute(
+                'SELECT path, access_count FROM latest_access '
+                'JOIN files ON files.id = file_id'))
+        self.assertEqual(counts, {self.paths[0]: 10, self.paths[1]: 1,
+                                  self.paths[2]: 4})
+        self.check_frecency_incremental_equals_rebuild()
+
+    def test_frecency_params(self):
+        self.setup_frecency()
+        self.db.set_frecency_params(half_life=1000.0,
+                                    weights=dict(open=0.1))
+        self.assertEqual(
+            self.db.get_frecency_params(),
+            dict(half_life=1000.0,
+                 weights=dict(write=1.0, open=0.1, close=0.0)))
+        rows = self.search_file_log(sort='frecency')
+        self.assertEqual([i.path for i in rows],
+                         [self.paths[0], self.paths[1], self.paths[2]])
+
+    def test_frecency_params_invalid(self):
+        set_params = self.db.set_frecency_params
+        self.assertRaises(ValueError, set_params, half_life=0)
+        self.assertRaises(ValueError, set_params, weights=dict(x=1.0))
+        self.assertRaises(ValueError, set_params, weights=dict(open=-1.0))
+
+    def setup_history(self):
+        self.db.record_file_logs([
+            dict(file_path=self.paths[0], access_type='write',
+                 program='emacs', file_point=1,
+                 recorded='2013-01-01 10:00:00'),
+            dict(file_path=self.paths[0], access_type='write',
+                 program='emacs', file_point=2,
+                 recorded='2013-01-01 11:00:00'),
+            dict(file_path=self.paths[1], access_type='open',
+                 recorded='2013-01-01 12:00:00'),
+            dict(file_path=self.paths[0], access_type='open',
+                 program='vim', recorded='2013-01-02 00:00:00'),
+            dict(file_path=self.paths[2], access_type='write',
+                 recorded='2013-02-01 00:00:00'),
+        ])
+
+    def get_latest_access(self):
+        with self.db._get_db() as db:
+            return dict((r[0], r[1:]) for r in db.execute(
+                'SELECT path, recorded, access_count, frecency '
+                'FROM latest_access JOIN files ON files.id = file_id'))
+
+    def test_fold_access_log(self):
+        self.setup_history()
+        before = self.search_file_log()
+        latest = self.get_latest_access()
+        folded = self.db.fold_access_log('2013-01-31 00:00:00')
+        self.assertEqual(folded, 4)
+        with self.db._get_db() as db:
+            self.assertEqual(
+                db.execute('SELECT COUNT(*) FROM access_log').fetchone(),
+                (1,))
+            daily = db.execute(
+                "SELECT date(day * 86400, 'unixepoch'), program, "
+                'access_count, file_point '
+                'FROM access_daily ORDER BY day, program').fetchall()
+        self.assertEqual(daily, [('2013-01-01', '', 1, None),
+                                 ('2013-01-01', 'emacs', 2, 2),
+                                 ('2013-01-02', 'vim', 1, None)])
+        self.assertEqual(
+            [(i.path, i.point, i.recorded) for i in self.search_file_log()],
+            [(i.path, i.point, i.recorded) for i in before])
+        self.assertEqual(self.get_latest_access(), latest)
+
+        rows = self.search_file_log(program=['emacs'])
+        self.assertEqual([(i.path, i.point) for i in rows],
+                         [(self.paths[0], 2)])
+        rows = self.search_file_log(access_types=['open'], sort='frecency')
+        self.assertEqual([i.path for i in rows], self.paths[:2])
+        rows = self.search_file_log(unique=False)
+        self.assertEqual(len(rows), 4)
+
+    def test_fold_access_log_in_batches(self):
+        self.setup_history()
+        self.assertEqual(
+            self.db.fold_access_log('2013-01-31 00:00:00', batch_size=1), 4)
+        with self.db._get_db() as db:
+            daily = db.execute(
+                "SELECT date(day * 86400, 'unixepoch'), program, "
+                'access_count, file_point '
+                'FROM access_daily ORDER BY day, program').fetchall()
+        self.assertIn(('2013-01-01', 'emacs', 2, 2), daily)
+
+    def test_rebuild_after_fold(self):
+        self.setup_history()
+        latest = self.get_latest_access()
+        self.db.fold_access_log('2013-01-31 00:00:00')
+        self.db.rebuild_latest_access()
+        rebuilt = self.get_latest_access()
+        self.assertEqual(sorted(rebuilt), sorted(latest))
+        for path in latest:
+            self.assertEqual(rebuilt[path][:2], latest[path][:2])
+            # Activities of a day are scored at the last one.
+            self.assertAlmostEqual(rebuilt[path][2], latest[path][2],
+                                   places=1)
+
+    def test_gc_keeps_recent(self):
+        self.db.record_file_log(self.paths[0], 'write')
+        self.assertEqual(self.db.gc(1)['folded'], 0)
+        self.assertRaises(ValueError, self.db.gc, -1)
+
+
+class TestDataBaseConnection(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.rootdir = tempfile.mkdtemp(prefix='factlog-test-')
+        self.dbpath = os.path.join(self.rootdir, 'db.sqlite')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.rootdir)
+
+    def test_wal_mode(self):
+        with DataBase(self.dbpath) as db:
+            (mode,) = db._get_db().execute('PRAGMA journal_mode').fetchone()
+        self.assertEqual(mode, 'wal')
+
+    def test_connection_per_thread(self):
+        import threading
+        with DataBase(self.dbpath) as db:
+            self.assertIs(db._get_db(), db._get_db())
+            other = []
+            thread = threading.Thread(
+                target=lambda: other.append(db._get_db()))
+            thread.start()
+            thread.join()
+            self.assertIsNot(other[0], db._get_db())
+            self.assertEqual(len(db._connections), 2)
+        self.assertEqual(db._connections, [])
+
+    def test_reopen_after_close(self):
+        db = DataBase(self.dbpath)
+        db.close()
+        db.record_file_log('/DUMMY', 'write', file_exists=False)
+        rows = list(db.search_file_log(10, only_existing=False))
+        self.assertEqual([i.path for i in rows], ['/DUMMY'])
+        db.close()
+
+    def test_concurrent_writers(self):
+        import threading
+        paths = ['/DUMMY/{0}'.format(i) for i in range(50)]
+        errors = []
+
+        def record(paths):
+            try:
+                with DataBase(self.dbpath, timeout=30) as db:
+                    for p in paths:
+                        db.record_file_log(p, 'write', file_exists=False)
+            except Exception as err:
+                errors.append(err)
+
+        DataBase(self.dbpath).close()
+        threads = [threading.Thread(target=record, args=(paths[i::4],))
+                   for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        with DataBase(self.dbpath) as db:
+            rows = list(db.search_file_log(100, only_existing=False))
+        self.assertEqual(sorted(i.path for i in rows), sorted(paths))
+
+    def test_gc_vacuum(self):
+        from contextlib import closing
+        import sqlite3
+        # Database created without incremental auto-vacuum.
+        DataBase(self.dbpath).close()
+        with closing(sqlite3.connect(self.dbpath)) as conn:
+            conn.execute('PRAGMA auto_vacuum = NONE')
+            conn.execute('VACUUM')
+        with DataBase(self.dbpath) as db:
+            db.record_file_logs(
+                dict(file_path='/DUMMY/{0}'.format(i % 10),
+                     access_type='write', file_exists=False,
+                     recorded='2013-01-01 00:{0:02d}:{1:02d}'.format(
+                         i // 60 % 60, i % 60))
+                for i in range(3000))
+            stats = db.gc(30)
+            self.assertEqual(stats['folded'], 3000)
+            self.assertGreater(stats['freed_pages'], 0)
+            conn = db._get_db()
+            self.assertEqual(
+                conn.execute('PRAGMA auto_vacuum').fetchone(), (2,))
+            self.assertEqual(
+                conn.execute('PRAGMA freelist_count').fetchone(), (0,))
+            rows = list(db.search_file_log(100, only_existing=False))
+        self.assertEqual(len(rows), 10)
@@ -0,0 +1,170 @@
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import unittest
+
+from ..filecache import TitleCache, LineIndexCache
+
+
+class CountingTitleCache(TitleCache):
+
+    def __init__(self, *args, **kwds):
+        super(CountingTitleCache, self).__init__(*args, **kwds)
+        self.computed = []
+
+    def compute(self, path):
+        self.computed.append(path)
+        return super(CountingTitleCache, self).compute(path)
+
+
+class TestTitleCache(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.rootdir = tempfile.mkdtemp(prefix='factlog-test-')
+        self.cache_path = os.path.join(self.rootdir, 'cache.sqlite')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.rootdir)
+
+    def create_file(self, name, content):
+        path = os.path.join(self.rootdir, name)
+        with open(path, 'w') as fp:
+            fp.write(content)
+        return path
+
+    def open_cache(self, **kwds):
+        return CountingTitleCache(self.cache_path, **kwds)
+
+    def test_hit(self):
+        path = self.create_file('a.md', '# Title\n')
+        with self.open_cache() as cache:
+            self.assertEqual(cache.get(path), 'Title')
+        with self.open_cache() as cache:
+            self.assertEqual(cache.get(path), 'Title')
+            self.assertEqual(cache.computed, [])
+            stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['rows']),
+                         (1, 1, 1))
+
+    def test_stale(self):
+        path = self.create_file('a.md', '# Title\n')
+        with self.open_cache() as cache:
+            cache.get(path)
+        self.create_file('a.md', '# New title\n')
+        with self.open_cache() as cache:
+            self.assertEqual(cache.get(path), 'New title')
+            self.assertEqual(cache.computed, [path])
+
+    def test_no_title(self):
+        path = self.create_file('a.md', 'no title\n')
+        with self.open_cache() as cache:
+            self.assertEqual(cache.get(path), None)
+            self.assertEqual(cache.get(path), None)
+            self.assertEqual(cache.computed, [path])
+
+    def test_unsupported_extension_is_not_cached(self):
+        path = self.create_file('a.txt', '# Title\n')
+        with self.open_cache() as cache:
+            self.assertEqual(cache.get(path), None)
+            self.assertEqual(cache.stats()['rows'], 0)
+
+    def test_evict_least_recently_used(self):
+        paths = [self.create_file('{0}.md'.format(i), '# {0}\n'.format(i))
+                 for i in range(3)]
+        for p in paths:
+            with self.open_cache(max_rows=2) as cache:
+                cache.get(p)
+        with self.open_cache(max_rows=2) as cache:
+            cache.get(paths[2])
+            cache.get(paths[1])
+            self.assertEqual(cache.computed, [])
+            cache.get(paths[0])
+            self.assertEqual(cache.computed, [paths[0]])
+
+    def test_concurrent_writers(self):
+        paths = [self.create_file('{0}.md'.format(i), '# T{0}\n'.format(i))
+                 for i in range(2)]
+        with self.open_cache(timeout=0.1) as cache_a:
+            with self.open_cache(timeout=0.1) as cache_b:
+                cache_a.get(paths[0])
+                cache_b.get(paths[1])
+                self.assertEqual(cache_b.get(paths[0]), 'T0')
+                self.assertEqual(cache_b.computed, [paths[1]])
+        with self.open_cache() as cache:
+            self.assertEqual(cache.stats()['rows'], 2)
+
+    def test_locked(self):
+        import sqlite3
+        path = self.create_file('a.md', '# Title\n')
+        self.open_cache().close()
+        lock = sqlite3.connect(self.cache_path, isolation_level=None)
+        lock.execute('BEGIN IMMEDIATE')
+        try:
+            with self.open_cache(timeout=0.01) as cache:
+                self.assertEqual(cache.get(path), 'Title')
+        finally:
+            lock.execute('ROLLBACK')
+            lock.close()
+        with self.open_cache() as cache:
+            self.assertEqual(cache.get(path), 'Title')
+            self.assertEqual(cache.computed, [path])
+
+
+class TestLineIndexCache(TestTitleCache):
+
+    def open_cache(self, **kwds):
+        cache = LineIndexCache(self.cache_path, **kwds)
+        cache.min_size = 0
+        return cache
+
+    def test_hit(self):
+        path = self.create_file('a.txt', 'a\nb\nc\n')
+        with self.open_cache() as cache:
+            self.assertEqual(list(cache.get(path).starts), [0, 2, 4, 6])
+        with self.open_cache() as cache:
+            self.assertEqual(list(cache.get(path).starts), [0, 2, 4, 6])
+            stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_stale(self):
+        path = self.create_file('a.txt', 'a\nb\n')
+        with self.open_cache() as cache:
+            cache.get(path)
+        self.create_file('a.txt', 'a\nbc\nd\n')
+        with self.open_cache() as cache:
+            self.assertEqual(list(cache.get(path).starts), [0, 2, 5, 7])
+
+    def test_binary_is_not_indexed(self):
+        path = self.create_file('a.bin', 'a\0b\n')
+        with self.open_cache() as cache:
+            self.assertEqual(cache.get(path), None)
+            self.assertEqual(cache.get(path), None)
+            self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_small_file_is_not_indexed(self):
+        path = self.create_file('a.txt', 'a\nb\n')
+        with LineIndexCache(self.cache_path) as cache:
+            self.assertEqual(cache.get(path), None)
+            self.assertEqual(cache.stats()['rows'], 0)
+
+    test_no_title = None
+    test_unsupported_extension_is_not_cached = None
+    test_evict_least_recently_used = None
+    test_concurrent_writers = None
+    test_locked = None
@@ -123,3 +123,118 @@ class TestGetTitleNoFS(unittest.TestCase):
     def test_get_title_md_underline_symbols(self):
         for s in '=-':
             self.check_underline_title(s, filetitle.get_title_md)
+
+
+def get_title_py_ast(fp):
+    """
+    Reference implementation of :func:`filetitle.get_title_py`.
+    """
+    import ast
+    doc = ast.get_docstring(ast.parse(fp.read()))
+    if doc is None:
+        return None
+    for line in doc.splitlines():
+        if line:
+            return line
+
+
+class TestGetTitlePy(unittest.TestCase):
+
+    if PY3:
+        InMemoryIO = io.StringIO
+    else:
+        InMemoryIO = io.BytesIO
+
+    heads = [
+        '', '\n', '# comment\n', '#!/usr/bin/env python\n',
+        '# -*- coding: utf-8 -*-\n\n', 'from __future__ import division\n',
+        'import os\n',
+    ]
+    docs = [
+        "'Title'", '"Title"', "'''Title'''", '"""Title"""',
+        'r"Title\\n"', "u'Title'", "b'Title'", "f'Title'", "''", '""""""',
+        '"""\n  Title\n  second line\n"""', '"""\n\n    Title\n"""',
+        "'Ti' 'tle'", "('Title')", "(\n  'Ti'  # comment\n  'tle'\n)",
+        "(('Title'))", "'Title'.strip()", "'Title' + 'x'", "'%s' % 'Title'",
+        "'Title' if x else 'y'", "'Title'; x = 1", "'Title' \\\n  'x'",
+        "'Title'[0]", "('Title'),", "'\\tTitle\\n\\tsecond'", "'\\nTitle'",
+        "'''  \n  Title'''", "x = 'Title'", "def f():\n    'Title'",
+        "1", "...", "'Title\\x0cpage'",
+    ]
+    tails = ['', '\n', '\nx = 1\n', '\n"""second"""\n', ' # comment\n']
+
+    def check_get_title_py(self, source):
+        fp = self.InMemoryIO(source)
+        expected = get_title_py_ast(fp)
+        fp.seek(0)
+        self.assertEqual(filetitle.get_title_py(fp), expected,
+                         'source:\n{0}'.format(source))
+
+    def test_same_as_ast(self):
+        import random
+        rand = random.Random(0)
+        sources = [h + d + t for h in self.heads for d in self.docs[:1]
+                   for t in self.tails]
+        sources.extend(
+            rand.choice(self.heads) + d + rand.choice(self.tails)
+            for d in self.docs for _ in range(5))
+        num_checked = 0
+        for source in sources:
+            try:
+                compile(source, '<test>', 'exec')
+            except SyntaxError:
+                continue
+            self.check_get_title_py(source)
+            num_checked += 1
+        self.assertTrue(num_checked > len(sources) / 2)
+
+    def test_syntax_error_after_docstring(self):
+        fp = self.InMemoryIO("'''Title'''\nx = (\n")
+        self.assertEqual(filetitle.get_title_py(fp), 'Title')
+
+    def test_syntax_error(self):
+        for source in ["x = (\n", "'''Title\n", "  'Title'\n"]:
+            fp = self.InMemoryIO(source)
+            self.assertEqual(filetitle.get_title_py(fp), None)
+
+    def test_stop_at_first_statement(self):
+        fp = self.InMemoryIO("'''Title'''\nx = 1\n" + "y = 2\n" * 100)
+        self.assertEqual(filetitle.get_title_py(fp), 'Title')
+        self.assertTrue(len(fp.readlines()) >= 100)
+
+
+class TestHeadingScanner(unittest.TestCase):
+
+    if PY3:
+        InMemoryIO = io.StringIO
+    else:
+        InMemoryIO = io.BytesIO
+
+    def test_empty(self):
+        for get_title in [filetitle.get_title_rst, filetitle.get_title_md,
+                          filetitle.get_title_org]:
+            self.assertEqual(get_title(self.InMemoryIO('')), None)
+
+    def test_empty_heading_is_skipped(self):
+        fp = self.InMemoryIO('\n====\n# \nTitle\n-----\n')
+        self.assertEqual(filetitle.get_title_md(fp), 'Title')
+
+    def test_max_lines(self):
+        content = 'text\n' * 10 + '# Title\n'
+        self.assertEqual(
+            filetitle.get_title_md(self.InMemoryIO(content), max_lines=11),
+            'Title')
+        self.assertEqual(
+            filetitle.get_title_md(self.InMemoryIO(content), max_lines=10),
+            None)
+
+    def test_max_chars(self):
+        content = 'text\n' * 10 + '# Title\n'
+        self.assertEqual(
+            filetitle.get_title_md(self.InMemoryIO(content), max_chars=20),
+            None)
+
+    def test_max_chars_long_line(self):
+        fp = self.InMemoryIO('x' * 100 + '\n# Title\n')
+        self.assertEqual(filetitle.get_title_md(fp, max_chars=20), None)
+        self.assertEqual(fp.tell(), 20)
@@ -0,0 +1,96 @@
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import errno
+import unittest
+
+from ..utils.fsutils import exists_many, iter_existing
+from ..utils.parallel import get_executor
+
+
+class TestExistsMany(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.rootdir = tempfile.mkdtemp(prefix='factlog-test-')
+        self.paths = [os.path.join(self.rootdir, '{0:02d}'.format(i))
+                      for i in range(20)]
+        for p in self.paths[::2]:
+            open(p, 'w').close()
+        if hasattr(os, 'symlink'):
+            # Dangling symlink does not exist:
+            os.symlink(os.path.join(self.rootdir, 'NON-EXISTING'),
+                       self.paths[1])
+            os.symlink(self.paths[0], self.paths[3])
+        self.expected = [os.path.exists(p) for p in self.paths]
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.rootdir)
+
+    def test_listing(self):
+        self.assertEqual(exists_many(self.paths, min_listing=1),
+                         self.expected)
+
+    def test_no_listing(self):
+        self.assertEqual(exists_many(self.paths, min_listing=100),
+                         self.expected)
+
+    def test_executor(self):
+        with get_executor(4) as executor:
+            for min_listing in [1, 100]:
+                self.assertEqual(
+                    exists_many(self.paths, min_listing, executor),
+                    self.expected)
+
+    def test_unlistable_directory(self):
+        from ..utils import fsutils
+
+        def unlistable(path):
+            raise OSError(errno.EACCES, 'Permission denied', path)
+
+        (orig_scandir, orig_listdir) = (fsutils.scandir, os.listdir)
+        fsutils.scandir = fsutils.scandir and unlistable
+        os.listdir = unlistable
+        try:
+            self.assertEqual(exists_many(self.paths, min_listing=1),
+                             self.expected)
+        finally:
+            (fsutils.scandir, os.listdir) = (orig_scandir, orig_listdir)
+
+    def test_listed_under_other_name(self):
+        from ..utils import fsutils
+        orig = fsutils.list_existing
+        # As if names are listed in another case or normalization form.
+        fsutils.list_existing = lambda d: set(
+            n + '\u0301' for n in orig(d))
+        try:
+            self.assertEqual(exists_many(self.paths, min_listing=1),
+                             self.expected)
+        finally:
+            fsutils.list_existing = orig
+
+    def test_missing_directory(self):
+        paths = [os.path.join(self.rootdir, 'NON-EXISTING', p)
+                 for p in 'abc']
+        self.assertEqual(exists_many(paths, min_listing=1), [False] * 3)
+
+    def test_iter_existing(self):
+        items = list(enumerate(self.paths))
+        existing = list(iter_existing(items, lambda x: x[1], chunk_size=3))
+        self.assertEqual(existing,
+                         [i for (i, e) in zip(items, self.expected) if e])
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import re
+import io
+import shutil
+import tempfile
+import textwrap
+import unittest
+
+from ..utils.py3compat import PY3
+from ..accessinfo import AccessInfo
+from ..grep import grep_file, write_matched_lines
+
+
+class TestGrep(unittest.TestCase):
+
+    if PY3:
+        OutputIO = io.StringIO
+    else:
+        OutputIO = io.BytesIO
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='factlog-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def create_file(self, name, data):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def grep(self, pattern, data, **kwds):
+        path = self.create_file('file', data)
+        return grep_file(path, re.compile(pattern, re.MULTILINE), **kwds)
+
+    def test_same_as_line_by_line(self):
+        data = b''.join(b'line ' + str(i).encode() + b'\r\n' * (i % 2) +
+                        b'\n' * (i % 3) for i in range(100))
+        for pattern in [b'1', b'^line 1', b'[0-9]$', b'e 5|e 7', b'x']:
+            regex = re.compile(pattern)
+            expected = [(i + 1, l.rstrip(b'\r').decode())
+                        for (i, l) in enumerate(data.split(b'\n'))
+                        if regex.search(l)]
+            self.assertEqual(self.grep(pattern, data), expected, pattern)
+
+    def test_max_count(self):
+        self.assertEqual(self.grep(b'a', b'a\nb\na\na\n', max_count=2),
+                         [(1, 'a'), (3, 'a')])
+
+    def test_around(self):
+        data = u'あ\n'.encode('utf-8') + b'a\nb\na\nb\na\n'
+        # point 5 is at the first "b" (line 3)
+        self.assertEqual(self.grep(b'a', data, point=5, around=1),
+                         [(2, 'a'), (4, 'a')])
+        self.assertEqual(self.grep(b'a', data, point=5, around=0), [])
+
+    def test_no_trailing_newline(self):
+        self.assertEqual(self.grep(b'c$', b'ab\nc'), [(2, 'c')])
+
+    def test_binary_and_missing(self):
+        self.assertEqual(self.grep(b'a', b'a\0\n'), [])
+        missing = os.path.join(self.tmpdir, 'missing')
+        self.assertEqual(grep_file(missing, re.compile(b'a')), [])
+
+    def check_write_matched_lines(self, jobs):
+        rows = [AccessInfo(self.create_file(name, data), 1, None, 'write')
+                for (name, data) in [('A', b'x\ny\nx\n'), ('B', b'y\n'),
+                                     ('C', b'x\n'), ('D', b'x\n')]]
+        for r in rows:
+            r.showpath = os.path.basename(r.path)
+        output = self.OutputIO()
+        write_matched_lines(rows, output, re.compile(b'x'), max_count=3,
+                            jobs=jobs)
+        self.assertEqual(output.getvalue(), textwrap.dedent("""\
+        A:1:x
+        A:3:x
+        C:1:x
+        """))
+
+    def test_write_matched_lines(self):
+        self.check_write_matched_lines(1)
+
+    def test_write_matched_lines_parallel(self):
+        self.check_write_matched_lines(2)
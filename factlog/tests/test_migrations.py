@@ -0,0 +1,182 @@
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import sqlite3
+import datetime
+import unittest
+from contextlib import closing
+
+from .. import migrations
+from ..database import DataBase, schema_version
+
+# Schema of the first release.  Do not edit.
+schema_0_1_dev1 = """
+create table access_log (
+  id integer primary key autoincrement,
+  file_path text not null,
+  file_point integer,
+  file_exists integer not null default 1,
+  program text,
+  recorded timestamp default current_timestamp,
+  access_type integer not null
+);
+create table factlog_info (
+  factlog_version text not null,
+  schema_version text not null,
+  updated timestamp default current_timestamp
+);
+insert into factlog_info (factlog_version, schema_version)
+  values ('0.0.1', '0.1.dev1');
+"""
+
+
+def describe_schema(dbpath):
+    """
+    Return a set of objects and columns in the database at `dbpath`.
+    """
+    with closing(sqlite3.connect(dbpath)) as db:
+        objects = db.execute(
+            "SELECT type, name, tbl_name FROM sqlite_master "
+            "WHERE name NOT LIKE 'sqlite_%'").fetchall()
+        columns = [
+            (table, column[1], column[2])
+            for (type, table, _) in objects if type == 'table'
+            for column in db.execute(
+                'PRAGMA table_info({0})'.format(table))]
+    return set(objects) | set(columns)
+
+
+class TestMigration(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.rootdir = tempfile.mkdtemp(prefix='factlog-test-')
+        self.old_path = os.path.join(self.rootdir, 'old.sqlite')
+        self.new_path = os.path.join(self.rootdir, 'new.sqlite')
+        with closing(sqlite3.connect(self.old_path)) as db:
+            db.executescript(schema_0_1_dev1)
+            db.executemany(
+                'INSERT INTO access_log (file_path, access_type, recorded) '
+                'VALUES (?, ?, ?)',
+                [('/DUMMY/a', 0, '2013-01-01 00:00:00'),
+                 ('/DUMMY/b', 1, '2013-01-02 00:00:00'),
+                 ('/DUMMY/a', 2, '2013-01-03 00:00:00')])
+            db.commit()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.rootdir)
+
+    def get_schema_version(self, dbpath):
+        with closing(sqlite3.connect(dbpath)) as db:
+            return migrations.get_schema_version(db)
+
+    def test_migrations_reach_schema_version(self):
+        self.assertEqual(migrations.migrations[0][0], '0.1.dev1')
+        self.assertEqual(migrations.migrations[-1][1], schema_version)
+        for (prev, step) in zip(migrations.migrations,
+                                migrations.migrations[1:]):
+            self.assertEqual(prev[1], step[0])
+
+    def test_migrate_on_open(self):
+        DataBase(self.old_path)
+        self.assertEqual(self.get_schema_version(self.old_path),
+                         schema_version)
+
+    def test_migrated_schema_equals_fresh_schema(self):
+        DataBase(self.old_path)
+        DataBase(self.new_path)
+        self.assertEqual(describe_schema(self.old_path),
+                         describe_schema(self.new_path))
+
+    def test_migrated_data(self):
+        db = DataBase(self.old_path)
+        rows = list(db.search_file_log(10, only_existing=False))
+        self.assertEqual(
+            [(i.path, i.type, i.recorded) for i in rows],
+            [('/DUMMY/a', 'close', datetime.datetime(2013, 1, 3)),
+             ('/DUMMY/b', 'open', datetime.datetime(2013, 1, 2))])
+
+    def test_migrated_frecency(self):
+        db = DataBase(self.old_path)
+        query = 'SELECT file_id, recorded, frecency FROM latest_access'
+        with closing(sqlite3.connect(self.old_path)) as conn:
+            migrated = sorted(conn.execute(query).fetchall())
+        db.rebuild_latest_access()
+        with closing(sqlite3.connect(self.old_path)) as conn:
+            rebuilt = sorted(conn.execute(query).fetchall())
+        self.assertEqual([r[:2] for r in migrated], [r[:2] for r in rebuilt])
+        for (m, r) in zip(migrated, rebuilt):
+            self.assertAlmostEqual(m[2], r[2])
+
+    def test_migrated_files(self):
+        DataBase(self.old_path)
+        with closing(sqlite3.connect(self.old_path)) as db:
+            files = db.execute('SELECT id, path FROM files').fetchall()
+            counts = db.execute(
+                'SELECT file_id, COUNT(*) FROM access_log '
+                'GROUP BY file_id').fetchall()
+        self.assertEqual(sorted(p for (_, p) in files),
+                         ['/DUMMY/a', '/DUMMY/b'])
+        ids = dict((p, i) for (i, p) in files)
+        self.assertEqual(sorted(counts),
+                         sorted([(ids['/DUMMY/a'], 2), (ids['/DUMMY/b'], 1)]))
+
+    def test_migrated_by_other_process(self):
+        # Another process finishes migrating after the version is read.
+        DataBase(self.old_path)
+        get_schema_version = migrations.get_schema_version
+        versions = ['0.1.dev1']
+        migrations.get_schema_version = lambda db: (
+            versions.pop() if versions else get_schema_version(db))
+        try:
+            DataBase(self.old_path)
+        finally:
+            migrations.get_schema_version = get_schema_version
+        self.assertEqual(versions, [])
+        self.assertEqual(self.get_schema_version(self.old_path),
+                         schema_version)
+        with closing(sqlite3.connect(self.old_path)) as db:
+            (count,) = db.execute('SELECT COUNT(*) FROM access_log').fetchone()
+        self.assertEqual(count, 3)
+
+    def test_failed_step_is_rolled_back(self):
+        def failing(db):
+            db.execute('DROP TABLE access_log')
+            raise sqlite3.OperationalError('failed')
+        migrations.migrations.append((schema_version, 'NEXT', failing))
+        try:
+            with closing(sqlite3.connect(self.new_path)) as db:
+                db.executescript('create table factlog_info ('
+                                 'factlog_version, schema_version, updated);'
+                                 'create table access_log (id);')
+                db.execute('INSERT INTO factlog_info VALUES (?, ?, ?)',
+                           ['0', schema_version, None])
+                db.commit()
+                self.assertRaises(sqlite3.OperationalError,
+                                  migrations.migrate, db, '0')
+                self.assertEqual(migrations.get_schema_version(db),
+                                 schema_version)
+                db.execute('SELECT * FROM access_log')
+        finally:
+            migrations.migrations.pop()
+
+    def test_unknown_schema_version(self):
+        with closing(sqlite3.connect(self.old_path)) as db:
+            db.execute("UPDATE factlog_info SET schema_version = 'UNKNOWN'")
+            db.commit()
+        self.assertRaises(migrations.MigrationError, DataBase, self.old_path)
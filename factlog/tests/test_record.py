@@ -43,11 +43,12 @@ class TestWriteListedRows(unittest.TestCase):
 
     def write_listed_rows(
             self, newline='\n', title=False,
-            before_context=None, after_context=None, context=None):
+            before_context=None, after_context=None, context=None,
+            **kwds):
         from ..record import write_listed_rows
         write_listed_rows(
             self.rows, newline, self.output, title,
-            before_context, after_context, context)
+            before_context, after_context, context, **kwds)
 
     def test_title(self):
         self.write_listed_rows(title=True)
@@ -68,6 +69,24 @@ class TestWriteListedRows(unittest.TestCase):
             PATH-B:0:LINE AT POINT
             """))
 
+    def test_title_parallel(self):
+        self.rows = [MockedAccessInfo('PATH-{0:02d}'.format(i), title=str(i))
+                     for i in range(50)]
+        self.write_listed_rows(title=True, jobs=4)
+        self.assertEqual(
+            self.output.getvalue(),
+            ''.join('PATH-{0:02d}:{0}\n'.format(i) for i in range(50)))
+
+    def test_context_parallel(self):
+        self.write_listed_rows(context=100, jobs=4)
+        self.assertEqual(
+            self.output.getvalue(),
+            textwrap.dedent("""\
+            PATH-A:0:LINE AT POINT
+            PATH-A:1:LINE AT POINT
+            PATH-B:0:LINE AT POINT
+            """))
+
     def test_plain(self):
         self.write_listed_rows()
         self.assertEqual(
@@ -76,3 +95,268 @@ class TestWriteListedRows(unittest.TestCase):
             PATH-A
             PATH-B
             """))
+
+    def test_plain_chunked(self):
+        from .. import record
+        self.rows = [MockedAccessInfo('PATH-{0}'.format(i))
+                     for i in range(2500)]
+        writes = []
+        write = self.output.write
+        self.output.write = lambda s: writes.append(s) or write(s)
+        self.write_listed_rows(newline='\0')
+        self.assertEqual(
+            self.output.getvalue(),
+            ''.join('PATH-{0}\0'.format(i) for i in range(2500)))
+        self.assertEqual(len(writes), -(-2500 // record.OUTPUT_CHUNK_SIZE))
+
+
+class TestReadStdin(unittest.TestCase):
+
+    defaults = dict(access_type='write', file_point=None, program=None)
+
+    def test_iter_nul_separated(self):
+        from ..record import _iter_nul_separated
+        stdin = io.StringIO(u'a\0b\0c\n')
+        logs = list(_iter_nul_separated(stdin, self.defaults, bufsize=3))
+        self.assertEqual([l['file_path'] for l in logs], ['a', 'b', 'c'])
+        self.assertEqual(logs[0]['access_type'], 'write')
+
+    def test_iter_json_lines(self):
+        from ..record import _iter_json_lines
+        stdin = io.StringIO(textwrap.dedent(u"""\
+        {"file_path": "a", "access_type": "open"}
+
+        {"file_path": "b", "recorded": "2013-01-01 00:00:00"}
+        """))
+        logs = list(_iter_json_lines(stdin, self.defaults))
+        self.assertEqual([l['file_path'] for l in logs], ['a', 'b'])
+        self.assertEqual([l['access_type'] for l in logs], ['open', 'write'])
+        self.assertEqual(logs[1]['recorded'], '2013-01-01 00:00:00')
+
+    def test_iter_json_lines_invalid(self):
+        from ..record import _iter_json_lines
+        for line in [u'{"file_path": "b"\n', u'["b"]\n']:
+            stdin = io.StringIO(u'{"file_path": "a"}\n\n' + line)
+            logs = _iter_json_lines(stdin, self.defaults)
+            self.assertEqual(next(logs)['file_path'], 'a')
+            with self.assertRaises(SystemExit) as cm:
+                next(logs)
+            self.assertIn('line 3', str(cm.exception))
+
+
+class TestRecordFast(unittest.TestCase):
+
+    def setUp(self):
+        from .. import record
+        self.record = record
+        self.calls = []
+        self.orig_record_run = record.record_run
+        record.record_run = lambda **kwds: self.calls.append(kwds)
+
+    def tearDown(self):
+        self.record.record_run = self.orig_record_run
+
+    def record_fast(self, *args):
+        return self.record.record_fast(args)
+
+    def test_access_types(self):
+        from ..database import DataBase
+        self.assertEqual(self.record.RECORD_ACCESS_TYPES,
+                         DataBase.ACCESS_TYPES)
+
+    def test_record(self):
+        self.assertTrue(self.record_fast(
+            '-a', 'open', '--file-point=10', '--program', 'emacs',
+            '--no-server', 'PATH'))
+        self.assertEqual(self.calls, [dict(
+            file_path='PATH', file_point=10, access_type='open',
+            program='emacs', use_server=False,
+            stdin=False, stdin_format='nul')])
+
+    def test_defaults(self):
+        self.assertTrue(self.record_fast('PATH'))
+        self.assertEqual(self.calls[0]['access_type'], 'write')
+        self.assertEqual(self.calls[0]['file_point'], None)
+        self.assertEqual(self.calls[0]['use_server'], True)
+
+    def test_fallback(self):
+        for args in [(), ('--help',), ('--stdin',), ('-a', 'bogus', 'PATH'),
+                     ('--file-point', 'x', 'PATH'), ('PATH', '--program'),
+                     ('PATH', 'PATH'), ('-a=open', 'PATH'), ('--', 'PATH')]:
+            self.assertFalse(self.record_fast(*args), args)
+        self.assertEqual(self.calls, [])
+
+
+class TestStartupImports(unittest.TestCase):
+
+    """
+    `factlog record` runs on every save; keep its imports small.
+    """
+
+    heavy_modules = ['argparse', 'concurrent.futures', 'socket', 'ast',
+                     'platform', 'factlog.filetitle', 'factlog.grep']
+
+    def get_imported(self, code):
+        import os
+        import subprocess
+        import sys
+        root = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+        proc = subprocess.Popen(
+            [sys.executable, '-c', code + '\nimport sys\n'
+             'sys.stdout.write("\\n".join(sys.modules))'],
+            stdout=subprocess.PIPE, cwd=root)
+        (out, _) = proc.communicate()
+        self.assertEqual(proc.returncode, 0)
+        return set(out.decode().split('\n'))
+
+    def test_import(self):
+        imported = self.get_imported('import factlog.cli, factlog.record')
+        self.assertFalse(imported & set(self.heavy_modules))
+        self.assertNotIn('sqlite3', imported)
+
+    def test_record(self):
+        import os
+        import shutil
+        import tempfile
+        tmpdir = tempfile.mkdtemp(prefix='factlog-test-')
+        self.addCleanup(shutil.rmtree, tmpdir)
+        code = textwrap.dedent("""
+        import os
+        os.environ['XDG_CONFIG_HOME'] = {0!r}
+        from factlog.cli import main
+        main(['record', '--file-point', '1', {1!r}])
+        """).format(tmpdir, __file__)
+        imported = self.get_imported(code)
+        self.assertFalse(imported & set(self.heavy_modules))
+        self.assertTrue(os.path.exists(
+            os.path.join(tmpdir, 'factlog', 'data', 'db.sqlite')))
+
+
+class TestRebuildRun(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        from .. import record
+        from ..database import DataBase
+        self.record = record
+        self.tmpdir = tempfile.mkdtemp(prefix='factlog-test-')
+        self.db = DataBase(self.tmpdir + '/db.sqlite')
+        self.orig_get_db = record.get_db
+        record.get_db = lambda: self.db
+
+    def tearDown(self):
+        import shutil
+        self.record.get_db = self.orig_get_db
+        self.db.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_rebuild_run(self):
+        import sys
+        orig_stdout = sys.stdout
+        sys.stdout = io.StringIO() if PY3 else io.BytesIO()
+        try:
+            self.record.rebuild_run(half_life=7.0, weight=[('open', 2.0)])
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = orig_stdout
+        self.assertIn('half_life: 7.0\n', output)
+        self.assertIn('weight.open: 2.0\n', output)
+
+
+class TestRecordRunFallback(unittest.TestCase):
+
+    def setUp(self):
+        import os
+        import tempfile
+        from .. import record, client
+        self.record = record
+        self.client = client
+        self.tmpdir = tempfile.mkdtemp(prefix='factlog-test-')
+
+        class ConfigStore(object):
+            db_path = os.path.join(self.tmpdir, 'db.sqlite')
+            socket_path = os.path.join(self.tmpdir, 'server.sock')
+
+        open(ConfigStore.socket_path, 'w').close()
+        self.config = ConfigStore
+        self.orig = (record.ConfigStore, client.send_records)
+        record.ConfigStore = ConfigStore
+
+    def tearDown(self):
+        import shutil
+        (self.record.ConfigStore, self.client.send_records) = self.orig
+        shutil.rmtree(self.tmpdir)
+
+    def record_run(self, error):
+        import sys
+
+        def send_records(*_):
+            raise error
+
+        self.client.send_records = send_records
+        orig_stderr = sys.stderr
+        sys.stderr = io.StringIO() if PY3 else io.BytesIO()
+        try:
+            self.record.record_run(
+                file_path='PATH', file_point=None, access_type='write',
+                program=None, use_server=True, stdin=False,
+                stdin_format='nul')
+            return sys.stderr.getvalue()
+        finally:
+            sys.stderr = orig_stderr
+
+    def recorded(self):
+        from ..database import DataBase
+        with DataBase(self.config.db_path) as db:
+            return [r.path for r in db.search_file_log(
+                10, only_existing=False)]
+
+    def test_server_error(self):
+        import os
+        from ..client import ServerError
+        message = self.record_run(ServerError('error: database is locked'))
+        self.assertIn('database is locked', message)
+        self.assertEqual(self.recorded(), [os.path.abspath('PATH')])
+
+    def test_timeout(self):
+        import socket
+        self.record_run(socket.timeout('timed out'))
+        self.assertEqual(len(self.recorded()), 1)
+
+
+class TestFilterArguments(unittest.TestCase):
+
+    def parse_args(self, *args):
+        import argparse
+        from ..record import filter_add_arguments
+        parser = argparse.ArgumentParser()
+        filter_add_arguments(parser)
+        return parser.parse_args(args)
+
+    def test_since_until(self):
+        from ..utils.timeutils import now, MICROSECONDS_PER_DAY
+        ns = self.parse_args('--since', '1970-01-02', '--until', '1d')
+        self.assertEqual(ns.since, MICROSECONDS_PER_DAY)
+        self.assertAlmostEqual(ns.until, now() - MICROSECONDS_PER_DAY,
+                               delta=60 * 10 ** 6)
+
+    def test_defaults(self):
+        ns = self.parse_args()
+        self.assertEqual((ns.since, ns.until), (None, None))
+
+    def test_limit(self):
+        from ..record import filter_search
+
+        class DataBase(object):
+            def search_file_log(self, **kwds):
+                return kwds
+
+        def search(*args):
+            ns = self.parse_args(*args)
+            kwds = vars(ns)
+            return filter_search(DataBase(), **kwds)['limit']
+
+        self.assertEqual(search(), 20)
+        self.assertIsNone(search('--limit', '0'))
+        self.assertRaises(SystemExit, search, '--limit', '-1')
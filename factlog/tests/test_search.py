@@ -0,0 +1,183 @@
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import unittest
+
+from ..database import DataBase
+from ..search import SearchIndex, SearchUnavailable, rank_rows
+from .test_accessinfo import MockedAccessInfo
+
+
+class TestSearchIndex(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.rootdir = tempfile.mkdtemp(prefix='factlog-test-')
+        self.db = DataBase(os.path.join(self.rootdir, 'db.sqlite'))
+        try:
+            self.index = SearchIndex(os.path.join(self.rootdir,
+                                                  'search.sqlite'))
+        except SearchUnavailable as err:
+            self.skipTest(str(err))
+        self.refreshed = []
+        refresh = self.index.refresh
+        self.index.refresh = lambda path: (
+            self.refreshed.append(os.path.basename(path)) or refresh(path))
+
+    def tearDown(self):
+        import shutil
+        self.index.close()
+        self.db.close()
+        shutil.rmtree(self.rootdir)
+
+    def write(self, name, content, access_type='write'):
+        path = os.path.join(self.rootdir, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        self.db.record_file_log(path, access_type)
+        return path
+
+    def update(self):
+        del self.refreshed[:]
+        return self.index.update(self.db)
+
+    def search(self, query):
+        return sorted(os.path.basename(p)
+                      for p in self.index.search(query))
+
+    def test_update(self):
+        self.write('a.py', '"""\nApple module\n"""\nbanana = 1\n')
+        self.write('b.txt', 'banana cherry\n', 'open')
+        self.assertEqual(self.update(), 2)
+        self.assertEqual(self.search('banana'), ['a.py', 'b.txt'])
+        self.assertEqual(self.search('title:apple'), ['a.py'])
+        self.assertEqual(self.search('b'), ['b.txt'])
+        self.assertEqual(self.search('cherry AND banana'), ['b.txt'])
+
+    def test_incremental(self):
+        self.write('a.txt', 'apple\n')
+        self.write('b.txt', 'banana\n')
+        self.update()
+        self.assertEqual(self.update(), 0)
+        self.assertEqual(self.refreshed, [])
+
+        self.write('b.txt', 'cherry\n')
+        self.assertEqual(self.update(), 1)
+        self.assertEqual(self.refreshed, ['b.txt'])
+        self.assertEqual(self.search('banana'), [])
+        self.assertEqual(self.search('cherry'), ['b.txt'])
+
+        # An activity on an unchanged file reads nothing.
+        self.db.record_file_log(os.path.join(self.rootdir, 'a.txt'), 'open')
+        self.assertEqual(self.update(), 0)
+        self.assertEqual(self.refreshed, ['a.txt'])
+
+    def test_removed(self):
+        path = self.write('a.txt', 'apple\n')
+        self.update()
+        os.remove(path)
+        self.db.record_file_log(path, 'write')
+        self.assertEqual(self.update(), 1)
+        self.assertEqual(self.search('apple'), [])
+
+    def test_contentless(self):
+        self.write('a.txt', 'apple\n')
+        self.update()
+        rows = self.index.db.execute(
+            'SELECT name, title, content FROM documents_fts').fetchall()
+        self.assertEqual(rows, [(None, None, None)])
+
+    def test_compact(self):
+        self.index.commit_size = 2
+        path = self.write('a.txt', 'apple\n')
+        self.write('b.txt', 'banana\n')
+        self.update()
+        for (i, content) in enumerate(['cherry\n', 'durian\n', 'apple\n']):
+            with open(path, 'w') as f:
+                f.write(content)
+            os.utime(path, (i, i))
+            self.db.record_file_log(path, 'write')
+            self.update()
+        (count,) = self.index.db.execute(
+            'SELECT COUNT(*) FROM documents_fts').fetchone()
+        self.assertEqual(count, 2)
+        self.assertEqual(self.search('apple OR banana'), ['a.txt', 'b.txt'])
+        self.assertEqual(self.search('cherry OR durian'), [])
+
+    def test_old_format(self):
+        path = self.index.db.execute('PRAGMA database_list').fetchone()[2]
+        self.write('a.txt', 'apple\n')
+        self.update()
+        self.index.db.execute('PRAGMA user_version = 0')
+        self.index.close()
+        self.index = SearchIndex(path)
+        self.assertEqual(self.search('apple'), [])
+        self.assertEqual(self.index.update(self.db), 1)
+        self.assertEqual(self.search('apple'), ['a.txt'])
+
+    def test_binary(self):
+        self.write('a.bin', 'apple\0')
+        self.update()
+        self.assertEqual(self.search('apple'), [])
+        self.assertEqual(self.search('bin'), ['a.bin'])
+
+    def test_invalid_query(self):
+        self.assertRaises(ValueError, self.index.search, 'apple AND')
+
+    def test_get_accessed_paths(self):
+        self.assertEqual(self.db.get_accessed_paths(), (0, []))
+        a = self.write('a.txt', '')
+        b = self.write('b.txt', '')
+        (last_id, paths) = self.db.get_accessed_paths()
+        self.assertEqual(sorted(paths), [a, b])
+        self.assertEqual(self.db.get_accessed_paths(last_id), (last_id, []))
+        self.db.record_file_log(a, 'open')
+        self.assertEqual(self.db.get_accessed_paths(last_id),
+                         (last_id + 1, [a]))
+
+
+class TestRankRows(unittest.TestCase):
+
+    def rank(self, paths, scores, limit=None):
+        rows = [MockedAccessInfo(p) for p in paths]
+        return [r.path for r in rank_rows(rows, scores, limit)]
+
+    def test_relevance(self):
+        self.assertEqual(self.rank('abc', dict(a=1, b=4, c=3)),
+                         ['b', 'c', 'a'])
+
+    def test_position(self):
+        self.assertEqual(self.rank('abc', dict(a=1, b=1, c=1)),
+                         ['a', 'b', 'c'])
+
+    def test_unique(self):
+        self.assertEqual(self.rank('abab', dict(a=1, b=1)), ['a', 'b'])
+
+    def test_stop_early(self):
+        read = []
+
+        def rows():
+            for path in 'abcdefgh':
+                read.append(path)
+                yield MockedAccessInfo(path)
+
+        ranked = rank_rows(rows(), dict(a=1, b=1, h=1), limit=1)
+        self.assertEqual([r.path for r in ranked], ['a'])
+        self.assertEqual(read, ['a', 'b'])
+
+    def test_no_match(self):
+        self.assertEqual(self.rank('abc', {}), [])
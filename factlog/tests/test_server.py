@@ -0,0 +1,141 @@
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import time
+import socket
+import unittest
+import threading
+
+from ..database import DataBase
+from ..server import RecordServer, ServerAlreadyRunning
+from ..client import send_records, recv_lines, ServerError
+
+
+class TestRecordServer(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.rootdir = tempfile.mkdtemp(prefix='factlog-test-')
+        self.socket_path = os.path.join(self.rootdir, 'server.sock')
+        self.db = DataBase(os.path.join(self.rootdir, 'db.sqlite'))
+        self.server = RecordServer(self.db, self.socket_path)
+        self.server.bind()
+        self.stopped = False
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.start()
+
+    def serve(self):
+        while not self.stopped:
+            self.server.handle_events()
+        self.server.flush()
+        self.server.close()
+
+    def tearDown(self):
+        import shutil
+        self.stopped = True
+        # Wake up the server blocked in select, unless it has already
+        # seen `stopped` and removed the socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_path)
+        except socket.error:
+            pass
+        sock.close()
+        self.thread.join()
+        shutil.rmtree(self.rootdir)
+
+    def search_file_log(self, limit=10):
+        return list(self.db.search_file_log(
+            limit, unique=False, only_existing=False))
+
+    def test_send_records(self):
+        records = [dict(file_path=os.path.join(os.path.sep, 'DUMMY', p),
+                        access_type='write', program='test')
+                   for p in 'abc']
+        self.assertTrue(send_records(self.socket_path, records))
+        rows = self.search_file_log()
+        self.assertEqual(sorted(i.path for i in rows),
+                         sorted(r['file_path'] for r in records))
+
+    def test_send_records_from_many_clients(self):
+        paths = [os.path.join(os.path.sep, 'DUMMY', str(i))
+                 for i in range(20)]
+        results = []
+
+        def send(path):
+            results.append(send_records(
+                self.socket_path, [dict(file_path=path, access_type='open')]))
+
+        threads = [threading.Thread(target=send, args=(p,)) for p in paths]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, [True] * len(paths))
+        rows = self.search_file_log(limit=len(paths))
+        self.assertEqual(sorted(i.path for i in rows), sorted(paths))
+
+    def test_on_commit(self):
+        committed = []
+        self.server.on_commit = committed.append
+        path = os.path.join(os.path.sep, 'DUMMY', 'a')
+        self.assertTrue(send_records(
+            self.socket_path, [dict(file_path=path, access_type='write')]))
+        self.assertEqual([[p[0] for p in c] for c in committed], [[path]])
+
+    def test_client_not_reading(self):
+        # Replies to this client exceed the socket buffer.
+        slow = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        slow.connect(self.socket_path)
+        slow.sendall(b'x\n' * 100000)
+        slow.shutdown(socket.SHUT_WR)
+        # Let the server read all lines and start replying.
+        time.sleep(0.5)
+        path = os.path.join(os.path.sep, 'DUMMY', 'a')
+        self.assertTrue(send_records(
+            self.socket_path, [dict(file_path=path, access_type='write')],
+            timeout=2.0))
+        slow.settimeout(5.0)
+        self.assertEqual(len(recv_lines(slow)), 100000)
+        slow.close()
+
+    def test_on_commit_error(self):
+        def on_commit(_):
+            raise RuntimeError('on_commit failed')
+        self.server.on_commit = on_commit
+        records = [dict(file_path=os.path.join(os.path.sep, 'DUMMY', 'a'),
+                        access_type='write')]
+        self.assertTrue(send_records(self.socket_path, records))
+        self.assertTrue(send_records(self.socket_path, records))
+        self.assertTrue(self.thread.is_alive())
+
+    def test_invalid_access_type(self):
+        records = [dict(file_path='DUMMY', access_type='INVALID')]
+        self.assertRaises(ServerError, send_records,
+                          self.socket_path, records)
+        self.assertEqual(self.search_file_log(), [])
+
+    def test_already_running(self):
+        server = RecordServer(self.db, self.socket_path)
+        self.assertRaises(ServerAlreadyRunning, server.bind)
+
+
+class TestNoServer(unittest.TestCase):
+
+    def test_send_records_without_server(self):
+        path = os.path.join(os.path.sep, 'NON', 'EXISTING', 'server.sock')
+        self.assertFalse(send_records(path, [{}]))
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from ..utils.py3compat import PY3
+from ..utils.strutils import get_lines_at_point
+from ..utils import textfile
+from ..utils.textfile import get_lines_at_point_in_file, LineIndex
+from ..accessinfo import AccessInfo
+
+
+class TestGetLinesAtPointInFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='factlog-test-')
+        self.path = os.path.join(self.tmpdir, 'file')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, data):
+        with open(self.path, 'wb') as f:
+            f.write(data)
+
+    def assert_same_as_string(self, text, point, pre, post):
+        self.write(text.encode('utf-8'))
+        expected = list(get_lines_at_point(
+            text.replace(u'\r\n', u'\n'), point, pre, post))
+        if not PY3:
+            expected = [(i, l.encode('utf-8')) for (i, l) in expected]
+        actual = get_lines_at_point_in_file(self.path, point, pre, post)
+        self.assertEqual(actual, expected,
+                         (text, point, pre, post))
+
+    def check_random(self, num):
+        rand = random.Random(0)
+        alphabet = [u'a', u'b', u' ', u'\n', u'\r\n', u'あ', u'é']
+        for _ in range(num):
+            text = u''.join(rand.choice(alphabet)
+                            for _ in range(rand.randrange(1, 30)))
+            length = len(text.replace(u'\r\n', u'\n'))
+            self.assert_same_as_string(
+                text, rand.randrange(1, length + 2),
+                rand.randrange(3), rand.randrange(3))
+
+    def test_same_as_string(self):
+        self.check_random(500)
+
+    def test_same_as_string_mmap(self):
+        orig = textfile.MMAP_MIN_SIZE
+        textfile.MMAP_MIN_SIZE = 1
+        try:
+            self.check_random(100)
+        finally:
+            textfile.MMAP_MIN_SIZE = orig
+
+    def test_large_file_scanned_in_chunks(self):
+        orig = textfile.CHUNK_SIZE
+        textfile.CHUNK_SIZE = 7
+        try:
+            text = u''.join(u'{0}あ\n'.format(i) for i in range(100))
+            self.assert_same_as_string(text, 300, 2, 2)
+        finally:
+            textfile.CHUNK_SIZE = orig
+
+    def test_binary(self):
+        self.write(b'abc\0def\nghi\n')
+        self.assertEqual(get_lines_at_point_in_file(self.path, 5, 1, 1), [])
+
+    def test_too_large(self):
+        self.write(b'abc\ndef\n')
+        self.assertEqual(
+            get_lines_at_point_in_file(self.path, 5, max_size=4), [])
+
+    def test_empty(self):
+        self.write(b'')
+        self.assertEqual(get_lines_at_point_in_file(self.path, 1), [])
+
+    def test_no_point(self):
+        self.write(b'abc\ndef\n')
+        self.assertEqual(get_lines_at_point_in_file(self.path, None, 0, 1),
+                         [(1, 'abc'), (2, 'def')])
+
+    def test_access_info_missing_file(self):
+        info = AccessInfo(self.path, 1, None, 'write')
+        self.assertEqual(info._get_lines_at_point(1, 1), [])
+
+
+class TestLineIndex(TestGetLinesAtPointInFile):
+
+    """
+    Same tests as :class:`TestGetLinesAtPointInFile` using the index.
+    """
+
+    def assert_same_as_string(self, text, point, pre, post):
+        self.write(text.encode('utf-8'))
+        expected = get_lines_at_point_in_file(self.path, point, pre, post)
+        with open(self.path, 'rb') as f:
+            index = LineIndex.loads(LineIndex.build(f.read()).dumps())
+        actual = get_lines_at_point_in_file(
+            self.path, point, pre, post, line_index=lambda _: index)
+        self.assertEqual(actual, expected, (text, point, pre, post))
@@ -0,0 +1,137 @@
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import io
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from .. import trace
+from ..database import DataBase
+from ..accessinfo import AccessInfo
+from ..filetitle import get_title
+
+
+class TestTrace(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='factlog-test-')
+        self.tracepath = os.path.join(self.tmpdir, 'trace.jsonl')
+        trace.enable(self.tracepath)
+
+    def tearDown(self):
+        trace.disable()
+        shutil.rmtree(self.tmpdir)
+
+    def get_traces(self):
+        trace.disable()
+        with open(self.tracepath) as file:
+            return [json.loads(line) for line in file]
+
+    def get_phases(self):
+        return dict((t['phase'], t) for t in self.get_traces())
+
+    def test_disabled(self):
+        trace.disable()
+        self.assertFalse(trace.enabled())
+        with trace.span('a') as span:
+            span.rows_out = 1
+            trace.add_bytes(10)
+        rows = [1, 2]
+        self.assertIs(trace.stage('b').output(rows), rows)
+        self.assertEqual(open(self.tracepath).read(), '')
+
+    def test_environ(self):
+        trace.disable()
+        trace.enable_from_environ({})
+        self.assertFalse(trace.enabled())
+        trace.enable_from_environ(dict(FACTLOG_TRACE=self.tracepath))
+        self.assertTrue(trace.enabled())
+
+    def test_span(self):
+        with trace.span('outer', key='value') as outer:
+            with trace.span('inner'):
+                trace.add_bytes(3)
+            trace.add_bytes(5)
+            outer.rows_out = sum(outer.input([1, 2, 3]))
+        phases = self.get_phases()
+        self.assertEqual(phases['inner']['bytes'], 3)
+        self.assertEqual(phases['outer']['bytes'], 5)
+        self.assertEqual(phases['outer']['rows_in'], 3)
+        self.assertEqual(phases['outer']['rows_out'], 6)
+        self.assertEqual(phases['outer']['key'], 'value')
+        self.assertLessEqual(phases['outer']['seconds'],
+                             phases['outer']['total_seconds'])
+
+    def test_stage(self):
+        stage = trace.stage('even')
+        rows = stage.output(i for i in stage.input(range(10)) if i % 2 == 0)
+        self.assertEqual(list(rows), [0, 2, 4, 6, 8])
+        phases = self.get_phases()
+        self.assertEqual(phases['even']['rows_in'], 10)
+        self.assertEqual(phases['even']['rows_out'], 5)
+
+    def test_search_file_log(self):
+        db = DataBase(os.path.join(self.tmpdir, 'db.sqlite'))
+        paths = [os.path.join(self.tmpdir, p) for p in 'abc']
+        for p in paths:
+            open(p, 'w').close()
+        db.record_file_logs(
+            dict(file_path=p, access_type='write',
+                 recorded='2013-01-01 00:00:0{0}'.format(i))
+            for (i, p) in enumerate(paths))
+        os.remove(paths[0])
+        rows = list(db.search_file_log(limit=1, under=[self.tmpdir],
+                                       relative=True))
+        self.assertEqual([r.showpath for r in rows], ['c'])
+        db.close()
+        phases = self.get_phases()
+        self.assertIn('connect', phases)
+        self.assertEqual(phases['search.sql']['rows_out'], 3)
+        self.assertGreaterEqual(phases['search.sql']['queries'], 1)
+        self.assertEqual(phases['search.relative']['rows_out'],
+                         phases['search.exists']['rows_in'])
+        self.assertEqual(phases['search.limit']['rows_out'], 1)
+
+    def test_title_and_lines(self):
+        path = os.path.join(self.tmpdir, 'doc.rst')
+        with io.open(path, 'w', encoding='utf-8') as file:
+            file.write(u'Title\n=====\n\nline\n')
+        self.assertEqual(get_title(path), 'Title')
+        info = AccessInfo(path, 14, None, 'write')
+        self.assertEqual(info._get_lines_at_point(1, 0),
+                         [(3, ''), (4, 'line')])
+        phases = self.get_phases()
+        self.assertEqual(phases['title']['path'], path)
+        # Lines up to the heading, or more if the file is buffered.
+        self.assertGreaterEqual(phases['title']['bytes'], 12)
+        self.assertLessEqual(phases['title']['bytes'], 18)
+        self.assertEqual(phases['lines']['rows_out'], 2)
+        self.assertEqual(phases['lines']['bytes'], 17)
+
+    def test_add_arguments(self):
+        import argparse
+        parser = argparse.ArgumentParser()
+        parser.add_argument('path', nargs='?')
+        trace.add_arguments(parser)
+        parse = lambda *args: vars(parser.parse_args(args))
+        self.assertEqual(parse('--trace', 'foo.txt'),
+                         dict(trace='-', path='foo.txt'))
+        self.assertEqual(parse('--trace-file', 'trace.jsonl', 'foo.txt'),
+                         dict(trace='trace.jsonl', path='foo.txt'))
+        self.assertEqual(parse('foo.txt'), dict(trace=None, path='foo.txt'))
@@ -0,0 +1,181 @@
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import sqlite3
+import unittest
+
+from ..database import DataBase
+from ..watch import Watcher, Debouncer, DEFAULT_EXCLUDE_GLOB
+
+
+class TestWatcher(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.mkdtemp(prefix='factlog-test-')
+        self.rootdir = os.path.join(self.tmpdir, 'root')
+        os.makedirs(os.path.join(self.rootdir, 'sub'))
+        self.db = DataBase(os.path.join(self.tmpdir, 'db.sqlite'))
+        try:
+            self.watcher = Watcher(self.db, debounce=0,
+                                   exclude_glob=DEFAULT_EXCLUDE_GLOB)
+        except OSError as err:
+            self.skipTest(str(err))
+        self.watcher.add_tree(self.rootdir)
+
+    def tearDown(self):
+        import shutil
+        self.watcher.close()
+        self.db.close()
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, *names):
+        path = os.path.join(self.rootdir, *names)
+        with open(path, 'w') as f:
+            f.write('x')
+        return path
+
+    def record(self):
+        """Handle all events and return recorded paths relative to root."""
+        while True:
+            num = len(self.watcher.debouncer)
+            self.watcher.handle_events(timeout=0.1)
+            if len(self.watcher.debouncer) == num:
+                break
+        self.watcher.flush(force=True)
+        rows = self.db.search_file_log(
+            limit=None, unique=False, only_existing=False)
+        return sorted(os.path.relpath(r.path, self.rootdir) for r in rows)
+
+    def test_write(self):
+        self.write('a.txt')
+        self.write('sub', 'b.txt')
+        self.assertEqual(self.record(),
+                         ['a.txt', os.path.join('sub', 'b.txt')])
+        rows = list(self.db.search_file_log(limit=1))
+        self.assertEqual(rows[0].type, 'write')
+
+    def test_debounce(self):
+        for _ in range(5):
+            self.write('a.txt')
+        self.assertEqual(self.record(), ['a.txt'])
+
+    def test_commit_interval(self):
+        self.watcher.commit_interval = 60
+        self.write('a.txt')
+        self.record()
+        self.write('b.txt')
+        self.watcher.handle_events(timeout=1)
+        self.assertEqual(self.watcher.flush(), 0)
+        self.assertGreater(self.watcher.next_timeout(), 50)
+        self.assertEqual(self.watcher.flush(force=True), 1)
+
+    def test_exclude(self):
+        os.makedirs(os.path.join(self.rootdir, '.git'))
+        self.write('a.pyc')
+        self.write('b.txt~')
+        self.assertEqual(self.record(), [])
+        self.assertNotIn(os.path.join(self.rootdir, '.git'),
+                         self.watcher.directories.values())
+
+    def test_new_directory(self):
+        os.makedirs(os.path.join(self.rootdir, 'new', 'deep'))
+        self.record()
+        self.write('new', 'deep', 'a.txt')
+        self.assertEqual(self.record(),
+                         [os.path.join('new', 'deep', 'a.txt')])
+
+    def test_new_directory_contents(self):
+        # Files written before the watch is added to a new directory.
+        os.makedirs(os.path.join(self.rootdir, 'new', 'deep'))
+        self.write('new', 'a.txt')
+        self.write('new', 'deep', 'b.txt')
+        self.write('new', 'a.pyc')
+        self.assertEqual(self.record(),
+                         [os.path.join('new', 'a.txt'),
+                          os.path.join('new', 'deep', 'b.txt')])
+
+    def test_renamed_directory(self):
+        self.write('sub', 'a.txt')
+        self.record()
+        os.rename(os.path.join(self.rootdir, 'sub'),
+                  os.path.join(self.rootdir, 'renamed'))
+        self.assertEqual(self.record(), [os.path.join('sub', 'a.txt')])
+        self.assertEqual(
+            sorted(self.watcher.directories.values()),
+            [self.rootdir, os.path.join(self.rootdir, 'renamed')])
+        self.write('renamed', 'b.txt')
+        self.assertEqual(self.record(), [os.path.join('renamed', 'b.txt'),
+                                         os.path.join('sub', 'a.txt')])
+
+    def test_moved_in_directory(self):
+        os.makedirs(os.path.join(self.tmpdir, 'outside'))
+        with open(os.path.join(self.tmpdir, 'outside', 'a.txt'), 'w') as f:
+            f.write('x')
+        os.rename(os.path.join(self.tmpdir, 'outside'),
+                  os.path.join(self.rootdir, 'inside'))
+        self.assertEqual(self.record(), [os.path.join('inside', 'a.txt')])
+
+    def test_flush_error(self):
+        record_file_logs = self.db.record_file_logs
+        errors = []
+
+        def failing(logs):
+            if not errors:
+                errors.append(None)
+                raise sqlite3.OperationalError('database is locked')
+            return record_file_logs(logs)
+
+        self.db.record_file_logs = failing
+        self.write('a.txt')
+        self.watcher.handle_events(timeout=1)
+        self.assertEqual(self.watcher.flush(force=True), 0)
+        self.assertEqual(len(self.watcher.debouncer), 1)
+        self.write('b.txt')
+        self.assertEqual(self.record(), ['a.txt', 'b.txt'])
+
+    def test_moved_directory(self):
+        os.rename(os.path.join(self.rootdir, 'sub'),
+                  os.path.join(self.tmpdir, 'sub'))
+        self.record()
+        self.assertEqual(list(self.watcher.directories.values()),
+                         [self.rootdir])
+        with open(os.path.join(self.tmpdir, 'sub', 'a.txt'), 'w') as f:
+            f.write('x')
+        self.assertEqual(self.record(), [])
+
+
+class TestDebouncer(unittest.TestCase):
+
+    def test_max_pending(self):
+        debouncer = Debouncer(delay=10, max_pending=100)
+        for i in range(1000):
+            debouncer.add(i, 0, recorded=i)
+        due = debouncer.pop_due(0)
+        self.assertEqual(len(debouncer), 100)
+        self.assertEqual(due, [(i, i) for i in range(900)])
+
+    def test_requeue(self):
+        debouncer = Debouncer(delay=10, max_pending=100)
+        debouncer.add('a', 0, recorded=1)
+        debouncer.add('b', 0, recorded=2)
+        due = debouncer.pop_due(10)
+        debouncer.add('c', 10, recorded=3)
+        debouncer.add('b', 10, recorded=4)
+        debouncer.requeue(due)
+        self.assertEqual(debouncer.pop_due(0), [('a', 1)])
+        self.assertEqual(debouncer.pop_due(20), [('c', 3), ('b', 4)])
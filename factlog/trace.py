@@ -0,0 +1,278 @@
+"""
+Phase-level tracing of factlog commands.
+
+Set environment variable ``FACTLOG_TRACE`` or give ``--trace`` or
+``--trace-file FILE`` to `factlog list` or `factlog record` to write
+one JSON object per line for each phase.  ``--trace`` and the
+environment values ``-`` and ``1`` mean stderr; other values are
+paths of files to append to::
+
+  FACTLOG_TRACE=/tmp/trace.jsonl factlog list --title
+
+Each line has the following keys:
+
+phase
+  name of the phase such as ``search.sql`` or ``title``
+seconds
+  wall time spent in the phase itself
+total_seconds
+  wall time including the phases it reads rows from
+rows_in, rows_out
+  number of rows read from the previous phase and passed to the next
+bytes
+  number of bytes of files read (or scanned) in the phase
+start
+  Unix time when the phase started
+
+Phases for lazy pipelines such as the wrappers of
+:meth:`factlog.database.DataBase.search_file_log` are written when the
+iteration finishes, so their lines are not in the order of `start`.
+Phases run per file (``title`` and ``lines``) also have ``path``.
+
+When tracing is disabled, the hooks cost one function call.
+"""
+
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import sys
+import time
+import threading
+
+_output = None
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def enable(dest='-'):
+    """
+    Start writing traces to `dest` (``'-'`` or ``'1'`` for stderr).
+
+    Falsy `dest` disables tracing.
+
+    """
+    global _output
+    disable()
+    if not dest:
+        return
+    if dest in ('-', '1'):
+        _output = sys.stderr
+    else:
+        _output = open(dest, 'a')
+
+
+def enable_from_environ(environ=os.environ):
+    """Call :func:`enable` with ``FACTLOG_TRACE`` if it is set."""
+    dest = environ.get('FACTLOG_TRACE')
+    if dest:
+        enable(dest)
+
+
+def disable():
+    global _output
+    (output, _output) = (_output, None)
+    if output is not None and output is not sys.stderr:
+        output.close()
+
+
+def enabled():
+    return _output is not None
+
+
+def emit(phase, **fields):
+    """Write a trace line of `phase`, if enabled."""
+    import json
+    output = _output
+    if output is None:
+        return
+    line = json.dumps(dict(fields, phase=phase), sort_keys=True)
+    with _lock:
+        output.write(line + '\n')
+        output.flush()
+
+
+def add_bytes(num):
+    """Add `num` to the bytes of the innermost span of this thread."""
+    stack = getattr(_local, 'stack', None)
+    if stack:
+        stack[-1].bytes += num
+
+
+class Phase(object):
+
+    """
+    Counters of a phase.  Use :func:`span` or :func:`stage`.
+
+    Wrap rows read from the previous phase by :meth:`input`, so that
+    :attr:`rows_in` is counted and the time spent in the previous
+    phase is subtracted from :attr:`seconds`.
+
+    """
+
+    def __init__(self, phase, **fields):
+        self.phase = phase
+        self.fields = fields
+        self.rows_in = None
+        self.rows_out = None
+        self.bytes = 0
+        self.input_seconds = 0.0
+
+    def count(self, name, num=1):
+        """Add `num` to the field `name` written with the trace."""
+        self.fields[name] = self.fields.get(name, 0) + num
+
+    def input(self, iterable):
+        self.rows_in = 0
+        return self._iter_input(iter(iterable))
+
+    def _iter_input(self, iterator):
+        while True:
+            start = time.time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.input_seconds += time.time() - start
+            self.rows_in += 1
+            yield item
+
+    def _emit(self, total_seconds):
+        emit(self.phase, seconds=total_seconds - self.input_seconds,
+             total_seconds=total_seconds, rows_in=self.rows_in,
+             rows_out=self.rows_out, bytes=self.bytes, start=self.start,
+             **self.fields)
+
+
+class Span(Phase):
+
+    """
+    Context manager to trace a phase done in a block of code.
+
+    Set :attr:`rows_in`, :attr:`rows_out` or :attr:`bytes` in the
+    block if the numbers are meaningful for the phase.
+
+    """
+
+    def __enter__(self):
+        if not hasattr(_local, 'stack'):
+            _local.stack = []
+        _local.stack.append(self)
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *_):
+        seconds = time.time() - self.start
+        _local.stack.remove(self)
+        self._emit(seconds)
+
+
+class Stage(Phase):
+
+    """
+    Trace a phase which transforms an iterator lazily.
+
+    Wrap the input of the phase by :meth:`input` and its output by
+    :meth:`output`::
+
+      stage = trace.stage('search.exists')
+      return stage.output(iter_existing(stage.input(rows)))
+
+    """
+
+    def output(self, iterable):
+        return self._iter_output(iter(iterable))
+
+    def _iter_output(self, iterator):
+        self.start = time.time()
+        self.rows_out = 0
+        seconds = 0.0
+        try:
+            while True:
+                start = time.time()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    seconds += time.time() - start
+                self.rows_out += 1
+                yield item
+        finally:
+            self._emit(seconds)
+
+
+class _NullPhase(object):
+
+    """Phase used when tracing is disabled.  It ignores everything."""
+
+    rows_in = rows_out = bytes = None
+
+    def __setattr__(self, name, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        pass
+
+    def count(self, name, num=1):
+        pass
+
+    def input(self, iterable):
+        return iterable
+
+    output = input
+
+
+_null_phase = _NullPhase()
+
+
+def span(phase, **fields):
+    """
+    Return a :class:`Span`, or a no-op one if disabled.
+    """
+    if _output is None:
+        return _null_phase
+    return Span(phase, **fields)
+
+
+def stage(phase, **fields):
+    """
+    Return a :class:`Stage`, or a no-op one if disabled.
+    """
+    if _output is None:
+        return _null_phase
+    return Stage(phase, **fields)
+
+
+def add_arguments(parser):
+    # --trace takes no value, so that it does not swallow the next
+    # positional argument such as FILE_PATH of `factlog record`.
+    parser.add_argument(
+        '--trace', action='store_const', const='-',
+        help="""
+        Write time, number of rows and bytes read of each phase
+        as JSON lines to stderr.  See also --trace-file.
+        """)
+    parser.add_argument(
+        '--trace-file', dest='trace', metavar='FILE',
+        help="""
+        Same as --trace but append to FILE.  Environment variable
+        FACTLOG_TRACE=FILE does the same.
+        """)
@@ -0,0 +1,142 @@
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import errno
+
+from .iterutils import chunked
+from .parallel import get_executor
+
+try:
+    from os import scandir
+except ImportError:
+    scandir = None
+
+
+class AbsPathCache(object):
+
+    """
+    Faster :func:`os.path.abspath` for many paths in few directories.
+
+    The current directory is looked up only once and absolute path of
+    each directory is cached.
+
+    >>> abspath = AbsPathCache('/home/user')
+    >>> abspath('a/b.txt')
+    '/home/user/a/b.txt'
+    >>> abspath('a/../c.txt')
+    '/home/user/c.txt'
+    >>> abspath('/tmp/d.txt')
+    '/tmp/d.txt'
+
+    """
+
+    def __init__(self, cwd=None):
+        self.cwd = os.getcwd() if cwd is None else cwd
+        self.dirs = {}
+
+    def __call__(self, path):
+        (head, tail) = os.path.split(path)
+        if tail in ('', os.curdir, os.pardir):
+            return os.path.normpath(os.path.join(self.cwd, path))
+        try:
+            absdir = self.dirs[head]
+        except KeyError:
+            absdir = self.dirs[head] = os.path.normpath(
+                os.path.join(self.cwd, head))
+        return os.path.join(absdir, tail)
+
+
+def list_existing(directory):
+    """
+    Return a set of names in `directory` for which `os.path.exists`
+    is true.
+
+    Empty set is returned if `directory` does not exist.  None is
+    returned if it exists but cannot be listed (e.g., no read
+    permission), as files in it may still exist.
+
+    """
+    try:
+        if scandir is None:
+            entries = [(n, os.path.join(directory, n))
+                       for n in os.listdir(directory)]
+            return set(n for (n, p) in entries if os.path.exists(p))
+        entries = list(scandir(directory))
+    except OSError as err:
+        if err.errno in (errno.ENOENT, errno.ENOTDIR):
+            return set()
+        return None
+    # Only dangling symlinks need stat; d_type tells the rest.
+    return set(e.name for e in entries
+               if not e.is_symlink() or os.path.exists(e.path))
+
+
+def exists_many(paths, min_listing=8, executor=None):
+    """
+    Return a list of bool telling if each of absolute `paths` exists.
+
+    Directories containing `min_listing` paths or more are listed
+    once instead of calling `os.path.exists` for each path.  If
+    `executor` is given, directories and paths are checked
+    concurrently using its `map` method.
+
+    """
+    groups = {}
+    for (i, path) in enumerate(paths):
+        groups.setdefault(os.path.dirname(path), []).append(i)
+    tasks = []
+    for (directory, indices) in groups.items():
+        if len(indices) >= min_listing:
+            tasks.append((directory, indices))
+        else:
+            tasks.extend((None, [i]) for i in indices)
+
+    def check(task):
+        (directory, indices) = task
+        if directory is None:
+            return [(i, os.path.exists(paths[i])) for i in indices]
+        names = list_existing(directory)
+        if names is None:
+            return [(i, os.path.exists(paths[i])) for i in indices]
+        # A listed name may differ from the given one on file systems
+        # ignoring case or normalizing Unicode, so check a miss again.
+        return [(i, os.path.basename(paths[i]) in names or
+                 bool(names) and os.path.exists(paths[i]))
+                for i in indices]
+
+    exists = [False] * len(paths)
+    for result in (executor.map if executor else map)(check, tasks):
+        for (i, e) in result:
+            exists[i] = e
+    return exists
+
+
+def iter_existing(items, path=lambda x: x, chunk_size=64, max_workers=8):
+    """
+    Yield elements of `items` whose `path` exists, preserving the order.
+
+    Existence is checked by :func:`exists_many` for each chunk of
+    `chunk_size` elements using a pool of `max_workers` threads.
+    `items` is consumed only as much as needed.
+
+    """
+    with get_executor(max_workers) as executor:
+        for chunk in chunked(items, chunk_size):
+            exists = exists_many([path(i) for i in chunk], executor=executor)
+            for (item, e) in zip(chunk, exists):
+                if e:
+                    yield item
@@ -34,7 +34,10 @@ def interleave(*iteratives):
     iters = list(map(iter, iteratives))
     while True:
         for it in iters:
-            yield next(it)
+            try:
+                yield next(it)
+            except StopIteration:
+                return
 
 
 def uniq(seq, key=lambda x: x):
@@ -53,3 +56,19 @@ def uniq(seq, key=lambda x: x):
         if k not in seen:
             yield i
             seen.add(k)
+
+
+def chunked(iterative, size):
+    """
+    Return an iterator that yields lists of `size` elements at most.
+
+    >>> list(chunked(range(5), 2))
+    [[0, 1], [2, 3], [4]]
+
+    """
+    it = iter(iterative)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
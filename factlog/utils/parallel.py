@@ -0,0 +1,101 @@
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import collections
+from itertools import islice
+
+from .py3compat import map
+
+
+class SerialExecutor(object):
+
+    """
+    Executor running everything in the calling thread.
+
+    Used when :mod:`concurrent.futures` is not available.
+
+    """
+
+    def map(self, func, *iterables):
+        return map(func, *iterables)
+
+    def shutdown(self, wait=True):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.shutdown()
+
+
+def get_executor(max_workers, processes=False):
+    """
+    Return a thread pool with `max_workers` threads if possible.
+
+    A process pool is returned instead if `processes` is true.
+    :class:`SerialExecutor` is returned when `max_workers` is less
+    than 2 or :mod:`concurrent.futures` is not available.
+
+    """
+    if max_workers < 2:
+        return SerialExecutor()
+    # Imported here since it takes long and `factlog record` does
+    # not need it.
+    try:
+        from concurrent import futures
+    except ImportError:
+        return SerialExecutor()
+    if processes:
+        return futures.ProcessPoolExecutor(max_workers)
+    return futures.ThreadPoolExecutor(max_workers)
+
+
+def imap_ordered(executor, func, iterable, window, on_wait=None):
+    """
+    Lazy version of ``executor.map(func, iterable)``.
+
+    At most `window` elements of `iterable` are submitted ahead of
+    the result yielded last, and `iterable` is consumed in the calling
+    thread.  `on_wait` is called before blocking for a result which
+    is not ready yet; use it to flush output written so far.  When
+    the returned generator is closed early, submitted calls not
+    started yet are cancelled.
+
+    >>> with get_executor(4) as executor:
+    ...     list(imap_ordered(executor, lambda x: x * 2, range(10), 3))
+    [0, 2, 4, 6, 8, 10, 12, 14, 16, 18]
+
+    """
+    if isinstance(executor, SerialExecutor):
+        for item in iterable:
+            yield func(item)
+        return
+    iterator = iter(iterable)
+    pending = collections.deque(
+        executor.submit(func, item) for item in islice(iterator, window))
+    try:
+        while pending:
+            future = pending.popleft()
+            if on_wait is not None and not future.done():
+                on_wait()
+            result = future.result()
+            pending.extend(
+                executor.submit(func, item) for item in islice(iterator, 1))
+            yield result
+    finally:
+        for future in pending:
+            future.cancel()
@@ -18,10 +18,14 @@ import sys
 PY3 = (sys.version_info[0] >= 3)
 
 
-try:
-    from string import count
-except ImportError:
+if PY3:
     count = str.count
+    string_types = (str,)
+    integer_types = (int,)
+else:
+    from string import count
+    string_types = (basestring,)
+    integer_types = (int, long)
 
 
 try:
@@ -30,3 +34,9 @@ except ImportError:
     map = map
     zip = zip
     filter = filter
+
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
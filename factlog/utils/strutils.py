@@ -33,6 +33,28 @@ def remove_prefix(prefixes, string):
     return string
 
 
+def prefix_ranges(prefixes):
+    """
+    Return a list of ``(lower, upper)`` to match strings with `prefixes`.
+
+    String ``s`` starts with one of `prefixes` if and only if
+    ``lower <= s < upper`` for one of the returned ranges.  Prefixes
+    covered by other prefixes are merged.
+
+    >>> prefix_ranges(['/b/', '/a/', '/a/c/'])
+    [('/a/', '/a0'), ('/b/', '/b0')]
+    >>> prefix_ranges([])
+    []
+
+    """
+    ranges = []
+    for pre in sorted(set(prefixes)):
+        if ranges and pre.startswith(ranges[-1][0]):
+            continue
+        ranges.append((pre, pre[:-1] + chr(ord(pre[-1]) + 1)))
+    return ranges
+
+
 def get_lineno_at_point(string, point):
     r"""
     Get 1-based line number at given `point`.
@@ -0,0 +1,320 @@
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Read lines around a point in a file without loading the whole file.
+
+Files are assumed to be encoded in UTF-8 (or ASCII).  Points count
+characters as Emacs does, i.e., CRLF is one character.
+"""
+
+import os
+import re
+import mmap
+from array import array
+from bisect import bisect_right
+
+from .. import trace
+
+# Files larger than this are skipped.
+MAX_SIZE = 512 * 1024 * 1024
+# Files smaller than this are read at once instead of mmap'ed.
+MMAP_MIN_SIZE = 256 * 1024
+# Files having NUL in this many bytes at the beginning are binary.
+BINARY_CHECK_SIZE = 8192
+# Maximum number of bytes copied at once while scanning.
+CHUNK_SIZE = 1024 * 1024
+
+CONTINUATION_BYTES = bytes(bytearray(range(0x80, 0xc0)))
+ASCII_BYTES = bytes(bytearray(range(0x80)))
+
+try:
+    array('Q')
+    OFFSET_TYPECODE = 'Q'
+except ValueError:              # Python 2
+    OFFSET_TYPECODE = 'L'
+
+
+def is_binary(data):
+    """
+    Guess if `data` is a content of binary file.
+
+    >>> is_binary(b'text')
+    False
+    >>> is_binary(b'\\x7fELF\\x00')
+    True
+
+    """
+    return b'\0' in data[:BINARY_CHECK_SIZE]
+
+
+def char_to_byte_offset(data, chars):
+    """
+    Return an offset in UTF-8 `data` after `chars` characters.
+
+    The returned offset may point into a multi-byte character, but
+    there is no newline between the true offset and the returned one.
+
+    >>> data = u'\\u3042\\u3044\\nabc'.encode('utf-8')
+    >>> char_to_byte_offset(data, 3)
+    7
+    >>> char_to_byte_offset(b'a\\r\\nb', 2)
+    3
+
+    """
+    offset = 0
+    size = len(data)
+    while chars > 0 and offset < size:
+        end = offset + min(chars, CHUNK_SIZE)
+        if data[end - 1:end] == b'\r':
+            end += 1  # do not split CRLF
+        chunk = data[offset:end]
+        chars -= (len(chunk.translate(None, CONTINUATION_BYTES)) -
+                  chunk.count(b'\r\n'))
+        offset += len(chunk)
+    return min(offset, size)
+
+
+def count_newlines(data, start, end):
+    """
+    Count newlines in ``data[start:end]`` without copying all of it.
+    """
+    return sum(data[i:min(i + CHUNK_SIZE, end)].count(b'\n')
+               for i in range(start, end, CHUNK_SIZE))
+
+
+def line_region(data, offset, pre_lines=0, post_lines=0):
+    """
+    Find lines around byte `offset` of `data`.
+
+    :rtype: tuple of three ints
+    :return: ``(start, end, pre)`` where ``data[start:end]`` is the
+             lines without the last newline and `pre` is the number
+             of lines before the line at `offset` in it.
+
+    >>> data = b'1\\n3\\n5\\n7\\n9\\n'
+    >>> line_region(data, 4, 5, 1)
+    (0, 7, 2)
+
+    """
+    start = data.rfind(b'\n', 0, offset) + 1
+    pre = 0
+    for _ in range(pre_lines):
+        if start == 0:
+            break
+        start = data.rfind(b'\n', 0, start - 1) + 1
+        pre += 1
+    end = data.find(b'\n', offset)
+    for _ in range(post_lines):
+        if end == -1:
+            break
+        end = data.find(b'\n', end + 1)
+    return (start, len(data) if end == -1 else end, pre)
+
+
+def get_lines_at_offset(data, offset, pre_lines=0, post_lines=0,
+                        line_no=None, encoding='utf-8'):
+    """
+    Get lines around byte `offset` of `data`.
+
+    :type    line_no: int or None
+    :arg     line_no: 0-origin line number at `offset` if known
+
+    :rtype: list of tuple of int and str
+    :return: Pairs of 1-based line number and line, as in
+             :func:`factlog.utils.strutils.get_lines_at_point`.
+
+    >>> data = b'1\\n3\\n5\\n7\\n9\\n'
+    >>> get_lines_at_offset(data, 4, 2, 1)
+    [(1, '1'), (2, '3'), (3, '5'), (4, '7')]
+    >>> get_lines_at_offset(data, 8, 0, 2)  # not enough post lines
+    [(5, '9')]
+    >>> get_lines_at_offset(b'1\\r\\n3', 1, 0, 1)
+    [(1, '1'), (2, '3')]
+
+    """
+    scanned_from = offset if line_no is not None else 0
+    if line_no is None:
+        line_no = count_newlines(data, 0, offset)
+    (start, end, pre) = line_region(data, offset, pre_lines, post_lines)
+    trace.add_bytes(end - min(start, scanned_from))
+    lines = data[start:end].decode(encoding, 'replace').split(u'\n')
+    if end == len(data) and not lines[-1]:
+        lines.pop()  # no line after the last newline
+    return [(line_no - pre + i + 1, str_line(l.rstrip(u'\r')))
+            for (i, l) in enumerate(lines)]
+
+
+def str_line(line):
+    if str is bytes:
+        return line.encode('utf-8')
+    return line
+
+
+class mapped_file(object):
+
+    """
+    Context manager to get content of a file as bytes or mmap.
+
+    It gives None for empty, too large or binary files.
+
+    """
+
+    def __init__(self, path, max_size=None):
+        self.path = path
+        self.max_size = MAX_SIZE if max_size is None else max_size
+        self.file = self.data = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        if size == 0 or size > self.max_size:
+            return None
+        if size < MMAP_MIN_SIZE:
+            self.data = self.file.read()
+        else:
+            self.data = mmap.mmap(self.file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        if is_binary(self.data):
+            return None
+        return self.data
+
+    def __exit__(self, *_):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+
+class LineIndex(object):
+
+    """
+    Offsets of the beginning of lines in a file.
+
+    :attr:`starts` is the byte offsets of the lines and :attr:`chars`
+    is the character offsets of the same lines.  :attr:`chars` is
+    empty when the file is ASCII without CRLF, as the offsets are the
+    same as :attr:`starts`.  A line after the last newline is
+    included even if it is empty.
+
+    >>> index = LineIndex.build(u'\\u3042\\nb\\r\\nc\\n'.encode('utf-8'))
+    >>> list(index.starts)
+    [0, 4, 7, 9]
+    >>> list(index.chars)
+    [0, 2, 4, 6]
+    >>> index.line_at(4)
+    2
+
+    """
+
+    def __init__(self, size, starts, chars):
+        self.size = size
+        self.starts = starts
+        self.chars = chars
+
+    @classmethod
+    def build(cls, data):
+        starts = array(OFFSET_TYPECODE, [0])
+        chars = array(OFFSET_TYPECODE)
+        size = len(data)
+        newline = re.compile(b'\n')
+        for i in range(0, size, CHUNK_SIZE):
+            starts.extend(m.end() + i for m in
+                          newline.finditer(data[i:i + CHUNK_SIZE]))
+        plain = all(
+            not data[i:i + CHUNK_SIZE + 1].translate(None, ASCII_BYTES) and
+            b'\r\n' not in data[i:i + CHUNK_SIZE + 1]
+            for i in range(0, size, CHUNK_SIZE))
+        if not plain:
+            chars.append(0)
+            for (s, e) in zip(starts, starts[1:]):
+                line = data[s:e]
+                chars.append(chars[-1] +
+                             len(line.translate(None, CONTINUATION_BYTES)) -
+                             line.count(b'\r\n'))
+        return cls(size, starts, chars)
+
+    def dumps(self):
+        header = array(OFFSET_TYPECODE, [self.size, len(self.starts)])
+        return _tobytes(header + self.starts + self.chars)
+
+    @classmethod
+    def loads(cls, data):
+        offsets = array(OFFSET_TYPECODE)
+        _frombytes(offsets, bytes(data))
+        n = offsets[1]
+        return cls(offsets[0], offsets[2:2 + n], offsets[2 + n:])
+
+    def line_at(self, chars):
+        """
+        Return the 0-origin line number after `chars` characters.
+        """
+        return bisect_right(self.chars or self.starts, chars) - 1
+
+    def read_lines(self, file, point, pre_lines=0, post_lines=0):
+        """
+        Read lines containing `point` from `file` opened in binary mode.
+
+        The result is the same as :func:`get_lines_at_point_in_file`
+        for the file this index is built from.
+
+        """
+        line_no = self.line_at((point or 1) - 1)
+        first = max(line_no - pre_lines, 0)
+        last = line_no + post_lines + 1
+        start = self.starts[first]
+        end = self.starts[last] if last < len(self.starts) else self.size
+        file.seek(start)
+        lines = file.read(end - start).decode('utf-8', 'replace').split(u'\n')
+        trace.add_bytes(end - start)
+        if lines[-1] == u'' and (last < len(self.starts) or
+                                 self.starts[-1] == self.size):
+            lines.pop()
+        return [(first + i + 1, str_line(l.rstrip(u'\r')))
+                for (i, l) in enumerate(lines)]
+
+
+if hasattr(array, 'tobytes'):
+    _tobytes = array.tobytes
+    _frombytes = array.frombytes
+else:                           # Python 2
+    _tobytes = array.tostring
+    _frombytes = array.fromstring
+
+
+def get_lines_at_point_in_file(path, point, pre_lines=0, post_lines=0,
+                               max_size=None, line_index=None):
+    """
+    Get lines containing `point` in the file at `path`.
+
+    This is :func:`factlog.utils.strutils.get_lines_at_point` for a
+    file, except that only the region around `point` is decoded.
+    Empty list is returned for binary files and files larger than
+    `max_size` (default: :data:`MAX_SIZE`).
+
+    `line_index` is a function which takes `path` and returns a
+    :class:`LineIndex` or None, such as
+    :class:`factlog.filecache.LineIndexCache`.  When an index is
+    given, only the lines to return are read.
+
+    """
+    index = line_index and line_index(path)
+    if index is not None:
+        with open(path, 'rb') as file:
+            return index.read_lines(file, point, pre_lines, post_lines)
+    with mapped_file(path, max_size) as data:
+        if data is None:
+            return []
+        offset = char_to_byte_offset(data, (point or 1) - 1)
+        return get_lines_at_offset(data, offset, pre_lines, post_lines)
@@ -0,0 +1,135 @@
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Timestamps as integer microseconds since the Unix epoch in UTC.
+"""
+
+import re
+import time
+import datetime
+
+from .py3compat import string_types
+
+EPOCH = datetime.datetime(1970, 1, 1)
+MICROSECONDS_PER_DAY = 24 * 60 * 60 * 10 ** 6
+
+DATETIME_FORMATS = (
+    '%Y-%m-%d %H:%M:%S.%f',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d %H:%M',
+    '%Y-%m-%d',
+)
+
+_relative_re = re.compile(r'^(\d+(?:\.\d*)?)([smhdw])$')
+_units = dict(s=1, m=60, h=60 * 60, d=24 * 60 * 60, w=7 * 24 * 60 * 60)
+
+
+_last_now = [0]
+
+
+def now():
+    """
+    Return the current time in microseconds.
+
+    Values are strictly increasing in a process, so that activities
+    recorded in a row are ordered even within a microsecond.
+
+    >>> now() < now()
+    True
+
+    """
+    value = max(int(time.time() * 10 ** 6), _last_now[0] + 1)
+    _last_now[0] = value
+    return value
+
+
+def parse_datetime(string):
+    """
+    Parse UTC time such as ``'2013-01-23 12:34:56'``.
+
+    Seconds and time of the day may be omitted and ``T`` may be used
+    instead of the space.
+
+    >>> parse_datetime('2013-01-23T12:34')
+    datetime.datetime(2013, 1, 23, 12, 34)
+    >>> parse_datetime('2013-01-23 12:34:56.5')
+    datetime.datetime(2013, 1, 23, 12, 34, 56, 500000)
+    >>> parse_datetime('yesterday')
+    Traceback (most recent call last):
+      ...
+    ValueError: invalid time: 'yesterday'
+
+    """
+    normalized = string.strip().replace('T', ' ', 1)
+    for format in DATETIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(normalized, format)
+        except ValueError:
+            pass
+    raise ValueError('invalid time: {0!r}'.format(string))
+
+
+def to_microseconds(value):
+    """
+    Convert a datetime, a string or a number to microseconds.
+
+    >>> to_microseconds('1970-01-02 00:00:00')
+    86400000000
+    >>> to_microseconds(datetime.datetime(1970, 1, 1, 0, 0, 1, 5))
+    1000005
+    >>> to_microseconds(42)
+    42
+
+    """
+    if isinstance(value, string_types):
+        value = parse_datetime(value)
+    if isinstance(value, datetime.datetime):
+        delta = value - EPOCH
+        return ((delta.days * 24 * 60 * 60 + delta.seconds) * 10 ** 6 +
+                delta.microseconds)
+    return int(value)
+
+
+def from_microseconds(microseconds):
+    """
+    Convert microseconds to a naive :class:`datetime.datetime` in UTC.
+
+    >>> from_microseconds(86400000001)
+    datetime.datetime(1970, 1, 2, 0, 0, 0, 1)
+
+    """
+    return EPOCH + datetime.timedelta(microseconds=microseconds)
+
+
+def parse_time(string, now=now):
+    """
+    Parse time given in the command line into microseconds.
+
+    `string` is either UTC time accepted by :func:`parse_datetime` or
+    time before now such as ``30m`` (seconds, minutes, hours, days
+    and weeks are ``s``, ``m``, ``h``, ``d`` and ``w``).
+
+    >>> parse_time('2d', now=lambda: 3 * MICROSECONDS_PER_DAY)
+    86400000000
+    >>> parse_time('1970-01-01 00:01')
+    60000000
+
+    """
+    match = _relative_re.match(string.strip())
+    if match:
+        (num, unit) = match.groups()
+        return now() - int(float(num) * _units[unit] * 10 ** 6)
+    return to_microseconds(parse_datetime(string))
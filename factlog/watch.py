@@ -0,0 +1,559 @@
+"""
+Record writes to files under directories using Linux inotify.
+
+`factlog watch DIR...` records a ``write`` activity for each file
+closed after writing (or moved into) the directories, so that files
+changed by programs without factlog integration show up in `factlog
+list`.  Repeated writes to a file within --debounce are recorded
+once, and activities of many files are committed in one transaction.
+
+Memory usage does not grow with the number of files: one entry is
+kept for each watched directory (bounded by the inotify watch limit
+of the kernel) and at most --max-pending paths wait for debouncing.
+"""
+
+# Copyright (c) 2013- Takafumi Arakaki
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import re
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import sqlite3
+import fnmatch
+from collections import OrderedDict
+
+from .config import ConfigStore
+from . import trace
+from .utils.timeutils import now
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+              IN_ONLYDIR | IN_DONT_FOLLOW)
+
+EVENT_HEADER = struct.Struct('iIII')
+
+DEFAULT_EXCLUDE_GLOB = [
+    '*/.git', '*/.git/*', '*/.hg', '*/.hg/*', '*/.svn', '*/.svn/*',
+    '*/__pycache__', '*/__pycache__/*', '*/node_modules',
+    '*/node_modules/*', '*.pyc', '*.o', '*~', '*/.#*', '*/#*#', '*.swp',
+]
+"""
+Globs of paths not watched nor recorded unless --no-default-exclude.
+"""
+
+_fsdecode = getattr(os, 'fsdecode', lambda name: name)
+
+
+class Inotify(object):
+
+    """
+    Minimal wrapper of the inotify API of Linux via ctypes.
+
+    :raises OSError: when inotify is not available.
+
+    """
+
+    # Large enough for hundreds of events; events are read repeatedly
+    # rather than buffered.
+    bufsize = 64 * 1024
+
+    def __init__(self):
+        name = ctypes.util.find_library('c') or 'libc.so.6'
+        try:
+            self.libc = libc = ctypes.CDLL(name, use_errno=True)
+            libc.inotify_init1
+        except (OSError, AttributeError):
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            self._raise()
+
+    def _raise(self, path=None):
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err), path)
+
+    def fileno(self):
+        return self.fd
+
+    def add_watch(self, path, mask):
+        """Start watching `path` and return the watch descriptor."""
+        encoded = path if isinstance(path, bytes) else os.fsencode(path)
+        wd = self.libc.inotify_add_watch(self.fd, encoded, mask)
+        if wd < 0:
+            self._raise(path)
+        return wd
+
+    def rm_watch(self, wd):
+        # It fails if the watch is already removed by the kernel.
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self):
+        """
+        Return a list of ``(wd, mask, cookie, name)`` of available
+        events.  `name` is bytes.
+        """
+        try:
+            data = os.read(self.fd, self.bufsize)
+        except OSError as err:
+            if err.errno in (errno.EAGAIN, errno.EINTR):
+                return []
+            raise
+        events = []
+        pos = 0
+        while pos < len(data):
+            (wd, mask, cookie, size) = EVENT_HEADER.unpack_from(data, pos)
+            pos += EVENT_HEADER.size
+            name = data[pos:pos + size].rstrip(b'\0')
+            pos += size
+            events.append((wd, mask, cookie, name))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class Debouncer(object):
+
+    """
+    Paths waiting until they are not changed for `delay` seconds.
+
+    A path added again is moved to the end with a new deadline, so
+    that paths are ordered by deadline.  When more than `max_pending`
+    paths are waiting, the oldest ones are released early.
+
+    >>> debouncer = Debouncer(delay=1.0, max_pending=2)
+    >>> for (path, t) in [('a', 0), ('b', 0.5), ('a', 0.6), ('c', 0.7)]:
+    ...     debouncer.add(path, t, recorded=t)
+    >>> debouncer.pop_due(1.0)
+    [('b', 0.5)]
+    >>> debouncer.next_deadline()
+    1.6
+    >>> debouncer.pop_due(2.0)
+    [('a', 0.6), ('c', 0.7)]
+
+    """
+
+    def __init__(self, delay, max_pending):
+        self.delay = delay
+        self.max_pending = max_pending
+        self.pending = OrderedDict()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, path, t, recorded):
+        self.pending.pop(path, None)
+        self.pending[path] = (t + self.delay, recorded)
+
+    def next_deadline(self):
+        for (deadline, _) in self.pending.values():
+            return deadline
+
+    def requeue(self, items):
+        """
+        Put ``(path, recorded)`` of `items` back as due now.
+
+        Paths added again since they are popped keep the newer entry.
+
+        """
+        pending = OrderedDict(
+            (path, (float('-inf'), recorded)) for (path, recorded) in items
+            if path not in self.pending)
+        pending.update(self.pending)
+        self.pending = pending
+
+    def pop_due(self, t):
+        """
+        Remove and return ``(path, recorded)`` of paths whose deadline
+        is passed, including the ones exceeding `max_pending`.
+        """
+        due = []
+        while self.pending:
+            (path, (deadline, recorded)) = next(iter(self.pending.items()))
+            if deadline > t and len(self.pending) <= self.max_pending:
+                break
+            del self.pending[path]
+            due.append((path, recorded))
+        return due
+
+
+def compile_globs(globs):
+    """
+    Return a function to test if a path matches one of `globs`.
+
+    >>> match = compile_globs(['*/.git/*', '*.pyc'])
+    >>> bool(match('/src/.git/HEAD')), bool(match('/src/a.py'))
+    (True, False)
+    >>> compile_globs([])('/src/a.py')
+    False
+
+    """
+    if not globs:
+        return lambda path: False
+    regex = re.compile('|'.join('(?:{0})'.format(fnmatch.translate(g))
+                                for g in globs))
+    return lambda path: bool(regex.match(path))
+
+
+def iter_directory(path):
+    """
+    Yield ``(path, is_dir)`` of directories and regular files in
+    `path`.  Symbolic links are not followed nor yielded.
+    """
+    if hasattr(os, 'scandir'):
+        for entry in os.scandir(path):
+            if entry.is_dir(follow_symlinks=False):
+                yield (entry.path, True)
+            elif entry.is_file(follow_symlinks=False):
+                yield (entry.path, False)
+        return
+    for name in os.listdir(path):
+        child = os.path.join(path, name)
+        if os.path.islink(child):
+            continue
+        if os.path.isdir(child):
+            yield (child, True)
+        elif os.path.isfile(child):
+            yield (child, False)
+
+
+class Watcher(object):
+
+    """
+    Record writes to files under directories.
+
+    :type               db: :class:`factlog.database.DataBase`
+    :arg                db: database to record
+    :type     exclude_glob: list of str
+    :arg      exclude_glob: paths (files and directories) not recorded
+    :type     include_glob: list of str
+    :arg      include_glob: if given, record only files matching them
+    :type         debounce: float
+    :arg          debounce: seconds to wait for more writes to a file
+    :type     max_pending: int
+    :arg      max_pending: maximum number of paths waiting for debounce
+    :type commit_interval: float
+    :arg  commit_interval: minimum seconds between transactions
+    :type          program: str or None
+    :arg           program: program name recorded with activities
+
+    """
+
+    max_moved_cookies = 1000
+    """
+    Number of directory moves remembered to match their destinations.
+    """
+
+    def __init__(self, db, exclude_glob=[], include_glob=[], debounce=1.0,
+                 max_pending=10000, commit_interval=1.0, program='watch'):
+        self.db = db
+        self.commit_interval = commit_interval
+        self.last_commit = 0
+        self.excluded = compile_globs(exclude_glob)
+        self.included = compile_globs(include_glob) if include_glob else None
+        self.debouncer = Debouncer(debounce, max_pending)
+        self.program = program
+        self.inotify = Inotify()
+        self.directories = {}
+        # Cookies of directories moved away, to tell a rename within
+        # the watched directories from a directory moved in.
+        self.moved_cookies = OrderedDict()
+        self.watch_limit_reached = False
+
+    def warn(self, message):
+        sys.stderr.write('factlog watch: {0}\n'.format(message))
+
+    def add_tree(self, top, scan=False):
+        """
+        Watch `top` and directories under it.  Return the number of
+        watched directories.
+
+        If `scan` is true, files already in the directories are
+        recorded, since they can be written before the watches are
+        added (e.g., ``mkdir -p a/b && touch a/b/c``).
+
+        """
+        num = 0
+        stack = [os.path.abspath(top)]
+        while stack:
+            path = stack.pop()
+            if self.excluded(path):
+                continue
+            try:
+                wd = self.inotify.add_watch(path, WATCH_MASK)
+                stack.extend(self._list_directory(path, scan))
+            except OSError as err:
+                if err.errno == errno.ENOSPC:
+                    if not self.watch_limit_reached:
+                        self.warn('inotify watch limit reached; increase '
+                                  'fs.inotify.max_user_watches to watch '
+                                  'more directories')
+                    self.watch_limit_reached = True
+                    return num
+                if err.errno not in (errno.ENOENT, errno.ENOTDIR,
+                                     errno.EACCES):
+                    raise
+                continue
+            # Same wd is returned for a moved directory.
+            self.directories[wd] = path
+            num += 1
+        return num
+
+    def _list_directory(self, path, scan):
+        """
+        Return subdirectories of `path`, adding its files if `scan`.
+
+        Files are not kept in memory, so that listing a directory with
+        many files is cheap.
+
+        """
+        subdirectories = []
+        t = time.time()
+        for (child, is_dir) in iter_directory(path):
+            if is_dir:
+                subdirectories.append(child)
+            elif scan:
+                self.add_file(child, t)
+        return subdirectories
+
+    def add_file(self, path, t):
+        """
+        Add `path` written at `t` to the files waiting for debounce.
+        """
+        if self.excluded(path) or (
+                self.included and not self.included(path)):
+            return
+        self.debouncer.add(path, t, now())
+        if len(self.debouncer) > self.debouncer.max_pending:
+            self.flush()
+
+    def remove_tree(self, top):
+        """
+        Stop watching `top` and directories under it.
+
+        It is called when a directory is moved, as the watches follow
+        the directory to a path which may not be under the watched
+        directories.
+
+        """
+        prefix = os.path.join(top, '')
+        for (wd, path) in list(self.directories.items()):
+            if path == top or path.startswith(prefix):
+                self.inotify.rm_watch(wd)
+                del self.directories[wd]
+
+    def handle_events(self, timeout=None):
+        """
+        Wait for events at most `timeout` seconds and handle them.
+        """
+        (readable, _, _) = select.select([self.inotify], [], [], timeout)
+        if not readable:
+            return
+        t = time.time()
+        for (wd, mask, cookie, name) in self.inotify.read():
+            if mask & IN_Q_OVERFLOW:
+                self.warn('event queue overflowed; some writes are lost')
+                continue
+            if mask & IN_IGNORED:
+                self.directories.pop(wd, None)
+                continue
+            directory = self.directories.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, _fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & IN_MOVED_FROM:
+                    self.remove_tree(path)
+                    self.moved_cookies[cookie] = None
+                    while len(self.moved_cookies) > self.max_moved_cookies:
+                        self.moved_cookies.popitem(last=False)
+                elif mask & IN_MOVED_TO:
+                    # Files in a renamed directory are not written.
+                    renamed = cookie in self.moved_cookies
+                    self.moved_cookies.pop(cookie, None)
+                    self.add_tree(path, scan=not renamed)
+                elif mask & IN_CREATE:
+                    self.add_tree(path, scan=True)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                self.add_file(path, t)
+
+    def next_timeout(self):
+        """
+        Return seconds until :meth:`flush` has something to record.
+        """
+        deadline = self.debouncer.next_deadline()
+        if deadline is None:
+            return None
+        deadline = max(deadline, self.last_commit + self.commit_interval)
+        return max(0, deadline - time.time())
+
+    def flush(self, force=False):
+        """
+        Record files not written during debounce in one transaction.
+
+        Files are recorded at most once per :attr:`commit_interval`
+        unless more than `max_pending` files are waiting.  If `force`
+        is true, all waiting files are recorded.  Return the number
+        of recorded files.
+
+        If the database cannot be written (e.g., it is locked for
+        too long), the files are kept and recorded by the next flush.
+
+        """
+        t = time.time()
+        if not force and t < self.last_commit + self.commit_interval and \
+           len(self.debouncer) <= self.debouncer.max_pending:
+            return 0
+        due = self.debouncer.pop_due(float('inf') if force else t)
+        if not due:
+            return 0
+        self.last_commit = t
+        with trace.span('watch.record') as span:
+            span.rows_in = len(due)
+            try:
+                return self.db.record_file_logs(
+                    dict(file_path=path, access_type='write',
+                         program=self.program, recorded=recorded)
+                    for (path, recorded) in due)
+            except (sqlite3.Error, EnvironmentError) as err:
+                sys.stderr.write(
+                    'factlog: failed to record {0} files (retrying): {1}\n'
+                    .format(len(due), err))
+                self.debouncer.requeue(due)
+                return 0
+
+    def serve_forever(self):
+        """
+        Handle events and record files until interrupted.
+        """
+        try:
+            while True:
+                self.handle_events(self.next_timeout())
+                self.flush()
+        finally:
+            self.flush(force=True)
+
+    def close(self):
+        self.inotify.close()
+        self.directories.clear()
+
+
+def watch_add_arguments(parser):
+    parser.add_argument(
+        'directories', nargs='+', metavar='DIR',
+        help="Directories to watch recursively.")
+    parser.add_argument(
+        '--exclude-glob', '-G', metavar='GLOB', default=[], action='append',
+        help="""
+        Do not watch nor record paths that match to unix-style GLOB
+        pattern.  Matching directories are not watched at all.
+        """)
+    parser.add_argument(
+        '--include-glob', '-g', metavar='GLOB', default=[], action='append',
+        help="""
+        Record only files that match to unix-style GLOB pattern.
+        """)
+    parser.add_argument(
+        '--no-default-exclude', dest='default_exclude',
+        action='store_false',
+        help="""
+        Do not exclude VCS directories, caches and backup files
+        ({0}).
+        """.format(', '.join(DEFAULT_EXCLUDE_GLOB).replace('%', '%%')))
+    parser.add_argument(
+        '--debounce', type=float, default=1000.0, metavar='MSEC',
+        help="""
+        Record a file after it is not written for MSEC
+        milliseconds, so that a burst of writes is recorded once.
+        """)
+    parser.add_argument(
+        '--max-pending', type=int, default=10000, metavar='NUM',
+        help="""
+        Maximum number of files waiting for --debounce.  Older
+        files are recorded early when more files are written.
+        """)
+    parser.add_argument(
+        '--commit-interval', type=float, default=1000.0, metavar='MSEC',
+        help="""
+        Minimum time in milliseconds between transactions.  Files
+        written in the meantime are recorded in one transaction.
+        """)
+    parser.add_argument(
+        '--program', default='watch',
+        help="Program name recorded with the activities.")
+    trace.add_arguments(parser)
+
+
+def watch_run(directories, exclude_glob, include_glob, default_exclude,
+              debounce, max_pending, commit_interval, program):
+    """
+    Record writes to files under DIR using Linux inotify.
+
+    Files closed after writing or moved into DIR are recorded as
+    `write` activities.  Directories created later are watched too.
+    Writes to the same file within --debounce are recorded once and
+    files are recorded in one transaction.
+    """
+    import signal
+    from .database import DataBase
+    config = ConfigStore()
+    exclude_glob = list(exclude_glob) + [
+        config.data_path, os.path.join(config.data_path, '*')]
+    if default_exclude:
+        exclude_glob += DEFAULT_EXCLUDE_GLOB
+    if max_pending < 1:
+        sys.exit('factlog: --max-pending must be positive')
+    try:
+        watcher = Watcher(
+            DataBase(config.db_path), exclude_glob=exclude_glob,
+            include_glob=include_glob, debounce=debounce / 1000.0,
+            max_pending=max_pending,
+            commit_interval=commit_interval / 1000.0, program=program)
+    except OSError as err:
+        sys.exit('factlog: {0}'.format(err))
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        for directory in directories:
+            watcher.add_tree(directory)
+        watcher.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+commands = [
+    ('watch', watch_add_arguments, watch_run),
+]
@@ -5,7 +5,8 @@ import factlog
 setup(
     name='factlog',
     version=factlog.__version__,
-    packages=['factlog', 'factlog.utils', 'factlog.tests'],
+    packages=['factlog', 'factlog.utils', 'factlog.tests',
+              'factlog.benchmarks'],
     author=factlog.__author__,
     author_email='aka.tkf@gmail.com',
     url='https://github.com/tkf/factlog',